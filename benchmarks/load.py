@@ -0,0 +1,273 @@
+"""
+Load and latency benchmark of every route of the API, run against the stand-in Fuseki in mock_fuseki.py.
+
+Starts the mock and the API (with uvicorn) as subprocesses, then sends `--requests` requests to each route with
+`--concurrency` requests in flight and reports, as JSON, the p50/p95/p99 latency, requests per second and errors of
+each route, and the peak RSS of the API process. Routes in the API's OpenAPI schema that the benchmark does not cover
+are listed, so that new routes are noticed.
+
+    python benchmarks/load.py --rows 1000 --delay 5 --concurrency 16 --requests 200 --output results.json
+
+Extra configuration is passed to the API with --env, e.g. `--env RESULT_CACHE_TTL=60`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import toml
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+ROOT = Path(__file__).resolve().parent.parent
+BASE = "http://example.com/"
+
+ASSESSMENT = {"assessment": f"{BASE}assessment/0"}
+POLYGON = {"polygon_uri": f"{BASE}polygon/0"}
+CLASS = "http://ies.data.gov.uk/ontology/ies4#Location"
+POLYGONS = [f"{BASE}polygon/{i}" for i in range(20)]
+
+# (name, method, path, query parameters, JSON body)
+ROUTES = [
+    ("assessments", "GET", "/assessments", {}, None),
+    ("assessment assets", "GET", "/assessments/assets", ASSESSMENT, None),
+    ("assessment assets page", "GET", "/assessments/assets", {**ASSESSMENT, "limit": 100}, None),
+    ("assessment assets bbox", "GET", "/assessments/assets", {**ASSESSMENT, "bbox": "-1,50,-0.5,50.5"}, None),
+    ("assessment assets clusters", "GET", "/assessments/assets", {**ASSESSMENT, "bbox": "-1,50,0,51", "zoom": 8}, None),
+    ("assessment asset types", "GET", "/assessments/asset-types", ASSESSMENT, None),
+    ("assessment dependencies", "GET", "/assessments/dependencies", ASSESSMENT, None),
+    ("assessment dependencies page", "GET", "/assessments/dependencies", {**ASSESSMENT, "limit": 100}, None),
+    ("assessment dependencies export", "GET", "/assessments/dependencies/export", ASSESSMENT, None),
+    ("assessment metrics", "GET", "/assessments/metrics", ASSESSMENT, None),
+    ("assessment components", "GET", "/assessments/metrics/components", ASSESSMENT, None),
+    ("asset", "GET", "/asset", {"assetUri": f"{BASE}asset/0"}, None),
+    ("assets batch", "POST", "/assets:batch", {}, {"uris": [f"{BASE}asset/{i}" for i in range(50)]}),
+    ("asset dependents", "GET", "/asset/dependents", {"assetUri": f"{BASE}asset/0"}, None),
+    ("asset providers", "GET", "/asset/providers", {"assetUri": f"{BASE}asset/0"}, None),
+    ("asset impact", "GET", "/asset/impact", {"assetUri": f"{BASE}asset/0", "depth": 5}, None),
+    ("asset parts", "GET", "/asset/parts", {"assetUri": f"{BASE}asset/0"}, None),
+    ("asset residents", "GET", "/asset/residents", {"assetUri": f"{BASE}asset/0"}, None),
+    ("asset participations", "GET", "/asset/participations", {"assetUri": f"{BASE}asset/0"}, None),
+    ("event participants", "GET", "/event/participants", {"eventUri": f"{BASE}event/0"}, None),
+    ("person residences", "GET", "/person/residences", {"personUri": f"{BASE}person/0"}, None),
+    ("flood watch areas", "GET", "/flood-watch-areas", {}, None),
+    ("flood area polygon", "GET", "/flood-watch-areas/polygon", POLYGON, None),
+    ("flood area polygon simplified", "GET", "/flood-watch-areas/polygon", {**POLYGON, "tolerance": 0.01}, None),
+    ("flood area buildings", "GET", "/flood-watch-areas/polygon/buildings", POLYGON, None),
+    ("flood area assets", "GET", "/flood-watch-areas/polygon/assets", {**POLYGON, **ASSESSMENT}, None),
+    ("flood area polygons", "POST", "/flood-watch-areas/polygons", {}, {"uris": POLYGONS}),
+    ("states", "GET", "/states", {"parent_uri": f"{BASE}asset/0"}, None),
+    ("states batch", "POST", "/states:batch", {}, {"parent_uris": [f"{BASE}asset/{i}" for i in range(50)]}),
+    ("buildings", "GET", "/buildings", {}, None),
+    ("buildings page", "GET", "/buildings", {"limit": 100}, None),
+    ("buildings bbox", "GET", "/buildings", {"bbox": "-1,50,-0.5,50.5"}, None),
+    ("building", "GET", "/buildings/uprn_id-0", {}, None),
+    ("building details", "POST", "/buildings/details", {}, {"uprns": [f"uprn_id-{i}" for i in range(50)]}),
+    ("ontology class", "GET", "/ontology/class", {"classUri": CLASS}, None),
+    ("ontology superclasses", "GET", "/ontology/superclasses", {"classUris": CLASS}, None),
+    ("ontology ancestors", "GET", "/ontology/ancestors", {"classUri": CLASS}, None),
+    ("cache stats", "GET", "/admin/cache", {}, None),
+    ("metrics", "GET", "/metrics", {}, None),
+    ("profile", "GET", "/admin/profile", {}, None),
+    ("availability", "GET", "/availability", {}, None),
+    ("readiness", "GET", "/readiness", {}, None),
+]
+
+# Routes that are left out on purpose: clearing the caches part way through would skew the other routes
+SKIPPED = {("DELETE", "/admin/cache"), ("DELETE", "/admin/profile")}
+
+
+def rss_mb(pid: int, field: str) -> float | None:
+    """
+    A memory figure of a process from /proc (VmHWM is the peak RSS, VmRSS the current), where available
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} did not start within {timeout} seconds")
+        await asyncio.sleep(0.2)
+
+
+async def drive(client: httpx.AsyncClient, route: tuple, requests: int, concurrency: int) -> dict:
+    name, method, path, params, body = route
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "name": name,
+        "method": method,
+        "path": path,
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if not 200 <= status < 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "rps": round(requests / elapsed, 1),
+    }
+
+
+def uncovered(openapi: dict) -> list[str]:
+    covered = {(method, path) for _, method, path, _, _ in ROUTES} | SKIPPED
+    return sorted(
+        f"{method.upper()} {path}"
+        for path, operations in openapi.get("paths", {}).items()
+        for method in operations
+        if (method.upper(), path) not in covered and not ("{" in path and _templated(method.upper(), path, covered))
+    )
+
+
+def _templated(method: str, path: str, covered: set) -> bool:
+    # A path with parameters, e.g. /buildings/{uprn}, is covered by any concrete path of the same shape
+    parts = path.split("/")
+    return any(
+        covered_method == method and len(covered_parts := covered_path.split("/")) == len(parts)
+        and all(part == other or part.startswith("{") for part, other in zip(parts, covered_parts, strict=True))
+        for covered_method, covered_path in covered
+    )
+
+
+async def benchmark(args, api_url: str, app_pid: int) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_up(client, "/openapi.json")
+        openapi = (await client.get("/openapi.json")).json()
+
+        routes = [route for route in ROUTES if not args.routes or any(text in route[0] for text in args.routes)]
+        results = []
+        for route in routes:
+            # One request first, so that lazily built indexes are not counted against the route
+            await drive(client, route, 1, 1)
+            result = await drive(client, route, args.requests, args.concurrency)
+            result["rss_mb"] = rss_mb(app_pid, "VmRSS")
+            results.append(result)
+            print(
+                f"{result['name']:<32} p50 {result['p50_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+                f"{result['rps']:>8.1f} req/s  {result['errors']} errors",
+                file=sys.stderr,
+            )
+    return {"routes": results, "uncovered": uncovered(openapi)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="rows the mock returns for each query")
+    parser.add_argument("--delay", type=float, default=0, help="milliseconds the mock waits before answering")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--requests", type=int, default=200, help="requests sent to each route")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds before a request counts as failed")
+    parser.add_argument("--routes", nargs="*", help="only benchmark routes whose names contain one of these")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE configuration for the API")
+    parser.add_argument("--api-port", type=int, default=8001)
+    parser.add_argument("--mock-port", type=int, default=3031)
+    parser.add_argument("--output", help="file to write the JSON results to, instead of stdout")
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "JENA_URL": "127.0.0.1",
+        "JENA_PORT": str(args.mock_port),
+        "JENA_PROTOCOL": "http",
+        "API_LOG_LEVEL": "WARNING",
+        "API_LOG_STDOUT": "0",
+        "AUTH_LOG_STDOUT": "0",
+        "API_ADMIN_ENDPOINTS": "true",
+    }
+    env.update(setting.split("=", 1) for setting in args.env)
+
+    mock = subprocess.Popen(
+        [sys.executable, str(ROOT / "benchmarks" / "mock_fuseki.py"), "--port", str(args.mock_port),
+         "--rows", str(args.rows), "--delay", str(args.delay)],
+        cwd=ROOT,
+    )
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "paralog.app:app", "--port", str(args.api_port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        results = asyncio.run(benchmark(args, f"http://127.0.0.1:{args.api_port}", api.pid))
+        peak_rss = rss_mb(api.pid, "VmHWM")
+    finally:
+        api.terminate()
+        mock.terminate()
+        api.wait()
+        mock.wait()
+    if peak_rss is None:
+        # Without /proc, fall back to the peak of the (now finished) subprocesses, in kilobytes on Linux but bytes
+        # on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        peak_rss = max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    report = {
+        "version": toml.load(ROOT / "pyproject.toml")["project"]["version"],
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "rows": args.rows,
+            "delay_ms": args.delay,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "env": dict(setting.split("=", 1) for setting in args.env),
+        },
+        "peak_rss_mb": round(peak_rss, 1),
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+A stand-in for Fuseki that answers any SELECT query with generated SPARQL results JSON, for benchmarking the API
+without a triplestore.
+
+Every query is answered with `--rows` rows binding each of its projected variables, after `--delay` milliseconds.
+Values depend on the variable's name (coordinates, counts, GeoJSON polygons and so on), URIs are shared between
+queries so that e.g. assets found by one endpoint can be looked up by another, and values given in a VALUES clause
+are used for their variable. Results are generated once per distinct query shape and then served from memory.
+
+    python benchmarks/mock_fuseki.py --port 3031 --rows 1000 --delay 5
+"""
+import argparse
+import asyncio
+import functools
+import json
+import math
+import re
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+SPARQL_RESULTS_JSON = "application/sparql-results+json"
+BASE = "http://example.com/"
+
+_SELECT = re.compile(r"SELECT\s+(?:DISTINCT\s+)?(.*?)\s*WHERE", re.S | re.I)
+_ALIAS = re.compile(r"\([^()]*(?:\([^()]*\)[^()]*)*\bAS\s+\?(\w+)\s*\)", re.S | re.I)
+_VARIABLE = re.compile(r"\?(\w+)")
+_VALUES = re.compile(r"VALUES\s+\?(\w+)\s*\{([^}]*)\}", re.S | re.I)
+_TERM = re.compile(r'<([^>]*)>|"((?:[^"\\]|\\.)*)"')
+_LIMIT = re.compile(r"LIMIT\s+(\d+)\s*$", re.I)
+
+# Points are spread over a grid of this many degrees, starting at (LON, LAT)
+LON, LAT, EXTENT = -1.0, 50.0, 1.0
+
+NUMBERS = {"lat", "lon", "lat_literal", "lon_literal", "sap_points", "criticalityRating", "dependentCriticalitySum"}
+COUNTS = {"numberOfAssessedItems", "assetCount", "dependentCount", "partCount"}
+
+
+def projected_variables(query: str) -> list[str]:
+    match = _SELECT.search(query)
+    if match is None:
+        return []
+    # (expression AS ?alias) projects the alias, not the variables of the expression
+    projection = _ALIAS.sub(lambda alias: f"?{alias.group(1)}", match.group(1))
+    return list(dict.fromkeys(_VARIABLE.findall(projection)))
+
+
+def values_clauses(query: str) -> tuple[tuple[str, tuple[str, ...]], ...]:
+    return tuple(
+        (var, tuple(iri or literal for iri, literal in _TERM.findall(terms)))
+        for var, terms in _VALUES.findall(query)
+    )
+
+
+def polygon(i: int) -> str:
+    # A circle over the middle of the grid, so that point-in-polygon joins find some of the points
+    centre_lon, centre_lat, radius = LON + EXTENT / 2, LAT + EXTENT / 2, EXTENT / 4 + (i % 5) * 0.01
+    ring = [
+        [centre_lon + radius * math.cos(t / 64 * 2 * math.pi), centre_lat + radius * math.sin(t / 64 * 2 * math.pi)]
+        for t in range(64)
+    ]
+    ring.append(ring[0])
+    return json.dumps({"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}})
+
+
+def value(var: str, i: int, rows: int) -> dict:
+    side = max(1, math.isqrt(rows))
+    if var in ("lat", "lat_literal"):
+        return {"type": "literal", "value": str(LAT + EXTENT * (i // side) / side)}
+    if var in ("lon", "lon_literal"):
+        return {"type": "literal", "value": str(LON + EXTENT * (i % side) / side)}
+    if var in NUMBERS:
+        return {"type": "literal", "value": str((i % 4) + 0.5)}
+    if var in COUNTS:
+        return {"type": "literal", "value": str(i % 10)}
+    if var == "geoJsonValue":
+        return {"type": "literal", "value": polygon(i)}
+    if var == "building_types":
+        return {"type": "literal", "value": f"{BASE}ontology#Building;{BASE}ontology#House"}
+    if var in ("uprn_id", "postcode_literal", "line_of_address_literal", "name", "osmID"):
+        return {"type": "literal", "value": f"{var}-{i}"}
+    # A chain of dependencies from asset 0, so that traversals have somewhere to go
+    if var in ("uri", "asset", "providerNode"):
+        return {"type": "uri", "value": f"{BASE}asset/{i}"}
+    if var == "dependentNode":
+        return {"type": "uri", "value": f"{BASE}asset/{i + 1}"}
+    return {"type": "uri", "value": f"{BASE}{var}/{i}"}
+
+
+@functools.lru_cache(maxsize=1024)
+def results(variables: tuple[str, ...], values: tuple[tuple[str, tuple[str, ...]], ...], rows: int) -> bytes:
+    given = dict(values)
+    bindings = []
+    for i in range(rows):
+        binding = {var: value(var, i, rows) for var in variables}
+        for var, terms in given.items():
+            if var in binding and terms:
+                term = terms[i % len(terms)]
+                binding[var] = {"type": binding[var]["type"], "value": term}
+        bindings.append(binding)
+    return json.dumps({"head": {"vars": list(variables)}, "results": {"bindings": bindings}}).encode()
+
+
+def create_app(rows: int, delay: float) -> Starlette:
+    async def query(request: Request) -> Response:
+        if request.method == "POST":
+            text = str((await request.form())["query"])
+        else:
+            text = request.query_params["query"]
+        if delay:
+            await asyncio.sleep(delay)
+        limit = _LIMIT.search(text.strip())
+        size = min(rows, int(limit.group(1))) if limit else rows
+        body = results(tuple(projected_variables(text)), values_clauses(text), size)
+        return Response(body, media_type=SPARQL_RESULTS_JSON)
+
+    return Starlette(routes=[Route("/{dataset}/query", query, methods=["GET", "POST"])])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3031)
+    parser.add_argument("--rows", type=int, default=1000, help="rows returned for each query")
+    parser.add_argument("--delay", type=float, default=0, help="milliseconds to wait before answering each query")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.rows, args.delay / 1000), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares serialising query results through their response models, as FastAPI does, with the fast path that converts
+and serialises them in one step (paralog.serialise).
+
+    python benchmarks/serialisation.py [rows]
+"""
+import json
+import sys
+import time
+
+from pydantic import TypeAdapter
+
+from paralog import models, serialise, utils
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+
+def asset_rows(count: int) -> list[dict]:
+    return [
+        utils.flatten_binding({
+            "uri": {"type": "uri", "value": f"http://example.com/asset/{i}"},
+            "type": {"type": "uri", "value": "http://ies.data.gov.uk/ontology/ies4#Facility"},
+            "lat": {"type": "literal", "value": str(50 + i * 1e-6)},
+            "lon": {"type": "literal", "value": str(-1 - i * 1e-6)},
+            "dependentCount": {"type": "literal", "value": str(i % 7)},
+            "dependentCriticalitySum": {"type": "literal", "value": str((i % 7) * 1.5)},
+            "partCount": {"type": "literal", "value": "0"},
+        })
+        for i in range(count)
+    ]
+
+
+def dependency_rows(count: int) -> list[dict]:
+    return [
+        utils.flatten_binding({
+            "dependencyUri": {"type": "uri", "value": f"http://example.com/dependency/{i}"},
+            "providerNode": {"type": "uri", "value": f"http://example.com/asset/{i}"},
+            "providerNodeType": {"type": "uri", "value": "http://ies.data.gov.uk/ontology/ies4#Facility"},
+            "providerName": {"type": "literal", "value": f"Provider {i}"},
+            "dependentNode": {"type": "uri", "value": f"http://example.com/asset/{i + 1}"},
+            "dependentNodeType": {"type": "uri", "value": "http://ies.data.gov.uk/ontology/ies4#Facility"},
+            "criticalityRating": {"type": "literal", "value": str(i % 4)},
+        })
+        for i in range(count)
+    ]
+
+
+def through_model(rows: list[dict], annotation) -> bytes:
+    # What FastAPI does with a response_model: validate, dump to JSON compatible data, then encode
+    adapter = TypeAdapter(annotation)
+    return json.dumps(adapter.dump_python(adapter.validate_python(rows), mode="json")).encode()
+
+
+def fast_path(rows: list[dict], annotation) -> bytes:
+    return serialise.serialise(rows, annotation)
+
+
+def best_of(repeats: int, function, *args) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    encoder = "orjson" if serialise.orjson is not None else "json"
+    print(f"{count} rows, fast path encoder: {encoder}")
+    print(f"{'model':<16}{'response_model (s)':>20}{'fast path (s)':>16}{'speed up':>10}")
+    for name, rows, annotation in (
+        ("AssetSummary", asset_rows(count), list[models.AssetSummary]),
+        ("Dependency", dependency_rows(count), list[models.Dependency]),
+    ):
+        # The two must produce the same document
+        assert json.loads(through_model(rows, annotation)) == json.loads(fast_path(rows, annotation))
+        slow = best_of(3, through_model, rows, annotation)
+        fast = best_of(3, fast_path, rows, annotation)
+        print(f"{name:<16}{slow:>20.3f}{fast:>16.3f}{slow / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
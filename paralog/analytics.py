@@ -0,0 +1,149 @@
+import numpy as np
+
+from paralog.graph import DEPENDENTS, Adjacency, DependencyIndex
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+# Betweenness is estimated from shortest paths out of this many sampled assets, and is exact for smaller networks
+DEFAULT_BETWEENNESS_SAMPLES = 64
+
+
+class NetworkMetrics:
+    """
+    Vectorised metrics of an assessment's dependency network, computed once from its CSR adjacency.
+
+    For each asset: how many dependencies it provides (and their summed criticality), how many it depends on (and
+    theirs), its betweenness centrality and the weakly connected component it belongs to.
+    """
+    def __init__(self, index: DependencyIndex, samples: int = DEFAULT_BETWEENNESS_SAMPLES, seed: int = 0):
+        size = len(index)
+        self.uris = index.uris
+        self.edges = len(index.providers)
+        self.dependent_count = np.bincount(index.providers, minlength=size)
+        self.dependent_criticality = np.bincount(index.providers, weights=index.ratings, minlength=size)
+        self.provider_count = np.bincount(index.dependents, minlength=size)
+        self.provider_criticality = np.bincount(index.dependents, weights=index.ratings, minlength=size)
+        self.components = components(index.providers, index.dependents, size)
+        self.samples = min(samples, size)
+        self.betweenness = betweenness(index.adjacency[DEPENDENTS], size, self.samples, seed)
+
+    def __len__(self):
+        return len(self.uris)
+
+    def assets(self) -> list[dict]:
+        return [
+            {
+                "uri": uri,
+                "dependentCount": int(dependent_count),
+                "dependentCriticalitySum": float(dependent_criticality),
+                "providerCount": int(provider_count),
+                "providerCriticalitySum": float(provider_criticality),
+                "betweenness": float(centrality),
+                "component": int(component),
+            }
+            for uri, dependent_count, dependent_criticality, provider_count, provider_criticality, centrality, component
+            in zip(
+                self.uris,
+                self.dependent_count,
+                self.dependent_criticality,
+                self.provider_count,
+                self.provider_criticality,
+                self.betweenness,
+                self.components,
+                strict=True,
+            )
+        ]
+
+    def component_members(self) -> list[dict]:
+        """
+        The connected components, largest first, with the URIs of their assets
+        """
+        order = np.argsort(self.components, kind="stable")
+        labels, starts, counts = np.unique(self.components[order], return_index=True, return_counts=True)
+        largest = np.lexsort((labels, -counts))
+        return [
+            {
+                "component": int(labels[i]),
+                "size": int(counts[i]),
+                "assets": [self.uris[node] for node in order[starts[i]:starts[i] + counts[i]]],
+            }
+            for i in largest
+        ]
+
+
+def components(sources: np.ndarray, targets: np.ndarray, size: int) -> np.ndarray:
+    """
+    Labels the weakly connected components of a graph by label propagation, each node ending up with the smallest
+    node id in its component. Pointer jumping after each round keeps the number of rounds small on long chains.
+    """
+    labels: np.ndarray = np.arange(size, dtype=np.int64)
+    if len(sources) == 0:
+        return labels
+    while True:
+        previous = labels.copy()
+        smallest = np.minimum(labels[sources], labels[targets])
+        np.minimum.at(labels, sources, smallest)
+        np.minimum.at(labels, targets, smallest)
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+    # Renumber the components 0..n-1 in order of their smallest node id
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels
+
+
+def betweenness(adjacency: Adjacency, size: int, samples: int, seed: int = 0) -> np.ndarray:
+    """
+    Normalised betweenness centrality of a directed graph, by Brandes' algorithm with each breadth first search
+    vectorised a whole level at a time. When `samples` is smaller than the graph, shortest paths out of that many
+    randomly chosen (but, for a given seed, repeatable) sources are used and the result is scaled up.
+    """
+    centrality = np.zeros(size, dtype=np.float64)
+    if size < 3 or samples == 0:
+        return centrality
+    sources: np.ndarray
+    if samples >= size:
+        sources = np.arange(size)
+    else:
+        sources = np.sort(np.random.default_rng(seed).choice(size, samples, replace=False))
+
+    for source in sources:
+        centrality += _dependency(adjacency, size, int(source))
+
+    centrality *= size / len(sources)
+    centrality /= (size - 1) * (size - 2)
+    return centrality
+
+
+def _dependency(adjacency: Adjacency, size: int, source: int) -> np.ndarray:
+    """
+    The dependency of `source` on every other node: the fraction of shortest paths out of `source` through each
+    """
+    distance = np.full(size, -1, dtype=np.int64)
+    paths = np.zeros(size, dtype=np.float64)
+    distance[source] = 0
+    paths[source] = 1
+    frontier: np.ndarray = np.array([source], dtype=np.int64)
+    levels: list[tuple[np.ndarray, np.ndarray]] = []
+    while len(frontier):
+        parents, children, _ = adjacency.expand(frontier)
+        # Edges onto nodes first reached in this level are on shortest paths
+        new = distance[children] < 0
+        parents, children = parents[new], children[new]
+        frontier = np.unique(children)
+        distance[frontier] = len(levels) + 1
+        np.add.at(paths, children, paths[parents])
+        levels.append((parents, children))
+
+    dependency = np.zeros(size, dtype=np.float64)
+    for parents, children in reversed(levels):
+        np.add.at(dependency, parents, paths[parents] / paths[children] * (1 + dependency[children]))
+    dependency[source] = 0
+    return dependency
@@ -1,20 +1,41 @@
 from __future__ import annotations
 
-import io
+import asyncio
 import json
 import logging
 import os
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
 from logging import config as logging_config
+from typing import Literal
 
 import toml
 from dotenv import load_dotenv
-from fastapi import FastAPI, Query, Request
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi_healthchecks.api.router import HealthcheckRouter, Probe
-from rdflib import Graph
-from rdflib.plugins.sparql.results.jsonresults import JSONResultSerializer
-
-from paralog import models, queries, utils
+from pydantic import BaseModel
+
+from paralog import (
+    analytics,
+    cache,
+    conditional,
+    export,
+    flood,
+    graph,
+    metrics,
+    models,
+    ontology,
+    profiling,
+    queries,
+    serialise,
+    spatial,
+    streaming,
+    templates,
+    utils,
+)
 from paralog.__meta__ import DESCRIPTION, TITLE
 from paralog.decode_token import AccessMiddleware
 from paralog.jena import JenaConnector
@@ -45,12 +66,21 @@ if os.getenv('API_LOG_LEVEL') == 'DEBUG':
     )
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await jena.aclose()
+    await access_middleware.aclose()
+    await result_cache.aclose()
+
+
 app = FastAPI(
     description=DESCRIPTION,
     title=TITLE,
     root_path=os.getenv("API_ROOT_PATH", ""),
     version=toml_config['project']['version'],
     openapi_url=os.getenv("API_OPENAPI_PATH", "/openapi.json"),
+    lifespan=lifespan,
 )
 app.include_router(
     HealthcheckRouter(
@@ -69,10 +99,19 @@ access_middleware = AccessMiddleware(
     app=app,
     jwt_header=os.getenv("JWT_HEADER"),
     jwks_url=os.getenv("JWKS_URL"),
-    public_key_url=os.getenv("PUBLIC_KEY_URL")
+    public_key_url=os.getenv("PUBLIC_KEY_URL"),
+    key_cache_ttl=float(os.getenv("JWKS_CACHE_TTL", "300")),
+    key_min_refresh_interval=float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "10")),
+    token_cache_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    token_cache_max_ttl=float(os.getenv("TOKEN_CACHE_MAX_TTL", "300")),
 )
 
 
+@app.exception_handler(templates.InvalidParameter)
+async def invalid_parameter_handler(request: Request, exc: templates.InvalidParameter):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
 @app.middleware("http")
 async def add_custom_middleware(request: Request, call_next):
     """
@@ -82,6 +121,26 @@ async def add_custom_middleware(request: Request, call_next):
     return response
 
 
+# Admin endpoints that change shared state (e.g. flushing every user's cached results) or expose other users'
+# requests (the profiler) are only served when enabled, as any authenticated user could otherwise call them
+ADMIN_ENDPOINTS = os.getenv('API_ADMIN_ENDPOINTS', 'false').lower() in ('true', '1')
+
+# A negative threshold turns the slow query log off, a sample rate of 0 the profiler. Profiles can only be read from
+# the admin endpoints, so nothing is sampled unless they are enabled.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '1000'))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+stack_sampler = profiling.StackSampler(interval=float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000)
+app.add_middleware(
+    profiling.ProfilingMiddleware,
+    slow_query_seconds=SLOW_QUERY_THRESHOLD_MS / 1000 if SLOW_QUERY_THRESHOLD_MS >= 0 else None,
+    sample_rate=PROFILE_SAMPLE_RATE if ADMIN_ENDPOINTS else 0.0,
+    sampler=stack_sampler,
+)
+
+# Added last so that it is outermost, and request timings include token validation
+app.add_middleware(metrics.MetricsMiddleware)
+
+
 jena = JenaConnector(
     os.getenv('JENA_URL', 'localhost'),
     os.getenv('JENA_PORT', '3030'),
@@ -89,22 +148,200 @@ jena = JenaConnector(
     protocol=os.getenv('JENA_PROTOCOL', 'http'),
     user=os.getenv('JENA_USER', None),
     pwd=os.getenv('JENA_PASSWORD', None),
+    timeout=float(os.getenv('JENA_TIMEOUT', '30')),
+    connect_timeout=float(os.getenv('JENA_CONNECT_TIMEOUT', '5')),
+    max_connections=int(os.getenv('JENA_MAX_CONNECTIONS', '100')),
+    max_keepalive_connections=int(os.getenv('JENA_MAX_KEEPALIVE_CONNECTIONS', '20')),
+    keepalive_expiry=float(os.getenv('JENA_KEEPALIVE_EXPIRY', '5')),
 )
 
 
-async def __get_query_with_headers_from_request(
-    query: str,
-    request: Request,
-):
-    headers = await utils.get_headers(request)
+if os.getenv('RESULT_CACHE_REDIS_URL'):
+    result_cache_backend: cache.MemoryBackend | cache.RedisBackend = cache.RedisBackend(
+        os.getenv('RESULT_CACHE_REDIS_URL', '')
+    )
+else:
+    result_cache_backend = cache.MemoryBackend(maxsize=int(os.getenv('RESULT_CACHE_SIZE', '512')))
+result_cache = cache.ResultCache(
+    result_cache_backend,
+    default_ttl=float(os.getenv('RESULT_CACHE_TTL', '0')),
+    endpoint_ttls=cache.parse_ttls(os.getenv('RESULT_CACHE_ENDPOINT_TTLS')),
+)
+DEFAULT_PAGE_SIZE = int(os.getenv('API_DEFAULT_PAGE_SIZE', '1000'))
+MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '10000'))
+
+# Streamed results larger than this are not cached, keeping memory flat for very large results
+result_cache_max_rows = int(os.getenv('RESULT_CACHE_MAX_ROWS', '100000'))
+
+# Spatial indexes over the points returned by a query, per query and forwarded identity
+spatial_indexes = cache.IndexRegistry(
+    maxsize=int(os.getenv('SPATIAL_INDEX_SIZE', '16')),
+    ttl=float(os.getenv('SPATIAL_INDEX_TTL', '300')),
+)
+SPATIAL_CLUSTER_MAX_ZOOM = int(os.getenv('SPATIAL_CLUSTER_MAX_ZOOM', '14'))
+
+# Flood areas, and flood area polygons, change rarely so are kept for longer
+flood_indexes = cache.IndexRegistry(
+    maxsize=int(os.getenv('FLOOD_INDEX_SIZE', '16')),
+    ttl=float(os.getenv('FLOOD_INDEX_TTL', '3600')),
+)
+polygon_store = flood.PolygonStore(
+    maxsize=int(os.getenv('FLOOD_POLYGON_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('FLOOD_POLYGON_CACHE_TTL', '3600')),
+)
+# Points found inside each flood area polygon, per spatial index
+polygon_joins = cache.TTLCache(maxsize=int(os.getenv('FLOOD_POLYGON_JOIN_CACHE_SIZE', '1024')))
+FLOOD_POLYGON_CHUNK_SIZE = int(os.getenv('FLOOD_POLYGON_CHUNK_SIZE', '100'))
+FLOOD_POLYGON_MAX_SIZE = int(os.getenv('FLOOD_POLYGON_MAX_SIZE', '1000'))
+
+# Indexes of the whole dependency graph for multi-hop traversals. Jena applies access controls per forwarded
+# identity, so each identity has its own full copy of the graph it can see, and GRAPH_INDEX_SIZE bounds how many are
+# held. Indexes are rebuilt in full (Jena has no change feed to update them from) in the background.
+graph_indexes = cache.IndexRegistry(
+    maxsize=int(os.getenv('GRAPH_INDEX_SIZE', '4')),
+    ttl=float(os.getenv('GRAPH_INDEX_REBUILD_INTERVAL', '300')),
+)
+# Network metrics per assessment and forwarded identity
+metrics_indexes = cache.IndexRegistry(
+    maxsize=int(os.getenv('ANALYTICS_CACHE_SIZE', '16')),
+    ttl=float(os.getenv('ANALYTICS_CACHE_TTL', '300')),
+)
+ANALYTICS_BETWEENNESS_SAMPLES = int(os.getenv('ANALYTICS_BETWEENNESS_SAMPLES', '64'))
+IMPACT_MAX_DEPTH = int(os.getenv('IMPACT_MAX_DEPTH', '10'))
+IMPACT_MAX_NODES = int(os.getenv('IMPACT_MAX_NODES', '10000'))
+
+# Batch requests are split into queries of at most this many URIs, which are sent to Jena concurrently
+ASSET_BATCH_CHUNK_SIZE = int(os.getenv('ASSET_BATCH_CHUNK_SIZE', '100'))
+ASSET_BATCH_MAX_SIZE = int(os.getenv('ASSET_BATCH_MAX_SIZE', '1000'))
+# Building details are fetched in chunks of at most this many UPRNs, one after another, as they are streamed out
+BUILDING_DETAILS_CHUNK_SIZE = int(os.getenv('BUILDING_DETAILS_CHUNK_SIZE', '500'))
+BUILDING_DETAILS_MAX_SIZE = int(os.getenv('BUILDING_DETAILS_MAX_SIZE', '10000'))
+STATES_BATCH_CHUNK_SIZE = int(os.getenv('STATES_BATCH_CHUNK_SIZE', '100'))
+STATES_BATCH_MAX_SIZE = int(os.getenv('STATES_BATCH_MAX_SIZE', '1000'))
+
+# Responses are converted and serialised straight to JSON, with response models only describing them in the OpenAPI
+# schema, rather than being validated and re-serialised by FastAPI row by row
+FAST_SERIALISATION = os.getenv('API_FAST_SERIALISATION', 'true').lower() in ('true', '1')
+
+# ETags come from the dataset version when DATASET_VERSION_QUERY is set, so that requests for unchanged data can be
+# answered without querying Jena, and otherwise from a hash of the response body
+DATASET_VERSION_QUERY = os.getenv('DATASET_VERSION_QUERY')
+dataset_version = conditional.DatasetVersion(
+    (lambda: jena.get(DATASET_VERSION_QUERY)) if DATASET_VERSION_QUERY else None,
+    ttl=float(os.getenv('DATASET_VERSION_TTL', '5')),
+)
+# Sent with every response carrying an ETag, and with its 304s. Responses depend on the caller's identity, so by
+# default shared caches must not store them and clients must revalidate them before reuse. There is no Last-Modified,
+# as neither Jena results nor dataset versions carry a modification time, so clients revalidate with If-None-Match.
+CACHE_CONTROL = os.getenv('API_CACHE_CONTROL', 'private, no-cache')
+
+# Identical queries in flight at the same time (with the same forwarded headers) share one call to Jena
+query_flights = cache.SingleFlight()
+
+
+def __endpoint(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
+
+
+async def __get_query_with_headers(query: str, headers: dict, endpoint: str):
+    key = cache.query_key(query, headers)
+
+    query_result = await result_cache.get(endpoint, key)
+    if query_result is not None:
+        logger.info('Returning cached query result')
+        return query_result
 
     logger.info('Sending query to Jena')
     logger.debug(f'Query: {query}')
-    query_result = await jena.get(query, headers)
+    query_result = await query_flights.do(key, lambda: jena.get(query, headers))
     logger.debug(f'Query result from Jena: {query_result}')
+    await result_cache.set(endpoint, key, query_result)
     return query_result
 
 
+def __respond(content, annotation, response: Response | None = None):
+    """
+    Returns content as a JSON response in the shape of `annotation` (the endpoint's response model), converted and
+    serialised in one step. With API_FAST_SERIALISATION disabled the content is returned for FastAPI to validate
+    against the response model instead.
+    """
+    if not FAST_SERIALISATION:
+        return content
+    # Headers set on the injected response (e.g. a Link to the next page) are carried over
+    headers = dict(response.headers) if response is not None else None
+    start = time.perf_counter()
+    body = serialise.serialise(content, annotation)
+    metrics.SERIALISE_SECONDS.observe(time.perf_counter() - start)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def __validator_headers(tag: str, vary_accept: bool = False) -> dict[str, str]:
+    headers = {"ETag": tag}
+    if CACHE_CONTROL:
+        headers["Cache-Control"] = CACHE_CONTROL
+    if vary_accept:
+        headers["Vary"] = "Accept"
+    return headers
+
+
+def __not_modified(request: Request, tag: str, vary_accept: bool = False) -> Response | None:
+    """
+    Returns a 304 response if the request's If-None-Match shows the client has the response with this ETag already
+    """
+    if conditional.etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=__validator_headers(tag, vary_accept))
+    return None
+
+
+async def __precondition(query: str, request: Request) -> tuple[str | None, Response | None]:
+    """
+    Returns the ETag of the response to a request for the results of a query from the dataset version, if there is
+    one, and a 304 response if the client has that response already, so that it is answered without querying Jena.
+    The ETag depends on whether the client accepts newline delimited JSON, so its responses vary by Accept.
+    """
+    version = await dataset_version.get()
+    if version is None:
+        return None, None
+    headers = await utils.get_headers(request.headers)
+    tag = conditional.version_etag(
+        version,
+        cache.query_key(query, headers),
+        request.url.query,
+        "ndjson" if streaming.wants_ndjson(request) else "json",
+    )
+    return tag, __not_modified(request, tag, vary_accept=True)
+
+
+def __conditional(request: Request, result, tag: str | None = None, response: Response | None = None):
+    """
+    Adds an ETag to a response, or returns a 304 if the client has it already. Without an ETag from `__precondition`
+    the ETag is a hash of the response body, so streamed responses and responses left for FastAPI to serialise only
+    get one from the dataset version. Headers for those are set on the injected `response`.
+    """
+    # ETags from `__precondition` depend on the Accept header
+    vary_accept = tag is not None
+    if tag is None:
+        if not isinstance(result, Response) or isinstance(result, StreamingResponse):
+            return result
+        tag = conditional.etag(bytes(result.body))
+        not_modified = __not_modified(request, tag)
+        if not_modified is not None:
+            return not_modified
+    target = result if isinstance(result, Response) else response
+    if target is not None:
+        target.headers.update(__validator_headers(tag, vary_accept))
+    return result
+
+
+async def __get_query_with_headers_from_request(
+    query: str,
+    request: Request,
+):
+    headers = await utils.get_headers(request.headers)
+    return await __get_query_with_headers(query, headers, __endpoint(request))
+
+
 async def __get_query_with_headers_from_request_and_flatten(
     query: str,
     request: Request,
@@ -112,76 +349,465 @@ async def __get_query_with_headers_from_request_and_flatten(
 ):
     query_result = await __get_query_with_headers_from_request(query, request)
     logger.info('Flattening result')
+    start = time.perf_counter()
     flattened_result = await utils.flatten_out(query_result, return_first_obj)
+    metrics.FLATTEN_SECONDS.observe(time.perf_counter() - start)
     logger.debug(f'flattened result: {flattened_result}')
     return flattened_result
 
 
-async def __get_query_with_headers_from_request_and_map(
+async def __cache_streamed_bindings(endpoint: str, key: str, query: str, bindings: streaming.SparqlBindings):
+    collected: list | None = [] if result_cache.ttl_for(endpoint) > 0 else None
+    rows = 0
+    async for binding in bindings:
+        rows += 1
+        if collected is not None:
+            collected.append(binding)
+            if len(collected) > result_cache_max_rows:
+                collected = None
+        yield binding
+    metrics.observe_rows(query, rows)
+    profiling.record_rows(query, rows)
+    if collected is not None:
+        await result_cache.set(endpoint, key, {"head": {"vars": bindings.vars}, "results": {"bindings": collected}})
+
+
+async def __stream_bindings_with_headers_from_request(query: str, request: Request) -> AsyncIterator[dict]:
+    """
+    Returns an iterator over the bindings of a query, from the result cache or as they arrive from Jena
+    """
+    headers = await utils.get_headers(request.headers)
+    endpoint = __endpoint(request)
+    key = cache.query_key(query, headers)
+
+    query_result = await result_cache.get(endpoint, key)
+    if query_result is not None:
+        logger.info('Streaming cached query result')
+        return streaming.iterate(query_result["results"]["bindings"])
+    logger.info('Streaming query from Jena')
+    logger.debug(f'Query: {query}')
+    return __cache_streamed_bindings(endpoint, key, query, streaming.SparqlBindings(jena.stream(query, headers)))
+
+
+async def __stream_query_with_headers_from_request(
     query: str,
-    request: Request
+    request: Request,
+    model: type[BaseModel],
+    row_mapper: Callable[[dict], dict],
 ):
-    query_result = await __get_query_with_headers_from_request(query, request)
-    logger.info('Mapping result')
-    mapped_result = await utils.map_flood_areas(query_result)
-    logger.debug(f'mapped result: {mapped_result}')
-    return mapped_result
+    """
+    Streams the results of a query to the client as they arrive from Jena, mapping and validating one binding at a
+    time rather than building the whole result in memory.
+    """
+    bindings = await __stream_bindings_with_headers_from_request(query, request)
+    return await __stream_bindings_to_client(bindings, request, model, row_mapper)
+
+
+async def __stream_bindings_to_client(
+    bindings: AsyncIterator[dict],
+    request: Request,
+    model: type[BaseModel],
+    row_mapper: Callable[[dict], dict],
+):
+    if FAST_SERIALISATION:
+        convert = serialise.converter(model)
+        rows = (serialise.dumps(convert(row_mapper(binding))) async for binding in bindings)
+    else:
+        rows = (model.model_validate(row_mapper(binding)).model_dump_json().encode() async for binding in bindings)
+    return streaming.stream_rows(request, await streaming.prime(rows))
+
+
+async def __get_page_with_headers_from_request(
+    page_query: Callable[[int, str | None], Awaitable[str]],
+    key_var: str,
+    request: Request,
+    response: Response,
+    limit: int | None,
+    cursor: str | None,
+    row_mapper: Callable[[dict], dict],
+):
+    """
+    Returns one page of results, ordered by `key_var`, and adds a Link header for the next page if there is one.
+
+    One row more than the page is fetched, so that a page that happens to end with the results has no next page.
+    Several rows may share a key, so when there are more rows the rows for the key they continue with are left for the
+    next page. If a page only has rows for a single key it is fetched again with a larger limit, so that a key is never
+    split.
+    """
+    try:
+        after = utils.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="invalid cursor") from e
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+
+    fetch_limit = limit
+    while True:
+        results = await __get_query_with_headers_from_request(await page_query(fetch_limit + 1, after), request)
+        bindings = results["results"]["bindings"] or []
+        if len(bindings) <= fetch_limit:
+            page, next_key = bindings, None
+            break
+        last_key = bindings[-1][key_var]["value"]
+        page = [binding for binding in bindings if binding[key_var]["value"] != last_key]
+        if page:
+            next_key = page[-1][key_var]["value"]
+            break
+        fetch_limit *= 2
+
+    if next_key is not None:
+        next_url = request.url.include_query_params(limit=limit, cursor=utils.encode_cursor(next_key))
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return [row_mapper(binding) for binding in page]
+
+
+async def __get_point_index(
+    query: str,
+    headers: dict,
+    endpoint: str,
+    row_mapper: Callable[[dict], dict],
+    lat_key: str = "lat",
+    lon_key: str = "lon",
+) -> spatial.PointIndex:
+    """
+    Returns the spatial index over the points returned by a query, building it from Jena on first use and refreshing
+    it once it is older than SPATIAL_INDEX_TTL
+    """
+    async def build():
+        logger.info(f'Building spatial index for {endpoint}')
+        results = await __get_query_with_headers(query, headers, endpoint)
+        rows = [row_mapper(binding) for binding in results["results"]["bindings"] or []]
+        return spatial.PointIndex.from_rows(rows, lat_key, lon_key)
+
+    return await spatial_indexes.get((endpoint, cache.query_key(query, headers)), build)
+
+
+async def __get_points_in_bbox_from_request(
+    query: str,
+    request: Request,
+    bbox: str,
+    zoom: int | None,
+    row_mapper: Callable[[dict], dict],
+    lat_key: str = "lat",
+    lon_key: str = "lon",
+):
+    """
+    Answers a viewport query from an in-process spatial index over the points returned by the query. Below
+    SPATIAL_CLUSTER_MAX_ZOOM the points are returned as clusters.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = spatial.parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    headers = await utils.get_headers(request.headers)
+    index = await __get_point_index(query, headers, __endpoint(request), row_mapper, lat_key, lon_key)
+    positions = index.query(min_lon, min_lat, max_lon, max_lat)
+    if zoom is not None and zoom < SPATIAL_CLUSTER_MAX_ZOOM:
+        return index.cluster(positions, zoom)
+    return index.select(positions)
+
+
+def __cache_stats() -> dict[str, dict]:
+    return {
+        "results": result_cache.stats(),
+        "queries_in_flight": query_flights.stats(),
+        "spatial_indexes": spatial_indexes.stats(),
+        "graph_indexes": graph_indexes.stats(),
+        "metrics": metrics_indexes.stats(),
+        "flood_areas": flood_indexes.stats(),
+        "flood_polygons": polygon_store.stats(),
+        "flood_polygon_joins": polygon_joins.stats(),
+        "tokens": access_middleware.token_cache.stats(),
+        "dataset_version": dataset_version.stats(),
+    }
+
+
+metrics.caches.sources["app"] = __cache_stats
+metrics.pools.sources["app"] = lambda: {"jena": jena.stats()}
+
+
+@app.get("/admin/cache")
+async def get_cache_stats():
+    """
+    Returns statistics for the result, spatial index, graph index, metrics, flood area and token caches, and for
+    coalesced in-flight queries
+    """
+    return __cache_stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus metrics: request, Jena query, result row, token verification and response stage timings, and cache
+    and connection pool statistics
+    """
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def __require_admin_endpoints():
+    if not ADMIN_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get(
+    "/admin/profile",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(__require_admin_endpoints)],
+    include_in_schema=ADMIN_ENDPOINTS,
+)
+async def get_profile():
+    """
+    Returns the stacks sampled from profiled requests (see PROFILE_SAMPLE_RATE) in collapsed stack format, one
+    "frame;frame;frame count" line per distinct stack, for flame graph tools such as flamegraph.pl or speedscope
+    """
+    return PlainTextResponse(stack_sampler.collapsed())
+
+
+@app.delete("/admin/profile", dependencies=[Depends(__require_admin_endpoints)], include_in_schema=ADMIN_ENDPOINTS)
+async def clear_profile():
+    """
+    Discards the sampled stacks, e.g. before profiling a particular workload
+    """
+    stats = stack_sampler.stats()
+    stack_sampler.clear()
+    return {"cleared": stats["stacks"], "samples": stats["samples"]}
+
+
+@app.delete("/admin/cache", dependencies=[Depends(__require_admin_endpoints)], include_in_schema=ADMIN_ENDPOINTS)
+async def invalidate_cache(endpoint: str | None = None):
+    """
+    Invalidates cached query results, either for a single endpoint (e.g. "/buildings") or for all endpoints.
+    Spatial and graph indexes, network metrics and flood areas and polygons are always rebuilt.
+    """
+    await result_cache.invalidate(endpoint)
+    spatial_indexes.clear()
+    graph_indexes.clear()
+    metrics_indexes.clear()
+    flood_indexes.clear()
+    polygon_store.clear()
+    polygon_joins.clear()
+    dataset_version.clear()
+    logger.info(f'Result cache invalidated for {endpoint or "all endpoints"}')
+    return {"invalidated": endpoint or "all"}
 
 
 @app.get("/assessments", response_model=list[models.Assessment])
-async def get_assessments(request: Request):
+async def get_assessments(request: Request, response: Response):
     """
-    Returns all assessments
+    Returns all assessments. Responses carry an ETag, and conditional requests for unchanged assessments get a 304.
     """
-    return await __get_query_with_headers_from_request_and_flatten(
-        await queries.get_all_assessments(),
-        request
-    )
+    query = await queries.get_all_assessments()
+    tag, not_modified = await __precondition(query, request)
+    if not_modified is not None:
+        return not_modified
+    assessments = await __get_query_with_headers_from_request_and_flatten(query, request)
+    return __conditional(request, __respond(assessments, list[models.Assessment]), tag, response)
 
 
-@app.get("/assessments/assets", response_model=list[models.AssetSummary])
-async def get_assets_in_assessments(request: Request, assessment: str, types: list[str] = Query(default=[])):  # noqa
+@app.get("/assessments/assets", response_model=list[models.AssetSummary | models.PointCluster])
+async def get_assets_in_assessments(
+    request: Request,
+    response: Response,
+    assessment: str,
+    types: list[str] = Query(default=[]),  # noqa
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),  # noqa
+    cursor: str | None = None,
+    bbox: str | None = None,
+    zoom: int | None = Query(default=None, ge=0, le=24),  # noqa
+):
     """
     Returns all assets covered by the assessments. Assessments are provided
-    as a list of query parameters
+    as a list of query parameters. Pass a limit (and the cursor from the next link) to page through the assets.
+    Pass a bbox ("min_lon,min_lat,max_lon,max_lat") to only return assets in a viewport, and a zoom level to have
+    them clustered at low zoom levels.
     """
-    return await __get_query_with_headers_from_request_and_flatten(
-        await queries.get_assets_by_assessment(assessment, types),
-        request
-    )
+    if bbox is not None:
+        if limit is not None or cursor is not None:
+            raise HTTPException(status_code=400, detail="bbox cannot be combined with limit or cursor")
+        assets = await __get_points_in_bbox_from_request(
+            await queries.get_assets_by_assessment(assessment, types),
+            request,
+            bbox,
+            zoom,
+            utils.flatten_binding,
+        )
+    elif limit is not None or cursor is not None:
+        assets = await __get_page_with_headers_from_request(
+            lambda page_limit, after: queries.get_assets_by_assessment(assessment, types, page_limit, after),
+            "uri",
+            request,
+            response,
+            limit,
+            cursor,
+            utils.flatten_binding,
+        )
+    else:
+        assets = await __get_query_with_headers_from_request_and_flatten(
+            await queries.get_assets_by_assessment(assessment, types),
+            request
+        )
+    return __respond(assets, list[models.AssetSummary | models.PointCluster], response)
 
 
 @app.get("/assessments/asset-types", response_model=list[models.IesType])
 async def get_asset_types_in_assessments(request: Request, assessment: str):
-    return await __get_query_with_headers_from_request_and_flatten(
+    asset_types = await __get_query_with_headers_from_request_and_flatten(
         await queries.get_asset_types_by_assessment(assessment),
         request
     )
+    return __respond(asset_types, list[models.IesType])
 
 
 @app.get("/assessments/dependencies", response_model=list[models.Dependency])
 async def get_dependencies_in_assessment(
-    request: Request, assessment: str, types: list[str] = Query(default=[])  # noqa
+    request: Request,
+    response: Response,
+    assessment: str,
+    types: list[str] = Query(default=[]),  # noqa
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),  # noqa
+    cursor: str | None = None,
 ):
     """
-    Returns all assets covered by the assessments. Assessments are provided as a list of query parameters
+    Returns all assets covered by the assessments. Assessments are provided as a list of query parameters.
+    Results are streamed, as a JSON array or as newline delimited JSON if the client accepts application/x-ndjson.
+    Pass a limit (and the cursor from the next link) to page through the dependencies instead.
     """
-    return await __get_query_with_headers_from_request_and_flatten(
+    if limit is not None or cursor is not None:
+        dependencies = await __get_page_with_headers_from_request(
+            lambda page_limit, after: queries.get_dependencies_by_assessment(assessment, types, page_limit, after),
+            "dependencyUri",
+            request,
+            response,
+            limit,
+            cursor,
+            utils.flatten_binding,
+        )
+        return __respond(dependencies, list[models.Dependency], response)
+    return await __stream_query_with_headers_from_request(
         await queries.get_dependencies_by_assessment(assessment, types=types),
-        request
+        request,
+        models.Dependency,
+        utils.flatten_binding,
     )
 
 
+async def __get_metrics_with_headers_from_request(assessment: str, request: Request) -> analytics.NetworkMetrics:
+    """
+    Returns the network metrics of an assessment, computed from its dependencies on first use and recomputed in the
+    background once they are older than ANALYTICS_CACHE_TTL
+    """
+    headers = await utils.get_headers(request.headers)
+    query = await queries.get_dependencies_by_assessment(assessment)
+
+    async def build():
+        logger.info(f'Computing network metrics for {assessment}')
+        results = await __get_query_with_headers(query, headers, "/assessments/dependencies")
+        index = graph.DependencyIndex(results["results"]["bindings"] or [])
+        return await asyncio.to_thread(analytics.NetworkMetrics, index, ANALYTICS_BETWEENNESS_SAMPLES)
+
+    return await metrics_indexes.get(cache.query_key(query, headers), build)
+
+
+@app.get("/assessments/metrics", response_model=models.AssessmentMetrics)
+async def get_metrics_for_assessment(request: Request, assessment: str):
+    """
+    Returns network metrics for every asset in an assessment's dependency network: the number and summed criticality
+    of the dependencies it provides and depends on, its betweenness centrality (estimated from
+    ANALYTICS_BETWEENNESS_SAMPLES assets in larger networks) and its connected component.
+    """
+    network = await __get_metrics_with_headers_from_request(assessment, request)
+    return __respond({
+        "assessment": assessment,
+        "nodes": len(network),
+        "edges": network.edges,
+        "components": int(network.components.max()) + 1 if len(network) else 0,
+        "betweennessSamples": network.samples,
+        "assets": network.assets(),
+    }, models.AssessmentMetrics)
+
+
+@app.get("/assessments/metrics/components", response_model=list[models.NetworkComponent])
+async def get_components_for_assessment(request: Request, assessment: str):
+    """
+    Returns the connected components of an assessment's dependency network, largest first
+    """
+    network = await __get_metrics_with_headers_from_request(assessment, request)
+    return __respond(network.component_members(), list[models.NetworkComponent])
+
+
+@app.get(
+    "/assessments/dependencies/export",
+    responses={200: {"content": {"application/json": {}, export.ARROW_STREAM: {}}}},
+)
+async def export_dependencies_in_assessment(
+    request: Request,
+    assessment: str,
+    types: list[str] = Query(default=[]),  # noqa
+    output_format: Literal["json", "arrow"] | None = Query(default=None, alias="format"),  # noqa
+    table: Literal["nodes", "edges"] = "edges",
+):
+    """
+    Returns the dependency network of an assessment as interned node and edge tables. Nodes and types are numbered,
+    and edges refer to their provider and dependent nodes by number.
+
+    As JSON, the type dictionary and both tables are returned together as arrays of columns. As an Arrow IPC stream
+    (format=arrow, or an Accept header of application/vnd.apache.arrow.stream), one table is returned per request,
+    chosen with `table`. Node ids are the same in both.
+    """
+    # Without an explicit format the Accept header picks one, so the response varies by it
+    headers = {"Vary": "Accept"} if output_format is None else None
+    if output_format is None:
+        output_format = "arrow" if export.ARROW_STREAM in request.headers.get("accept", "") else "json"
+    if output_format == "arrow":
+        try:
+            export.require_arrow()
+        except RuntimeError as e:
+            raise HTTPException(status_code=501, detail=str(e)) from e
+
+    dependency_graph = export.DependencyGraph()
+    bindings = await __stream_bindings_with_headers_from_request(
+        await queries.get_dependencies_by_assessment(assessment, types=types), request
+    )
+    async for binding in bindings:
+        dependency_graph.add(binding)
+    logger.info(f'Exporting {len(dependency_graph)} dependencies as {output_format}')
+
+    if output_format == "arrow":
+        return Response(dependency_graph.to_arrow(table), media_type=export.ARROW_STREAM, headers=headers)
+    return Response(dependency_graph.to_json(), media_type="application/json", headers=headers)
+
+
 @app.get("/asset", response_model=models.Asset)
 async def get_asset(request: Request, assetUri: str):
     """
     Returns all assets covered by the assessments. Assessments are provided as a list of query parameters.
     """
-    return await __get_query_with_headers_from_request_and_flatten(
+    asset = await __get_query_with_headers_from_request_and_flatten(
         await queries.get_asset(assetUri),
         request,
         return_first_obj=True
     )
+    return __respond(asset, models.Asset)
+
+
+@app.post("/assets:batch", response_model=dict[str, models.Asset])
+async def get_assets_batch(request: Request, batch: models.AssetBatch):
+    """
+    Returns the assets with the given URIs, keyed by URI. URIs that do not match an asset are left out.
+    """
+    uris = list(dict.fromkeys(batch.uris))
+    if len(uris) > ASSET_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"at most {ASSET_BATCH_MAX_SIZE} URIs can be requested at once")
+    chunks = [uris[i:i + ASSET_BATCH_CHUNK_SIZE] for i in range(0, len(uris), ASSET_BATCH_CHUNK_SIZE)]
+    chunk_queries = [await queries.get_assets(chunk) for chunk in chunks]
+    results = await asyncio.gather(
+        *(__get_query_with_headers_from_request_and_flatten(query, request) for query in chunk_queries)
+    )
+    assets: dict[str, dict] = {}
+    for rows in results:
+        for row in rows:
+            assets.setdefault(row["uri"], row)
+    return __respond(assets, dict[str, models.Asset])
 
 
 @app.get("/asset/dependents", response_model=list[models.Dependency])
@@ -189,10 +815,11 @@ async def get_dependents_for_asset(request: Request, assetUri: str):
     """
     Returns all assets that depend on this asset.
     """
-    return await __get_query_with_headers_from_request_and_flatten(
+    dependencies = await __get_query_with_headers_from_request_and_flatten(
         await queries.get_dependencies(assetUri, direction="dependents"),
         request
     )
+    return __respond(dependencies, list[models.Dependency])
 
 
 @app.get("/asset/providers", response_model=list[models.Dependency])
@@ -200,10 +827,50 @@ async def get_providers_for_asset(request: Request, assetUri: str):
     """
     Returns all assets that this asset is dependent on.
     """
-    return await __get_query_with_headers_from_request_and_flatten(
+    dependencies = await __get_query_with_headers_from_request_and_flatten(
         await queries.get_dependencies(assetUri, direction="providers"),
         request
     )
+    return __respond(dependencies, list[models.Dependency])
+
+
+@app.get("/asset/impact", response_model=models.Impact)
+async def get_impact_for_asset(
+    request: Request,
+    assetUri: str,
+    direction: Literal["dependents", "providers"] = "dependents",
+    depth: int = Query(default=3, ge=1, le=IMPACT_MAX_DEPTH),  # noqa
+    max_nodes: int = Query(default=IMPACT_MAX_NODES, ge=1, le=IMPACT_MAX_NODES),  # noqa
+):
+    """
+    Returns the assets that transitively depend on this asset (or, with direction=providers, that it transitively
+    depends on) within `depth` hops, with the distance of each and the criticality accumulated along the way.
+    The traversal runs over an in-memory index of the dependency graph, rebuilt from Jena once it is older than
+    GRAPH_INDEX_REBUILD_INTERVAL.
+    """
+    headers = await utils.get_headers(request.headers)
+    endpoint = __endpoint(request)
+    query = await queries.get_all_dependencies()
+
+    async def build():
+        logger.info('Building dependency graph index')
+        results = await __get_query_with_headers(query, headers, endpoint)
+        index = graph.DependencyIndex(results["results"]["bindings"] or [])
+        logger.info(
+            f'Built dependency graph index of {len(index)} assets and {len(index.providers)} dependencies '
+            f'({index.nbytes() / 1e6:.1f} MB)'
+        )
+        return index
+
+    index = await graph_indexes.get(cache.query_key(query, headers), build)
+    assets, truncated = index.traverse(assetUri, direction, depth, max_nodes)
+    return __respond({
+        "uri": assetUri,
+        "direction": direction,
+        "depth": depth,
+        "truncated": truncated,
+        "assets": assets,
+    }, models.Impact)
 
 
 @app.get("/asset/parts")
@@ -216,10 +883,11 @@ async def get_asset_parts(request: Request, assetUri: str):
 
 @app.get("/asset/residents", response_model=list[models.Person])
 async def get_residents(request: Request, assetUri: str):
-    return await __get_query_with_headers_from_request_and_flatten(
+    residents = await __get_query_with_headers_from_request_and_flatten(
         await queries.get_residents(assetUri),
         request
     )
+    return __respond(residents, list[models.Person])
 
 
 @app.get("/asset/participations")
@@ -240,30 +908,167 @@ async def get_participants(request: Request, eventUri: str) -> list:
 
 @app.get("/person/residences", response_model=list[models.Asset])
 async def get_residences(request: Request, personUri: str):
-    return await __get_query_with_headers_from_request_and_flatten(
+    residences = await __get_query_with_headers_from_request_and_flatten(
         await queries.get_residence(personUri),
         request
     )
+    return __respond(residences, list[models.Asset])
 
 
 @app.get("/flood-watch-areas", response_model=list[models.FloodWatchArea])
 async def get_flood_watch_areas(request: Request):
-    return await __get_query_with_headers_from_request_and_map(
-        await queries.get_flood_areas(),
-        request
-    )
+    """
+    Returns the flood watch areas and their flood areas, from a view rebuilt from Jena once it is older than
+    FLOOD_INDEX_TTL. Responses carry an ETag, and conditional requests for an unchanged view get a 304.
+    """
+    headers = await utils.get_headers(request.headers)
+    endpoint = __endpoint(request)
+    query = await queries.get_flood_areas()
+
+    async def build():
+        logger.info('Building flood area index')
+        results = await __get_query_with_headers(query, headers, endpoint)
+        return flood.FloodAreaIndex(await utils.map_flood_areas(results))
+
+    index = await flood_indexes.get(cache.query_key(query, headers), build)
+    not_modified = __not_modified(request, index.etag)
+    if not_modified is not None:
+        return not_modified
+    return Response(index.body, media_type="application/json", headers=__validator_headers(index.etag))
+
+
+async def __get_polygons_with_headers_from_request(uris: list[str], request: Request) -> dict[str, flood.Polygon]:
+    """
+    Returns the flood area polygons with the given URIs from the polygon store, fetching any it does not hold from
+    Jena in chunks of FLOOD_POLYGON_CHUNK_SIZE
+    """
+    headers = await utils.get_headers(request.headers)
+    endpoint = __endpoint(request)
+
+    async def fetch(missing: list[str]) -> dict[str, str]:
+        chunks = [missing[i:i + FLOOD_POLYGON_CHUNK_SIZE] for i in range(0, len(missing), FLOOD_POLYGON_CHUNK_SIZE)]
+        chunk_queries = [await queries.get_flood_area_polygons(chunk) for chunk in chunks]
+        results = await asyncio.gather(
+            *(__get_query_with_headers(query, headers, endpoint) for query in chunk_queries)
+        )
+        return {
+            binding["polygon"]["value"]: binding["geoJsonValue"]["value"]
+            for result in results
+            for binding in result["results"]["bindings"] or []
+        }
+
+    return await polygon_store.get_many(cache.query_key("", headers), uris, fetch)
 
 
 @app.get("/flood-watch-areas/polygon")
-async def get_flood_area_polygon(request: Request, polygon_uri: str):
-    results = await __get_query_with_headers_from_request(
-        await queries.get_flood_area_polygon(polygon_uri),
-        request
-    )
-    if results["results"]["bindings"] is None or len(results["results"]["bindings"]) == 0:
+async def get_flood_area_polygon(
+    request: Request,
+    polygon_uri: str,
+    tolerance: float | None = Query(default=None, gt=0),  # noqa
+):
+    """
+    Returns the GeoJSON of a flood area polygon, optionally simplified to a tolerance in degrees for low zoom levels.
+    Responses carry an ETag, and If-None-Match requests for an unchanged polygon get a 304.
+    """
+    polygons = await __get_polygons_with_headers_from_request([polygon_uri], request)
+    polygon = polygons.get(polygon_uri)
+    if polygon is None:
         return None
-    geo_json = results["results"]["bindings"][0][results["head"]["vars"][0]]["value"]
-    return json.loads(geo_json)
+    body = polygon.simplified(tolerance)
+    tag = conditional.etag(body) if tolerance else polygon.etag
+    not_modified = __not_modified(request, tag)
+    if not_modified is not None:
+        return not_modified
+    return Response(body, media_type="application/json", headers=__validator_headers(tag))
+
+
+async def __get_points_in_polygon_from_request(
+    polygon_uri: str,
+    query: str,
+    endpoint: str,
+    request: Request,
+    row_mapper: Callable[[dict], dict],
+    lat_key: str = "lat",
+    lon_key: str = "lon",
+):
+    """
+    Returns the rows of a query whose points lie inside a flood area polygon. The points come from the same spatial
+    index as `endpoint`'s bbox queries, and the rows found are cached per polygon until the index or the polygon
+    changes.
+    """
+    headers = await utils.get_headers(request.headers)
+    polygons = await __get_polygons_with_headers_from_request([polygon_uri], request)
+    polygon = polygons.get(polygon_uri)
+    if polygon is None:
+        raise HTTPException(status_code=404, detail="polygon not found")
+    index = await __get_point_index(query, headers, endpoint, row_mapper, lat_key, lon_key)
+
+    key = (endpoint, cache.query_key(query, headers), polygon_uri)
+    joined = polygon_joins.get(key)
+    if joined is not None and joined[0] is index and joined[1] == polygon.etag:
+        return joined[2]
+    rows = index.select(index.within(polygon.polygons))
+    polygon_joins.set(key, (index, polygon.etag, rows))
+    return rows
+
+
+@app.get("/flood-watch-areas/polygon/buildings", response_model=list[models.Building])
+async def get_buildings_in_flood_area(request: Request, polygon_uri: str):
+    """
+    Returns the buildings inside a flood area polygon
+    """
+    buildings = await __get_points_in_polygon_from_request(
+        polygon_uri,
+        await queries.get_buildings(),
+        "/buildings",
+        request,
+        __building_from_binding,
+    )
+    return __respond(buildings, list[models.Building])
+
+
+@app.get("/flood-watch-areas/polygon/assets", response_model=list[models.AssetSummary])
+async def get_assets_in_flood_area(
+    request: Request,
+    polygon_uri: str,
+    assessment: str,
+    types: list[str] = Query(default=[]),  # noqa
+):
+    """
+    Returns the assets in an assessment that are inside a flood area polygon
+    """
+    assets = await __get_points_in_polygon_from_request(
+        polygon_uri,
+        await queries.get_assets_by_assessment(assessment, types),
+        "/assessments/assets",
+        request,
+        utils.flatten_binding,
+    )
+    return __respond(assets, list[models.AssetSummary])
+
+
+@app.post("/flood-watch-areas/polygons")
+async def get_flood_area_polygons(request: Request, batch: models.PolygonBatch):
+    """
+    Returns the GeoJSON of many flood area polygons, keyed by URI and optionally simplified to a tolerance in
+    degrees. Polygons that do not exist are left out.
+    """
+    uris = list(dict.fromkeys(batch.uris))
+    if len(uris) > FLOOD_POLYGON_MAX_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"at most {FLOOD_POLYGON_MAX_SIZE} polygons can be requested at once"
+        )
+    polygons = await __get_polygons_with_headers_from_request(uris, request)
+
+    body = bytearray(b"{")
+    for i, (uri, polygon) in enumerate(polygons.items()):
+        if i:
+            body += b","
+        body += json.dumps(uri).encode()
+        body += b":"
+        body += polygon.simplified(batch.tolerance)
+    body += b"}"
+    return Response(bytes(body), media_type="application/json")
 
 
 @app.get("/states")
@@ -272,54 +1077,136 @@ async def get_states_for_parent(request: Request, parent_uri: str):
         await queries.get_states(parent_uri),
         request
     )
-    states: dict = {}
-    for st in results["results"]["bindings"]:
-        if st["stateUri"]["value"] in states.keys():
-            state = states[st["stateUri"]["value"]]
-        else:
-            state = {
-                "end": "",
-                "period": "",
-                "start": "",
-                "type": st["stateType"]["value"],
-                "uri": st["stateUri"]["value"],
-                "relations": [],
-                "representations": [],
-            }
-            states[st["stateUri"]["value"]] = state
-        if "inPeriod" in st.keys():
-            state["period"] = st["inPeriod"]["value"]
-        if "ends" in st.keys():
-            state["end"] = st["ends"]["value"]
-        if "starts" in st.keys():
-            state["start"] = st["starts"]["value"]
-        if "repType" in st.keys() and "repValue" in st.keys():
-            rep = {st["repType"]["value"]: st["repValue"]["value"]}
-            state["representations"].append(rep)
+    states = await utils.map_states(results)
+    return states.get(parent_uri, {})
 
+
+@app.post("/states:batch")
+async def get_states_for_parents(request: Request, batch: models.StateBatch):
+    """
+    Returns the states of many parents, keyed by parent URI and then by state URI. Parents are sent to Jena in
+    concurrent chunks of STATES_BATCH_CHUNK_SIZE, and parents without states have an empty object.
+    """
+    parent_uris = list(dict.fromkeys(batch.parent_uris))
+    if len(parent_uris) > STATES_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"at most {STATES_BATCH_MAX_SIZE} parents can be requested at once"
+        )
+    chunk_queries = [
+        await queries.get_states_for_parents(parent_uris[i:i + STATES_BATCH_CHUNK_SIZE])
+        for i in range(0, len(parent_uris), STATES_BATCH_CHUNK_SIZE)
+    ]
+    results = await asyncio.gather(
+        *(__get_query_with_headers_from_request(query, request) for query in chunk_queries)
+    )
+    states: dict[str, dict] = {parent_uri: {} for parent_uri in parent_uris}
+    for result in results:
+        for parent_uri, parent_states in (await utils.map_states(result)).items():
+            if parent_uri in states:
+                states[parent_uri] = parent_states
     return states
 
 
-@app.get("/buildings", response_model=list[models.Building])
-async def get_buildings(request: Request):
-    results = await __get_query_with_headers_from_request(
-        await queries.get_buildings(),
-        request
+def __building_types(value: str) -> list[str]:
+    return value.split(";")
+
+
+__BUILDING_FIELDS = (
+    ("uri", "building"),
+    ("uprn", "uprn_id"),
+    ("types", "building_types", __building_types),
+    ("lat", "lat_literal"),
+    ("lon", "lon_literal"),
+    ("epc_rating", "epc_rating"),
+    ("name", "name"),
+)
+__building_from_binding = utils.field_mapper(*__BUILDING_FIELDS)
+__full_building_from_binding = utils.field_mapper(
+    *__BUILDING_FIELDS,
+    ("sap_points", "sap_points", float),
+    ("postcode", "postcode_literal"),
+    ("address", "line_of_address_literal"),
+)
+
+
+@app.get("/buildings", response_model=list[models.Building | models.PointCluster])
+async def get_buildings(
+    request: Request,
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),  # noqa
+    cursor: str | None = None,
+    bbox: str | None = None,
+    zoom: int | None = Query(default=None, ge=0, le=24),  # noqa
+):
+    """
+    Returns all buildings. Results are streamed, as a JSON array or as newline delimited JSON if the client accepts
+    application/x-ndjson. Pass a limit (and the cursor from the next link) to page through the buildings instead.
+    Pass a bbox ("min_lon,min_lat,max_lon,max_lat") to only return buildings in a viewport, and a zoom level to have
+    them clustered at low zoom levels.
+
+    Responses carry an ETag, and conditional requests for unchanged buildings get a 304. Streamed responses only
+    carry one when DATASET_VERSION_QUERY is set.
+    """
+    if bbox is not None and (limit is not None or cursor is not None):
+        raise HTTPException(status_code=400, detail="bbox cannot be combined with limit or cursor")
+    query = await queries.get_buildings()
+    tag, not_modified = await __precondition(query, request)
+    if not_modified is not None:
+        return not_modified
+    if bbox is not None:
+        buildings = await __get_points_in_bbox_from_request(
+            query,
+            request,
+            bbox,
+            zoom,
+            __building_from_binding,
+        )
+        return __conditional(request, __respond(buildings, list[models.Building | models.PointCluster]), tag, response)
+    if limit is not None or cursor is not None:
+        buildings = await __get_page_with_headers_from_request(
+            queries.get_buildings,
+            "building",
+            request,
+            response,
+            limit,
+            cursor,
+            __building_from_binding,
+        )
+        return __conditional(request, __respond(buildings, list[models.Building], response), tag, response)
+    streamed = await __stream_query_with_headers_from_request(
+        query,
+        request,
+        models.Building,
+        __building_from_binding,
     )
-    buildings = []
-    for st in results["results"]["bindings"]:
-        building = {
-            "uri": st["building"]["value"],
-            "uprn": st["uprn_id"]["value"],
-            "types": st["building_types"]["value"].split(";"),
-            "lat": st["lat_literal"]["value"],
-            "lon": st["lon_literal"]["value"],
-            "epc_rating": st["epc_rating"]["value"],
-            "name": st["name"]["value"],
-        }
-        buildings.append(building)
+    return __conditional(request, streamed, tag, response)
 
-    return buildings
+
+@app.post("/buildings/details", response_model=list[models.FullBuilding])
+async def get_buildings_details(request: Request, batch: models.UprnBatch):
+    """
+    Returns the details of the buildings with the given UPRNs. UPRNs are sent to Jena in chunks of
+    BUILDING_DETAILS_CHUNK_SIZE and the buildings are streamed back as they arrive, as a JSON array or as newline
+    delimited JSON if the client accepts application/x-ndjson.
+    """
+    uprns = list(dict.fromkeys(batch.uprns))
+    if len(uprns) > BUILDING_DETAILS_MAX_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"at most {BUILDING_DETAILS_MAX_SIZE} UPRNs can be requested at once"
+        )
+    chunk_queries = [
+        await queries.get_buildings_details(uprns[i:i + BUILDING_DETAILS_CHUNK_SIZE])
+        for i in range(0, len(uprns), BUILDING_DETAILS_CHUNK_SIZE)
+    ]
+
+    async def bindings():
+        for query in chunk_queries:
+            async for binding in await __stream_bindings_with_headers_from_request(query, request):
+                yield binding
+
+    return await __stream_bindings_to_client(
+        bindings(), request, models.FullBuilding, __full_building_from_binding
+    )
 
 
 @app.get("/buildings/{uprn}", response_model=models.FullBuilding)
@@ -331,62 +1218,25 @@ async def get_building_details(uprn: str, request: Request):
 
     if len(results["results"]["bindings"]) == 0:
         return None
-    st = results["results"]["bindings"][0]
-    building = {
-        "uri": st["building"]["value"],
-        "uprn": st["uprn_id"]["value"],
-        "types": st["building_types"]["value"].split(";"),
-        "lat": st["lat_literal"]["value"],
-        "lon": st["lon_literal"]["value"],
-        "sap_points": float(st["sap_points"]["value"]),
-        "epc_rating": st["epc_rating"]["value"],
-        "postcode": st["postcode_literal"]["value"],
-        "address": st["line_of_address_literal"]["value"],
-        "name": st["name"]["value"],
-    }
-    return building
-
+    return __respond(__full_building_from_binding(results["results"]["bindings"][0]), models.FullBuilding)
 
-graph = Graph()
-graph.parse("./paralog/ont/ies4.ttl")
-graph.parse("./paralog/ont/iesExtensions.ttl")
 
-
-async def __ont_query(query_string):
-    results = graph.query(query_string)
-    with io.StringIO() as f:
-        JSONResultSerializer(results).serialize(f)
-        return json.loads(f.getvalue())
+ontology_index = ontology.load(os.getenv('ONTOLOGY_SNAPSHOT_PATH', ontology.SNAPSHOT_PATH))
 
 
 @app.get("/ontology/class")
 async def get_class(classUri: str):
-    query = (
-        '''
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT ?uri ?superClass
-        WHERE {
-            BIND (URI("''' + classUri + '''") as ?uri)
-            ?uri rdfs:subClassOf ?superClass
-        }
-        '''
-    )
-    results = await utils.aggregate(await __ont_query(query), "uri")
-    return results
+    return ontology_index.get_class(classUri)
 
 
 @app.get("/ontology/superclasses")
 async def get_superclasses(classUris: list[str] = Query()):  # noqa
-    class_uri_str = ", ".join([f"<{value}>" for value in classUris])
-    query = (
-        '''
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT ?uri ?superClass
-        WHERE {
-            ?uri rdfs:subClassOf ?superClass
-            FILTER (?uri in (''' + class_uri_str + '''))
-        }
-        '''
-    )
-    results = await utils.aggregate(await __ont_query(query), "uri")
-    return results
+    return ontology_index.get_superclasses(tuple(classUris))
+
+
+@app.get("/ontology/ancestors", response_model=models.OntologyAncestors)
+async def get_ancestors(classUri: str):
+    """
+    Returns every superclass of a class, following rdfs:subClassOf transitively, nearest first
+    """
+    return __respond({"uri": classUri, "ancestors": ontology_index.get_ancestors(classUri)}, models.OntologyAncestors)
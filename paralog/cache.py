@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache where every entry also has an expiry time.
+
+    Expiry times are on the `time.monotonic` clock. When the cache is full the least recently used entry is
+    evicted. Hit, miss and eviction counts are kept for monitoring.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key, MISSING) is not MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        if self.maxsize <= 0:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is not None and ttl <= 0:
+            return
+        expires_at = float("inf") if ttl is None else time.monotonic() + ttl
+        if key in self._data:
+            self._data.move_to_end(key)
+        self._data[key] = (value, expires_at)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def keys(self) -> list[Hashable]:
+        return list(self._data.keys())
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single call.
+
+    The first caller for a key starts the call, and callers arriving while it is in flight await the same result
+    (or exception). Nothing is kept once the call completes, so results are never stale.
+    """
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def __contains__(self, key: Hashable):
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        # Shielded so that one caller going away does not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "calls": self.calls, "shared": self.shared}
+
+
+class IndexRegistry:
+    """
+    Holds indexes derived from Jena results, such as spatial indexes, keyed by what they were built from.
+
+    Builds are single-flight. Once an index is older than `ttl` it keeps being served while a replacement is built in
+    the background, so callers only wait for the first build of each key.
+    """
+    def __init__(self, maxsize: int = 16, ttl: float = 300.0):
+        self.ttl = ttl
+        self._entries = TTLCache(maxsize=maxsize)
+        self._builds = SingleFlight()
+        self._refreshes: set[asyncio.Task] = set()
+
+    async def get(self, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return await self._builds.do(key, lambda: self.__build(key, build))
+        index, built_at = entry
+        if time.monotonic() - built_at > self.ttl and key not in self._builds:
+            task = asyncio.ensure_future(self._builds.do(key, lambda: self.__build(key, build)))
+            self._refreshes.add(task)
+            task.add_done_callback(self.__refreshed)
+        return index
+
+    async def __build(self, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+        index = await build()
+        self._entries.set(key, (index, time.monotonic()))
+        return index
+
+    def __refreshed(self, task: asyncio.Task):
+        self._refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f'Index refresh failed: {task.exception()}')
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"ttl": self.ttl, **self._entries.stats()}
+
+
+def query_key(query: str, headers: dict | None = None) -> str:
+    """
+    Cache key for a query as run with the given forwarded headers. The identity headers are part of the key so
+    that results filtered by a user's data security labels are never served to another user.
+    """
+    headers = headers or {}
+    digest = hashlib.sha256(query.encode())
+    for name in sorted(headers):
+        digest.update(b"\0" + name.encode() + b"\0" + str(headers[name]).encode())
+    return digest.hexdigest()
+
+
+def parse_ttls(value: str | None) -> dict[str, float]:
+    """
+    Parses per-endpoint TTLs of the form "/assessments=60,/buildings=300"
+    """
+    ttls: dict[str, float] = {}
+    if not value:
+        return ttls
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        endpoint, _, ttl = item.partition("=")
+        ttls[endpoint.strip()] = float(ttl)
+    return ttls
+
+
+class MemoryBackend:
+    """
+    In-process result cache backend
+    """
+    def __init__(self, maxsize: int = 512):
+        self._cache = TTLCache(maxsize=maxsize)
+
+    async def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._cache.set(key, value, ttl=ttl)
+
+    async def invalidate(self, prefix: str = ""):
+        if not prefix:
+            self._cache.clear()
+            return
+        for key in self._cache.keys():
+            if isinstance(key, str) and key.startswith(prefix):
+                self._cache.pop(key)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+class RedisBackend:
+    """
+    Result cache backend shared between processes. Requires the optional redis package.
+    """
+    def __init__(self, url: str, namespace: str = "paralog:results:"):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("A redis result cache requires the redis package, install the 'redis' extra") from e
+        self.namespace = namespace
+        self._client = aioredis.from_url(url)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Any:
+        value = await self._client.get(self.namespace + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self._client.set(self.namespace + key, json.dumps(value), px=int(ttl * 1000))
+
+    async def invalidate(self, prefix: str = ""):
+        keys = [key async for key in self._client.scan_iter(match=self.namespace + prefix + "*")]
+        if keys:
+            await self._client.delete(*keys)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class ResultCache:
+    """
+    Caches Jena query results per endpoint. Endpoints with a TTL of 0 are not cached.
+    """
+    def __init__(
+        self,
+        backend: MemoryBackend | RedisBackend,
+        default_ttl: float = 0.0,
+        endpoint_ttls: dict[str, float] | None = None,
+    ):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.endpoint_ttls = endpoint_ttls or {}
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.endpoint_ttls.get(endpoint, self.default_ttl)
+
+    async def get(self, endpoint: str, key: str) -> Any:
+        if self.ttl_for(endpoint) <= 0:
+            return None
+        try:
+            return await self.backend.get(f"{endpoint}|{key}")
+        except Exception as e:
+            logger.warning(f'Result cache get failed: {e}')
+            return None
+
+    async def set(self, endpoint: str, key: str, value: Any):
+        ttl = self.ttl_for(endpoint)
+        if ttl <= 0:
+            return
+        try:
+            await self.backend.set(f"{endpoint}|{key}", value, ttl)
+        except Exception as e:
+            logger.warning(f'Result cache set failed: {e}')
+
+    async def invalidate(self, endpoint: str | None = None):
+        await self.backend.invalidate(f"{endpoint}|" if endpoint else "")
+
+    async def aclose(self):
+        if isinstance(self.backend, RedisBackend):
+            await self.backend.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "default_ttl": self.default_ttl,
+            "endpoint_ttls": self.endpoint_ttls,
+            **self.backend.stats(),
+        }
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+from collections.abc import Awaitable, Callable
+
+from paralog.cache import SingleFlight, TTLCache
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+logger = logging.getLogger(__name__)
+
+VERSION = "version"
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def version_etag(version: str, *variant: str) -> str:
+    """
+    An ETag for a response derived from the dataset version and whatever else the response depends on (the query,
+    the forwarded headers, the request's parameters), so that it changes when any of them do
+    """
+    return etag("\n".join((version, *variant)).encode())
+
+
+def etag_matches(if_none_match: str | None, tag: str) -> bool:
+    """
+    Whether an If-None-Match header matches an ETag (weak comparison, as for GET requests)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+
+class DatasetVersion:
+    """
+    The version of the dataset, from a probe query answered with a single value (e.g. a modification timestamp or a
+    counter kept up to date by whatever loads the data). The version is cached for `ttl` seconds and concurrent
+    probes share one query, so Jena is probed at most once per `ttl` however many requests arrive.
+
+    The version is None when there is no probe, or when the probe failed or returned no rows, and responses then fall
+    back to ETags hashed from their bodies.
+    """
+    def __init__(self, probe: Callable[[], Awaitable[dict]] | None, ttl: float = 5.0):
+        self.probe = probe
+        self._versions = TTLCache(maxsize=1, ttl=ttl)
+        self._probes = SingleFlight()
+
+    async def get(self) -> str | None:
+        if self.probe is None:
+            return None
+        cached = self._versions.get(VERSION)
+        if cached is None:
+            # Kept in a tuple so that a missing version is cached too
+            cached = (await self._probes.do(VERSION, self.__probe),)
+            self._versions.set(VERSION, cached)
+        return cached[0]
+
+    async def __probe(self) -> str | None:
+        if self.probe is None:
+            return None
+        try:
+            result = await self.probe()
+        except Exception as e:
+            logger.warning(f'Dataset version probe failed: {e}')
+            return None
+        bindings = result.get("results", {}).get("bindings") or []
+        if not bindings or not bindings[0]:
+            logger.warning('Dataset version probe returned no version')
+            return None
+        return next(iter(bindings[0].values()))["value"]
+
+    def clear(self):
+        self._versions.clear()
+
+    def stats(self) -> dict:
+        return {"probe": self.probe is not None, **self._versions.stats(), **self._probes.stats()}
@@ -1,10 +1,14 @@
+import hashlib
 import logging
+import time
 
 import jwt
-import requests
 from fastapi import Request
 from fastapi.responses import JSONResponse
-from jwt import PyJWKClient
+
+from paralog import metrics
+from paralog.cache import MISSING, TTLCache
+from paralog.key_cache import PublicKeyCache
 
 __license__ = """
 Copyright (c) Telicent Ltd.
@@ -20,7 +24,17 @@ class AccessMiddleware:
     """
     Simple middleware to validate and decode tokens
     """
-    def __init__(self, app, jwt_header: str = None, jwks_url: str = None, public_key_url: str = None):
+    def __init__(
+        self,
+        app,
+        jwt_header: str = None,
+        jwks_url: str = None,
+        public_key_url: str = None,
+        key_cache_ttl: float = 300.0,
+        key_min_refresh_interval: float = 10.0,
+        token_cache_size: int = 10000,
+        token_cache_max_ttl: float = 300.0,
+    ):
         self.app = app
         self.jwks_url = jwks_url
         self.public_key_url = public_key_url
@@ -64,6 +78,23 @@ class AccessMiddleware:
             )
             self.run_auth = False
 
+        self.key_cache: PublicKeyCache | None = None
+        if self.run_auth:
+            self.key_cache = PublicKeyCache(
+                jwks_url=self.jwks_url,
+                public_key_url=None if self.jwks_url else self.public_key_url,
+                ttl=key_cache_ttl,
+                min_refresh_interval=key_min_refresh_interval,
+            )
+        # Already verified tokens, keyed by a hash of the encoded token, so that repeated requests with the same
+        # token skip signature verification until the token expires.
+        self.token_cache = TTLCache(maxsize=token_cache_size)
+        self.token_cache_max_ttl = token_cache_max_ttl
+
+    async def aclose(self):
+        if self.key_cache is not None:
+            await self.key_cache.aclose()
+
     async def __call__(self, request: Request, call_next):
         if self.run_auth:
             if self.jwt_header not in request.headers:
@@ -89,31 +120,40 @@ class AccessMiddleware:
         return response
 
     async def validate_token(self, token):
+        start = time.perf_counter()
+        token_hash = hashlib.sha256(token.encode()).digest()
+        data = self.token_cache.get(token_hash, MISSING)
+        if data is not MISSING:
+            metrics.AUTH_CACHED.observe(time.perf_counter() - start)
+            return data
+
         try:
             headers = jwt.get_unverified_header(token)
+            if self.key_cache is None:
+                raise RuntimeError("Token decoding requires either a jwks_url or public_key_url")
             if self.jwks_url is not None:
                 self.logger.debug(
                     "Validating token with jwks_url",
                     extra={'method': 'Authenticator', 'type': 'GENERAL'}
                 )
-                jwks_client = PyJWKClient(self.jwks_url)
-                signing_key = jwks_client.get_signing_key_from_jwt(token)
-                key = signing_key.key
-            elif self.public_key_url is not None:
+            else:
                 self.logger.debug(
                     "Validating token with elb public key",
                     extra={'method': 'Authenticator', 'type': 'GENERAL'}
                 )
-                public_key_ep = "{}{}".format(self.public_key_url, headers['kid'])
-                req = requests.get(public_key_ep)
-                key = req.text
-            else:
-                raise RuntimeError("Token decoding requires either a jwks_url or public_key_url")
+            key = await self.key_cache.get_signing_key(headers.get('kid'))
             data = jwt.decode(token, key, algorithms=[headers['alg']])
         except Exception as e:
             self.logger.error(
                 f'Exception validating token: {str(e)}',
                 extra={'method': 'Authenticator', 'type': 'UNAUTHORIZED'}
             )
+            metrics.AUTH_REJECTED.observe(time.perf_counter() - start)
             raise
+        metrics.AUTH_VERIFIED.observe(time.perf_counter() - start)
+
+        ttl = self.token_cache_max_ttl
+        if isinstance(data.get('exp'), int | float):
+            ttl = min(ttl, data['exp'] - time.time())
+        self.token_cache.set(token_hash, data, ttl=ttl)
         return data
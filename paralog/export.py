@@ -0,0 +1,129 @@
+import json
+
+from paralog.graph import to_rating
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def require_arrow():
+    """
+    Returns the pyarrow module. Raises RuntimeError if the optional arrow extra is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Arrow exports require the pyarrow package, install the 'arrow' extra") from e
+    return pyarrow
+
+
+class DependencyGraph:
+    """
+    The dependency network of an assessment as interned node and edge tables.
+
+    Every node and type URI is stored once. Nodes are numbered in URI order and types are numbered in URI order, so
+    the ids are the same however Jena orders the results. Edges refer to their provider and dependent nodes by id, and
+    each node has all of its types, in type id order.
+    """
+    def __init__(self) -> None:
+        self._node_types: dict[str, set[str]] = {}
+        self._edges: dict[str, tuple[str, str, float | None, str | None]] = {}
+
+    def __len__(self):
+        return len(self._edges)
+
+    def add(self, binding: dict):
+        """
+        Adds one binding of the `get_dependencies_by_assessment` query
+        """
+        provider = binding["providerNode"]["value"]
+        dependent = binding["dependentNode"]["value"]
+        self._node_types.setdefault(provider, set()).add(binding["providerNodeType"]["value"])
+        self._node_types.setdefault(dependent, set()).add(binding["dependentNodeType"]["value"])
+        # A dependency has a row per type of its provider and dependent, so it is only added once
+        dependency = binding["dependencyUri"]["value"]
+        if dependency in self._edges:
+            return
+        rating = binding.get("criticalityRating")
+        osm_id = binding.get("osmID")
+        self._edges[dependency] = (
+            provider,
+            dependent,
+            to_rating(rating["value"]) if rating is not None else None,
+            osm_id["value"] if osm_id is not None else None,
+        )
+
+    def tables(self) -> tuple[list[str], dict[str, list], dict[str, list]]:
+        """
+        Returns the type dictionary, the node table and the edge table, each table as a dict of columns
+        """
+        types = sorted(set().union(*self._node_types.values()))
+        type_ids = {uri: i for i, uri in enumerate(types)}
+        node_uris = sorted(self._node_types)
+        node_ids = {uri: i for i, uri in enumerate(node_uris)}
+
+        nodes: dict[str, list] = {
+            "uri": node_uris,
+            "types": [sorted(type_ids[node_type] for node_type in self._node_types[uri]) for uri in node_uris],
+        }
+        edges: dict[str, list] = {
+            "uri": [],
+            "provider": [],
+            "dependent": [],
+            "criticalityRating": [],
+            "osmID": [],
+        }
+        for uri, (provider, dependent, rating, osm_id) in sorted(self._edges.items()):
+            edges["uri"].append(uri)
+            edges["provider"].append(node_ids[provider])
+            edges["dependent"].append(node_ids[dependent])
+            edges["criticalityRating"].append(rating)
+            edges["osmID"].append(osm_id)
+        return types, nodes, edges
+
+    def to_json(self) -> bytes:
+        types, nodes, edges = self.tables()
+        return json.dumps({"types": types, "nodes": nodes, "edges": edges}, separators=(",", ":")).encode()
+
+    def to_arrow(self, table: str) -> bytes:
+        """
+        Serialises one of the tables as an Arrow IPC stream. Node types are lists of dictionary encoded types, so the
+        type dictionary travels with the node table.
+        """
+        pa = require_arrow()
+        types, nodes, edges = self.tables()
+        if table == "nodes":
+            offsets = [0]
+            for node_types in nodes["types"]:
+                offsets.append(offsets[-1] + len(node_types))
+            type_ids = [type_id for node_types in nodes["types"] for type_id in node_types]
+            batch = pa.record_batch({
+                "uri": pa.array(nodes["uri"], type=pa.string()),
+                "types": pa.ListArray.from_arrays(
+                    pa.array(offsets, type=pa.int32()),
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(type_ids, type=pa.int32()), pa.array(types, type=pa.string())
+                    ),
+                ),
+            })
+        else:
+            batch = pa.record_batch({
+                "uri": pa.array(edges["uri"], type=pa.string()),
+                "provider": pa.array(edges["provider"], type=pa.int32()),
+                "dependent": pa.array(edges["dependent"], type=pa.int32()),
+                "criticalityRating": pa.array(edges["criticalityRating"], type=pa.float64()),
+                "osmID": pa.array(edges["osmID"], type=pa.string()),
+            })
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
@@ -0,0 +1,220 @@
+import json
+from collections.abc import Awaitable, Callable, Hashable
+
+import numpy as np
+
+from paralog.cache import TTLCache
+from paralog.conditional import etag
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+# Rings are never simplified below this many points (a closed triangle)
+MIN_RING_POINTS = 4
+
+# Simplified versions of a polygon kept, for the most recently used tolerances
+SIMPLIFIED_PER_POLYGON = 4
+
+
+class FloodAreaIndex:
+    """
+    Materialised view of the flood watch areas and their flood areas, serialised once when it is built
+    """
+    def __init__(self, areas: list[dict]):
+        self.areas = areas
+        self.body = json.dumps(areas, separators=(",", ":")).encode()
+        self.etag = etag(self.body)
+        self.polygon_uris = {area["polygon_uri"] for area in areas}
+        self.polygon_uris.update(
+            flood_area["polygon_uri"] for area in areas for flood_area in area["flood_areas"]
+        )
+
+    def __len__(self):
+        return len(self.areas)
+
+
+class Polygon:
+    """
+    The raw GeoJSON of a polygon as stored in Jena, with its ETag. The GeoJSON is only parsed when it is simplified.
+    """
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = etag(body)
+        self._simplified: dict[float, bytes] = {}
+        self._polygons: list[list[np.ndarray]] | None = None
+
+    @property
+    def polygons(self) -> list[list[np.ndarray]]:
+        """
+        The polygons in the GeoJSON, each as a list of rings (outer ring first) of (lon, lat) rows
+        """
+        if self._polygons is None:
+            self._polygons = polygon_rings(json.loads(self.body))
+        return self._polygons
+
+    def simplified(self, tolerance: float | None) -> bytes:
+        """
+        The GeoJSON simplified to `tolerance` (in the units of its coordinates), cached per tolerance
+        """
+        if not tolerance:
+            return self.body
+        body = self._simplified.get(tolerance)
+        if body is None:
+            geo_json = simplify(json.loads(self.body), tolerance)
+            body = json.dumps(geo_json, separators=(",", ":")).encode()
+            if len(self._simplified) >= SIMPLIFIED_PER_POLYGON:
+                del self._simplified[next(iter(self._simplified))]
+            self._simplified[tolerance] = body
+        return body
+
+
+class PolygonStore:
+    """
+    Cache of flood area polygons, keyed by forwarded identity and polygon URI.
+
+    Polygons missing from the cache are fetched together with one call to `fetch`, which is given the URIs and
+    returns the GeoJSON text of those it found.
+    """
+    def __init__(self, maxsize: int = 4096, ttl: float | None = 3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get_many(
+        self,
+        identity: Hashable,
+        uris: list[str],
+        fetch: Callable[[list[str]], Awaitable[dict[str, str]]],
+    ) -> dict[str, Polygon]:
+        polygons = {}
+        missing = []
+        for uri in uris:
+            polygon = self._cache.get((identity, uri))
+            if polygon is None:
+                missing.append(uri)
+            else:
+                polygons[uri] = polygon
+        if missing:
+            for uri, geo_json in (await fetch(missing)).items():
+                polygon = Polygon(geo_json.encode())
+                self._cache.set((identity, uri), polygon)
+                polygons[uri] = polygon
+        return {uri: polygons[uri] for uri in uris if uri in polygons}
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+def _rings(coordinates: list) -> list[np.ndarray]:
+    rings = []
+    for ring in coordinates:
+        try:
+            points = np.asarray(ring, dtype=np.float64)
+        except (TypeError, ValueError):
+            continue
+        if points.ndim == 2 and points.shape[1] >= 2 and len(points) >= 3:
+            rings.append(points[:, :2])
+    return rings
+
+
+def polygon_rings(geo_json) -> list[list[np.ndarray]]:
+    """
+    Collects every polygon in a GeoJSON object (geometry, feature or collection of either) as a list of rings
+    """
+    if isinstance(geo_json, list):
+        return [polygon for item in geo_json for polygon in polygon_rings(item)]
+    if not isinstance(geo_json, dict):
+        return []
+    geometry_type = geo_json.get("type")
+    if geometry_type == "Polygon":
+        return [_rings(geo_json.get("coordinates") or [])]
+    if geometry_type == "MultiPolygon":
+        return [_rings(polygon) for polygon in geo_json.get("coordinates") or []]
+    polygons = []
+    for key in ("geometry", "geometries", "features"):
+        if key in geo_json:
+            polygons.extend(polygon_rings(geo_json[key]))
+    return polygons
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Simplifies a line by the Ramer-Douglas-Peucker algorithm, with the distances of each span's points from its
+    chord computed together
+    """
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        first, last = points[start], points[end]
+        inner = points[start + 1:end]
+        chord = last - first
+        length = np.hypot(chord[0], chord[1])
+        if length == 0:
+            distances = np.hypot(inner[:, 0] - first[0], inner[:, 1] - first[1])
+        else:
+            distances = np.abs(chord[0] * (inner[:, 1] - first[1]) - chord[1] * (inner[:, 0] - first[0])) / length
+        furthest = int(np.argmax(distances))
+        if distances[furthest] > tolerance:
+            split = start + 1 + furthest
+            keep[split] = True
+            spans.append((start, split))
+            spans.append((split, end))
+    return points[keep]
+
+
+def _simplify_line(line: list, tolerance: float, min_points: int) -> list:
+    if len(line) <= min_points:
+        return line
+    try:
+        points = np.asarray(line, dtype=np.float64)
+    except (TypeError, ValueError):
+        return line
+    # Only x and y are considered, any further dimensions are kept with their points
+    simplified = douglas_peucker(points, tolerance) if points.ndim == 2 and points.shape[1] >= 2 else points
+    if len(simplified) < min_points:
+        return line
+    return simplified.tolist()
+
+
+def _simplify_coordinates(geometry_type: str, coordinates: list, tolerance: float) -> list:
+    if geometry_type == "LineString":
+        return _simplify_line(coordinates, tolerance, 2)
+    if geometry_type == "MultiLineString":
+        return [_simplify_line(line, tolerance, 2) for line in coordinates]
+    if geometry_type == "Polygon":
+        return [_simplify_line(ring, tolerance, MIN_RING_POINTS) for ring in coordinates]
+    if geometry_type == "MultiPolygon":
+        return [[_simplify_line(ring, tolerance, MIN_RING_POINTS) for ring in polygon] for polygon in coordinates]
+    return coordinates
+
+
+def simplify(geo_json, tolerance: float):
+    """
+    Simplifies every line and polygon in a GeoJSON object (geometry, feature or collection of either)
+    """
+    if isinstance(geo_json, list):
+        return [simplify(item, tolerance) for item in geo_json]
+    if not isinstance(geo_json, dict):
+        return geo_json
+    simplified = {}
+    for key, value in geo_json.items():
+        if key == "coordinates" and isinstance(geo_json.get("type"), str):
+            simplified[key] = _simplify_coordinates(geo_json["type"], value, tolerance)
+        elif key in ("geometry", "geometries", "features"):
+            simplified[key] = simplify(value, tolerance)
+        else:
+            simplified[key] = value
+    return simplified
@@ -0,0 +1,148 @@
+import sys
+
+import numpy as np
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+DEPENDENTS = "dependents"
+PROVIDERS = "providers"
+
+
+class Adjacency:
+    """
+    Compressed sparse row adjacency: the neighbours of node i are targets[offsets[i]:offsets[i + 1]], and weights
+    holds the criticality rating of each of those edges.
+    """
+    def __init__(self, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray, size: int):
+        order = np.argsort(sources, kind="stable")
+        self.targets = targets[order]
+        self.weights = weights[order]
+        self.offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=self.offsets[1:])
+
+    def expand(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns every edge out of the given nodes, as (source, target, weight) arrays
+        """
+        starts = self.offsets[nodes]
+        lengths = self.offsets[nodes + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.float64)
+        # Expand each [start, start + length) run into its positions without a Python loop
+        positions = np.arange(total) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.repeat(nodes, lengths), self.targets[positions], self.weights[positions]
+
+
+class DependencyIndex:
+    """
+    In-memory index of a dependency graph, for traversals that would otherwise take one query per hop.
+
+    Node URIs are interned to integer ids and the edges are held in both directions, from providers to their
+    dependents and from dependents to their providers.
+    """
+    def __init__(self, bindings: list[dict]):
+        ids: dict[str, int] = {}
+        seen: set[str] = set()
+        sources = []
+        targets = []
+        weights = []
+        for binding in bindings:
+            # A dependency has a row per type of its provider and dependent in some queries, so keep only one
+            dependency = binding["dependencyUri"]["value"]
+            if dependency in seen:
+                continue
+            seen.add(dependency)
+            sources.append(ids.setdefault(binding["providerNode"]["value"], len(ids)))
+            targets.append(ids.setdefault(binding["dependentNode"]["value"], len(ids)))
+            rating = binding.get("criticalityRating")
+            weights.append(to_rating(rating["value"]) if rating is not None else 0.0)
+
+        self.ids = ids
+        self.uris = list(ids)
+        self.providers = np.array(sources, dtype=np.int64)
+        self.dependents = np.array(targets, dtype=np.int64)
+        self.ratings = np.array(weights, dtype=np.float64)
+        self.adjacency = {
+            DEPENDENTS: Adjacency(self.providers, self.dependents, self.ratings, len(ids)),
+            PROVIDERS: Adjacency(self.dependents, self.providers, self.ratings, len(ids)),
+        }
+
+    def __len__(self):
+        return len(self.uris)
+
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the index: its arrays, and the node URIs and the dict interning them
+        """
+        arrays = [self.providers, self.dependents, self.ratings]
+        for adjacency in self.adjacency.values():
+            arrays += [adjacency.targets, adjacency.weights, adjacency.offsets]
+        uris = sum(sys.getsizeof(uri) for uri in self.uris) + sys.getsizeof(self.uris) + sys.getsizeof(self.ids)
+        return sum(array.nbytes for array in arrays) + uris
+
+    def traverse(self, uri: str, direction: str, depth: int, max_nodes: int) -> tuple[list[dict], bool]:
+        """
+        Breadth first traversal from an asset, returning the assets reached within `depth` hops and whether the
+        result was cut short at `max_nodes`.
+
+        Each asset has its hop distance and the criticality accumulated along the way to it: the sum of the
+        criticality ratings of the dependencies on its most critical shortest path from the starting asset. When the
+        limit is reached part way through a hop, the most critical assets of that hop are kept.
+        """
+        start = self.ids.get(uri)
+        if start is None:
+            return [], False
+        adjacency = self.adjacency[direction]
+
+        distance = np.full(len(self.uris), -1, dtype=np.int64)
+        criticality = np.zeros(len(self.uris), dtype=np.float64)
+        distance[start] = 0
+        frontier = np.array([start], dtype=np.int64)
+        reached: list[np.ndarray] = []
+        count = 0
+        truncated = False
+
+        for hop in range(1, depth + 1):
+            sources, targets, weights = adjacency.expand(frontier)
+            new = distance[targets] < 0
+            if not new.any():
+                break
+            sources, targets, weights = sources[new], targets[new], weights[new]
+            frontier = np.unique(targets)
+            distance[frontier] = hop
+            criticality[frontier] = -np.inf
+            np.maximum.at(criticality, targets, criticality[sources] + weights)
+
+            if count + len(frontier) > max_nodes:
+                order = np.lexsort((frontier, -criticality[frontier]))
+                frontier = frontier[order[:max_nodes - count]]
+                truncated = True
+            reached.append(frontier)
+            count += len(frontier)
+            if truncated:
+                break
+
+        nodes = np.concatenate(reached) if reached else np.empty(0, dtype=np.int64)
+        return [
+            {"uri": self.uris[node], "distance": int(distance[node]), "criticality": float(criticality[node])}
+            for node in nodes
+        ], truncated
+
+
+def to_rating(value) -> float:
+    """
+    A criticality rating as a number, with ratings that are not numbers counted as 0
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
@@ -1,6 +1,10 @@
 import logging
+import time
+from collections.abc import AsyncIterator
 
-from SPARQLWrapper import DIGEST, GET, JSON, POST, SPARQLWrapper
+import httpx
+
+from paralog import metrics, profiling
 
 __license__ = """
 Copyright (c) Telicent Ltd.
@@ -13,9 +17,33 @@ copies or substantial portions of the Software.
 
 logger = logging.getLogger(__name__)
 
+SPARQL_RESULTS_JSON = "application/sparql-results+json"
+
+# Queries longer than this are sent as a form-encoded POST rather than in the URL
+MAX_GET_QUERY_LENGTH = 4096
+
 
 class JenaConnector:
-    def __init__(self, host, port, dataset, protocol="http", user=None, pwd=None):
+    """
+    Non-blocking SPARQL client for Jena/Fuseki.
+
+    A single pooled, keep-alive httpx client is shared by every request. It is created lazily so that it
+    binds to the running event loop, and should be closed with `aclose` on shutdown.
+    """
+    def __init__(
+        self,
+        host,
+        port,
+        dataset,
+        protocol="http",
+        user=None,
+        pwd=None,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 5.0,
+    ):
         self.url = f"{protocol}://{host}:{port}/{dataset}"
         logger.debug(f'Jena initialised: {self.url}')
         self.user = user
@@ -25,47 +53,139 @@ class JenaConnector:
         else:
             logger.debug('Authentication credentials not provided')
 
-    async def __create_sparql(self, endpoint, headers: dict | None =None):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: httpx.AsyncClient | None = None
+        self.in_flight = 0
+        self.requests = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            logger.info('Initialising Jena HTTP client')
+            auth = None
+            if self.user is not None and self.pwd is not None:
+                logger.info('Jena user and pwd provided, setting credentials')
+                auth = httpx.DigestAuth(self.user, self.pwd)
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                auth=auth,
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            logger.info('Closing Jena HTTP client')
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def __build_headers(headers: dict | None, accept: str | None = None) -> dict:
         if not headers:
             logger.debug('Headers not provided, setting to {}')
             headers = {}
-
-        logger.info('Initialising SPARQLWrapper')
-        sparql = SPARQLWrapper(self.url + "/" + endpoint)
-        sparql.setHTTPAuth(DIGEST)
-
-        if self.user is not None and self.pwd is not None:
-            logger.info('Jena user and pwd provided, setting credentials')
-            sparql.setCredentials(self.user, self.pwd)
-
-        sparql.setReturnFormat(JSON)
-
+        request_headers = {}
         for name in headers:
             logger.debug(f'Adding header: {name}')
-            sparql.addCustomHttpHeader(name, headers[name])
-
-        return sparql
-
-    async def get(self, query, headers: dict | None = None):
+            request_headers[name] = headers[name]
+        if accept is not None:
+            request_headers["Accept"] = accept
+        return request_headers
+
+    def __build_query_request(self, query, headers: dict | None, timeout: float | None) -> httpx.Request:
+        request_headers = self.__build_headers(headers, accept=SPARQL_RESULTS_JSON)
+        request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+        if len(query) > MAX_GET_QUERY_LENGTH:
+            return self.client.build_request(
+                "POST", "/query", data={"query": query}, headers=request_headers, timeout=request_timeout
+            )
+        return self.client.build_request(
+            "GET", "/query", params={"query": query}, headers=request_headers, timeout=request_timeout
+        )
+
+    async def get(self, query, headers: dict | None = None, timeout: float | None = None):
         logger.info('Jena getting query')
         logger.debug(f'Jena query: {query}')
 
-        sparql = await self.__create_sparql("query", headers)
-
-        logger.debug('Setting sparql method and query')
-        sparql.setMethod(GET)
-        sparql.setQuery(query)
-
-        logger.debug('Running sparql query and convert')
-        result = sparql.queryAndConvert()
+        logger.debug('Running sparql query')
+        start = time.perf_counter()
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            response = await self.client.send(self.__build_query_request(query, headers, timeout))
+            response.raise_for_status()
+            result = response.json()
+        except Exception:
+            metrics.query_failed(query)
+            raise
+        finally:
+            self.in_flight -= 1
+        seconds, rows = time.perf_counter() - start, len(result.get("results", {}).get("bindings") or [])
+        metrics.observe_query(query, seconds, rows)
+        profiling.record_query(query, seconds, rows)
         logger.debug(f'result: {result}')
         logger.info('Jena returning result')
         return result
 
-    async def post(self, update, headers=None):
-        if not headers:
-            headers = {}
-        sparql = await self.__create_sparql("update", headers)
-        sparql.setMethod(POST)
-        sparql.setQuery(update)
-        return sparql.query()
+    async def stream(self, query, headers: dict | None = None, timeout: float | None = None) -> AsyncIterator[str]:
+        """
+        Runs a query and yields the SPARQL results JSON as text chunks as they arrive, without holding the whole
+        response in memory. See `paralog.streaming.SparqlBindings` for parsing the chunks.
+        """
+        logger.info('Jena streaming query')
+        logger.debug(f'Jena query: {query}')
+
+        start = time.perf_counter()
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            response = await self.client.send(self.__build_query_request(query, headers, timeout), stream=True)
+            try:
+                response.raise_for_status()
+                async for text in response.aiter_text():
+                    yield text
+            finally:
+                await response.aclose()
+        except Exception:
+            metrics.query_failed(query)
+            raise
+        finally:
+            self.in_flight -= 1
+        # Rows are counted as they are parsed, see `metrics.observe_rows`
+        seconds = time.perf_counter() - start
+        metrics.observe_query(query, seconds)
+        profiling.record_query(query, seconds)
+        logger.info('Jena finished streaming result')
+
+    def stats(self) -> dict:
+        """
+        Statistics of the connection pool: its limits, the queries in flight and sent, and the connections open
+        """
+        stats = {
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+        }
+        # httpx does not expose its pool, so the connections are only counted where httpcore's pool can be found
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            stats["connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for connection in connections if connection.is_idle())
+        return stats
+
+    async def post(self, update, headers=None, timeout: float | None = None):
+        request_headers = self.__build_headers(headers)
+        request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+        response = await self.client.post(
+            "/update", data={"update": update}, headers=request_headers, timeout=request_timeout
+        )
+        response.raise_for_status()
+        return response
@@ -0,0 +1,130 @@
+import logging
+import math
+import time
+from typing import Any
+from urllib.parse import quote
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from jwt.exceptions import PyJWKClientError
+
+from paralog.cache import SingleFlight
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+logger = logging.getLogger('paralog.decode_token')
+
+JWKS_FETCH_KEY = "__jwks__"
+
+
+class PublicKeyCache:
+    """
+    Process-wide cache of token signing keys, indexed by `kid`.
+
+    Keys are fetched asynchronously from either a JWKS end-point or a load-balancer public key end-point and kept
+    for `ttl` seconds. An unknown `kid` forces a refresh of the JWKS, at most once every `min_refresh_interval`
+    seconds, and concurrent misses for the same key share a single outbound fetch.
+    """
+    def __init__(
+        self,
+        jwks_url: str | None = None,
+        public_key_url: str | None = None,
+        ttl: float = 300.0,
+        min_refresh_interval: float = 10.0,
+        timeout: float = 10.0,
+    ):
+        if jwks_url is None and public_key_url is None:
+            raise RuntimeError("Token decoding requires either a jwks_url or public_key_url")
+        self.jwks_url = jwks_url
+        self.public_key_url = public_key_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys: dict[str, tuple[Any, float]] = {}
+        # Never refreshed, so the first lookup always fetches however recently the host's monotonic clock started
+        self._last_jwks_refresh = -math.inf
+        self._fetches = SingleFlight()
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def clear(self):
+        self._keys.clear()
+        self._last_jwks_refresh = -math.inf
+
+    async def get_signing_key(self, kid: str | None):
+        if not kid:
+            raise PyJWKClientError("Token has no kid header")
+
+        entry = self._keys.get(kid)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        if self.jwks_url is not None:
+            # A whole key set is fetched at once, so unknown kids only force a refresh every so often
+            if entry is None and time.monotonic() - self._last_jwks_refresh < self.min_refresh_interval:
+                raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+            await self._fetches.do(JWKS_FETCH_KEY, self.__fetch_jwks)
+        else:
+            await self._fetches.do(kid, lambda: self.__fetch_public_key(kid))
+
+        entry = self._keys.get(kid)
+        if entry is None:
+            raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+        return entry[0]
+
+    async def __fetch_jwks(self):
+        logger.debug(
+            f"Fetching signing keys from {self.jwks_url}",
+            extra={'method': 'Authenticator', 'type': 'GENERAL'}
+        )
+        self._last_jwks_refresh = time.monotonic()
+        try:
+            response = await self.client.get(self.jwks_url or '')
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+        except (httpx.HTTPError, ValueError, jwt.exceptions.PyJWKSetError) as e:
+            raise PyJWKClientError(f'Fail to fetch data from the url, err: "{e}"') from e
+
+        expires = time.monotonic() + self.ttl
+        keys = {}
+        for jwk in jwk_set.keys:
+            if jwk.public_key_use in ["sig", None] and jwk.key_id:
+                keys[jwk.key_id] = (jwk.key, expires)
+        # Replace rather than merge so that rotated-out keys are dropped
+        self._keys = keys
+
+    async def __fetch_public_key(self, kid: str):
+        public_key_ep = "{}{}".format(self.public_key_url, quote(kid, safe=''))
+        logger.debug(
+            f"Fetching elb public key from {public_key_ep}",
+            extra={'method': 'Authenticator', 'type': 'GENERAL'}
+        )
+        try:
+            response = await self.client.get(public_key_ep)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise PyJWKClientError(f'Fail to fetch data from the url, err: "{e}"') from e
+
+        try:
+            key: Any = load_pem_public_key(response.content)
+        except ValueError:
+            key = response.text
+        self._keys[kid] = (key, time.monotonic() + self.ttl)
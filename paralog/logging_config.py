@@ -28,6 +28,8 @@ if LOG_STDOUT == 1:
 if LOG_FILE == 1:
     handlers.append('file')
 
+structured_handlers = [f'structured_{handler}' for handler in handlers]
+
 auth_handlers = []
 if AUTH_LOG_STDOUT == 1:
     auth_handlers.append('auth_stdout')
@@ -46,6 +48,11 @@ LOGGING = {
         'auth_with_extras': {
             'format': '{"time": "%(asctime)s", "level": "%(levelname)s", "method": "%(method)s", '
                       '"type": "%(type)s", "message": "%(message)s"}'
+        },
+        # For messages that are themselves JSON objects, e.g. the slow query log
+        'structured': {
+            'format': '{"time": "%(asctime)s", "level": "%(levelname)s", "name": "%(name)s", '
+                      '"message": %(message)s}'
         }
     },
     'handlers': {
@@ -69,6 +76,16 @@ LOGGING = {
             'formatter': 'auth_with_extras',
             'stream': 'ext://sys.stdout'
         },
+        'structured_file': {
+            'class': 'logging.FileHandler',
+            'filename': LOG_FILE_PATH,
+            'formatter': 'structured'
+        },
+        'structured_stdout': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+            'stream': 'ext://sys.stdout'
+        },
     },
     'loggers': {
         'paralog.app': {
@@ -81,6 +98,26 @@ LOGGING = {
             'level': LOG_LEVEL,
             'propagate': False
         },
+        'paralog.cache': {
+            'handlers': handlers,
+            'level': LOG_LEVEL,
+            'propagate': False
+        },
+        'paralog.conditional': {
+            'handlers': handlers,
+            'level': LOG_LEVEL,
+            'propagate': False
+        },
+        'paralog.ontology': {
+            'handlers': handlers,
+            'level': LOG_LEVEL,
+            'propagate': False
+        },
+        'paralog.profiling': {
+            'handlers': structured_handlers,
+            'level': LOG_LEVEL,
+            'propagate': False
+        },
         'paralog.decode_token': {
             'handlers': auth_handlers,
             'level': LOG_LEVEL,
@@ -0,0 +1,181 @@
+import time
+from collections.abc import Callable, Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Label for requests that did not match a route and queries that were not rendered from a template, so that
+# arbitrary paths cannot create new series
+UNMATCHED = "unmatched"
+UNKNOWN = "unknown"
+
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, float("inf"))
+
+# Statistics that only ever increase are exposed as counters, the rest as gauges
+COUNTER_STATS = frozenset({"hits", "misses", "evictions", "expirations", "calls", "shared", "requests"})
+
+registry = CollectorRegistry()
+
+REQUEST_SECONDS = Histogram(
+    "paralog_request_seconds",
+    "Time taken to respond to requests, by route, method and status",
+    ["route", "method", "status"],
+    registry=registry,
+)
+JENA_QUERY_SECONDS = Histogram(
+    "paralog_jena_query_seconds",
+    "Time taken by Jena to answer queries, by query",
+    ["query"],
+    registry=registry,
+)
+JENA_QUERY_ERRORS = Counter(
+    "paralog_jena_query_errors",
+    "Queries that Jena failed to answer, by query",
+    ["query"],
+    registry=registry,
+)
+RESULT_ROWS = Histogram(
+    "paralog_result_rows",
+    "Rows returned by Jena for queries, by query",
+    ["query"],
+    buckets=ROW_BUCKETS,
+    registry=registry,
+)
+AUTH_SECONDS = Histogram(
+    "paralog_auth_verification_seconds",
+    "Time taken to verify access tokens, by whether the token was cached, verified or rejected",
+    ["result"],
+    registry=registry,
+)
+STAGE_SECONDS = Histogram(
+    "paralog_stage_seconds",
+    "Time taken by stages of building responses",
+    ["stage"],
+    registry=registry,
+)
+
+# Series with a fixed set of label values are bound once, up front
+AUTH_CACHED = AUTH_SECONDS.labels("cached")
+AUTH_VERIFIED = AUTH_SECONDS.labels("verified")
+AUTH_REJECTED = AUTH_SECONDS.labels("rejected")
+FLATTEN_SECONDS = STAGE_SECONDS.labels("flatten")
+SERIALISE_SECONDS = STAGE_SECONDS.labels("serialise")
+
+# The others are bound on first use of each label value and kept
+_query_series: dict[str, tuple[Histogram, Histogram, Counter]] = {}
+_request_series: dict[tuple[str, str, int], Histogram] = {}
+
+
+def _query(query) -> tuple[Histogram, Histogram, Counter]:
+    name = getattr(query, "template", UNKNOWN)
+    series = _query_series.get(name)
+    if series is None:
+        series = _query_series[name] = (
+            JENA_QUERY_SECONDS.labels(name),
+            RESULT_ROWS.labels(name),
+            JENA_QUERY_ERRORS.labels(name),
+        )
+    return series
+
+
+def observe_query(query, seconds: float, rows: int | None = None):
+    """
+    Records the time Jena took to answer a query, labelled with the name of the template it was rendered from, and
+    the number of rows it returned if known
+    """
+    query_seconds, query_rows, _ = _query(query)
+    query_seconds.observe(seconds)
+    if rows is not None:
+        query_rows.observe(rows)
+
+
+def observe_rows(query, rows: int):
+    _query(query)[1].observe(rows)
+
+
+def query_failed(query):
+    _query(query)[2].inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request, labelled with its route template (e.g. /buildings/{uprn}) rather than its
+    path. Streamed responses are timed until their last chunk has been sent.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", UNMATCHED)
+            key = (route, scope["method"], status)
+            series = _request_series.get(key)
+            if series is None:
+                series = _request_series[key] = REQUEST_SECONDS.labels(route, scope["method"], str(status))
+            series.observe(time.perf_counter() - start)
+
+
+class StatsCollector(Collector):
+    """
+    Exposes the `stats()` of caches and connection pools, read when metrics are collected. Each source returns a
+    dict of stats per instance, e.g. {"results": {"hits": 10, ...}}, and each numeric stat becomes a metric named
+    `<prefix>_<stat>` labelled with the instance.
+    """
+    def __init__(self, prefix: str, label: str):
+        self.prefix = prefix
+        self.label = label
+        self.sources: dict[str, Callable[[], dict[str, dict]]] = {}
+
+    def collect(self) -> Iterator[Metric]:
+        families: dict[str, CounterMetricFamily | GaugeMetricFamily] = {}
+        for source in self.sources.values():
+            for instance, stats in source().items():
+                for stat, value in stats.items():
+                    if isinstance(value, bool) or not isinstance(value, int | float):
+                        continue
+                    family = families.get(stat)
+                    if family is None:
+                        name = f"{self.prefix}_{stat}"
+                        if stat in COUNTER_STATS:
+                            family = CounterMetricFamily(name, f"{stat} of each {self.label}", labels=[self.label])
+                        else:
+                            family = GaugeMetricFamily(name, f"{stat} of each {self.label}", labels=[self.label])
+                        families[stat] = family
+                    family.add_metric([instance], value)
+        yield from families.values()
+
+
+caches = StatsCollector("paralog_cache", "cache")
+pools = StatsCollector("paralog_pool", "pool")
+registry.register(caches)
+registry.register(pools)
+
+
+def render() -> bytes:
+    return generate_latest(registry)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 __license__ = """
 Copyright (c) Telicent Ltd.
@@ -78,6 +78,60 @@ class Asset(BaseModel):
     dependentCriticalitySum: float | None = None
 
 
+class ImpactedAsset(BaseModel):
+    """
+    An asset reached by an impact traversal, with its distance in hops and the criticality accumulated on the way
+    """
+    uri: str
+    distance: int
+    criticality: float
+
+
+class Impact(BaseModel):
+    """
+    The assets that (transitively) depend on, or are depended on by, an asset
+    """
+    uri: str
+    direction: str
+    depth: int
+    truncated: bool
+    assets: list[ImpactedAsset]
+
+
+class AssetMetrics(BaseModel):
+    """
+    Network metrics of an asset within an assessment's dependency network
+    """
+    uri: str
+    dependentCount: int
+    dependentCriticalitySum: float
+    providerCount: int
+    providerCriticalitySum: float
+    betweenness: float
+    component: int
+
+
+class AssessmentMetrics(BaseModel):
+    """
+    Network metrics of every asset in an assessment's dependency network
+    """
+    assessment: str
+    nodes: int
+    edges: int
+    components: int
+    betweennessSamples: int
+    assets: list[AssetMetrics]
+
+
+class NetworkComponent(BaseModel):
+    """
+    A weakly connected component of an assessment's dependency network
+    """
+    component: int
+    size: int
+    assets: list[str]
+
+
 class Person(BaseModel):
     """
     Wrapper object for ies:Person
@@ -99,6 +153,21 @@ class FloodWatchArea(BaseModel):
     flood_areas: list[FloodArea]
 
 
+class PolygonBatch(BaseModel):
+    """
+    The URIs of the flood area polygons to fetch in one request, optionally simplified to a tolerance in degrees
+    """
+    uris: list[str]
+    tolerance: float | None = Field(default=None, gt=0)
+
+
+class StateBatch(BaseModel):
+    """
+    The URIs of the parents (e.g. assets or buildings) to fetch the states of in one request
+    """
+    parent_uris: list[str]
+
+
 class Building(BaseModel):
     uri: str
     uprn: str
@@ -113,3 +182,34 @@ class FullBuilding(Building):
     postcode: str
     address: str
     sap_points: float
+
+
+class UprnBatch(BaseModel):
+    """
+    The UPRNs of the buildings to fetch in one request
+    """
+    uprns: list[str]
+
+
+class PointCluster(BaseModel):
+    """
+    A cluster of points (e.g. buildings or assets) returned in place of the points themselves at low zoom levels
+    """
+    lat: float
+    lon: float
+    count: int
+
+
+class OntologyAncestors(BaseModel):
+    """
+    All of the superclasses of an ontology class, nearest first
+    """
+    uri: str
+    ancestors: list[str]
+
+
+class AssetBatch(BaseModel):
+    """
+    The URIs of the assets to fetch in one request
+    """
+    uris: list[str]
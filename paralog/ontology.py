@@ -0,0 +1,165 @@
+import argparse
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from collections import deque
+from typing import TYPE_CHECKING
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+if TYPE_CHECKING:
+    from rdflib import Graph
+
+logger = logging.getLogger(__name__)
+
+ONTOLOGY_FILES = ("./paralog/ont/ies4.ttl", "./paralog/ont/iesExtensions.ttl")
+SNAPSHOT_PATH = "./paralog/ont/ontology.snapshot"
+SNAPSHOT_VERSION = 1
+
+
+class OntologyIndex:
+    """
+    Precomputed rdfs:subClassOf hierarchy of the (static) ontology.
+
+    Direct superclasses and subclasses and the transitive closure of superclasses are computed once, so every lookup
+    is a dict access rather than a SPARQL query over the graph.
+    """
+    def __init__(self, superclasses: dict[str, tuple[str, ...]]):
+        self.superclasses = superclasses
+
+        subclasses: dict[str, list[str]] = {}
+        for uri, parents in superclasses.items():
+            for parent in parents:
+                subclasses.setdefault(parent, []).append(uri)
+        self.subclasses = {uri: tuple(children) for uri, children in subclasses.items()}
+
+        self.ancestors = {uri: self.__ancestors(uri) for uri in superclasses}
+
+    @classmethod
+    def from_graph(cls, graph: "Graph") -> "OntologyIndex":
+        from rdflib import RDFS
+
+        superclasses: dict[str, list[str]] = {}
+        for uri, parent in graph.subject_objects(RDFS.subClassOf):
+            parents = superclasses.setdefault(str(uri), [])
+            if str(parent) not in parents:
+                parents.append(str(parent))
+        return cls({uri: tuple(parents) for uri, parents in superclasses.items()})
+
+    def __ancestors(self, uri: str) -> tuple[str, ...]:
+        """
+        All superclasses of a class, nearest first (breadth first), tolerating cycles in the hierarchy
+        """
+        seen = {uri}
+        ancestors = []
+        queue = deque(self.superclasses.get(uri, ()))
+        while queue:
+            parent = queue.popleft()
+            if parent in seen:
+                continue
+            seen.add(parent)
+            ancestors.append(parent)
+            queue.extend(self.superclasses.get(parent, ()))
+        return tuple(ancestors)
+
+    def get_class(self, uri: str) -> dict:
+        """
+        Direct superclasses of a class, as `{uri: {"superClass": [...]}}`
+        """
+        return self.get_superclasses((uri,))
+
+    @functools.lru_cache(maxsize=4096)  # noqa: B019 - the index lives for the lifetime of the process
+    def get_superclasses(self, uris: tuple[str, ...]) -> dict:
+        return {
+            uri: {"superClass": list(self.superclasses[uri])}
+            for uri in uris
+            if uri in self.superclasses
+        }
+
+    def get_ancestors(self, uri: str) -> list[str]:
+        return list(self.ancestors.get(uri, ()))
+
+
+def fingerprint(paths: tuple[str, ...] = ONTOLOGY_FILES) -> str:
+    """
+    Hash of the ontology files' contents, used to tell whether a snapshot is stale
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def parse(paths: tuple[str, ...] = ONTOLOGY_FILES) -> OntologyIndex:
+    from rdflib import Graph
+
+    graph = Graph()
+    for path in paths:
+        graph.parse(path)
+    return OntologyIndex.from_graph(graph)
+
+
+def write_snapshot(
+    index: OntologyIndex, snapshot_path: str = SNAPSHOT_PATH, paths: tuple[str, ...] = ONTOLOGY_FILES
+):
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fingerprint(paths),
+        "superclasses": index.superclasses,
+    }
+    # Each writer has its own temporary file, so workers starting together never write to the same file and the
+    # snapshot is only ever replaced by a complete one
+    f = tempfile.NamedTemporaryFile(
+        "wb", dir=os.path.dirname(os.path.abspath(snapshot_path)), prefix=".ontology-", suffix=".tmp", delete=False
+    )
+    try:
+        with f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, snapshot_path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+
+def load(snapshot_path: str = SNAPSHOT_PATH, paths: tuple[str, ...] = ONTOLOGY_FILES) -> OntologyIndex:
+    """
+    Loads the ontology index from its snapshot, falling back to parsing the Turtle files (and trying to refresh the
+    snapshot) when the snapshot is missing, cannot be read or was built from different files.
+    """
+    current = fingerprint(paths)
+    try:
+        with open(snapshot_path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") == SNAPSHOT_VERSION and data.get("fingerprint") == current:
+            logger.info('Loaded ontology snapshot')
+            return OntologyIndex(data["superclasses"])
+        logger.warning('Ontology snapshot is stale, parsing ontology files')
+    except Exception as e:
+        # Anything wrong with the snapshot (missing, truncated, written by another version) means rebuilding it
+        logger.warning(f'Ontology snapshot could not be loaded ({e!r}), parsing ontology files')
+
+    index = parse(paths)
+    try:
+        write_snapshot(index, snapshot_path, paths)
+    except OSError as e:
+        logger.debug(f'Could not write ontology snapshot: {e}')
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles the ontology into a snapshot that loads at startup")
+    parser.add_argument("--output", default=SNAPSHOT_PATH, help="where to write the snapshot")
+    args = parser.parse_args()
+    write_snapshot(parse(), args.output)
+    print(f"Ontology snapshot written to {args.output}")
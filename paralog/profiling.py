@@ -0,0 +1,201 @@
+import collections
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+# Slow queries are logged as JSON objects, see the "structured" formatter in logging_config
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "unknown"
+
+# Distinct stacks kept by the sampler, further stacks are counted together
+MAX_STACKS = 10_000
+OTHER_STACKS = "[other]"
+
+
+def fingerprint(query) -> tuple[str, str]:
+    """
+    The name of the template a query was rendered from and a hash of its parameters, which identify the query
+    without logging its parameters (e.g. URIs) themselves
+    """
+    params = getattr(query, "params", None)
+    if params is None:
+        return UNKNOWN, hashlib.sha256(str(query).encode()).hexdigest()[:16]
+    text = json.dumps(params, sort_keys=True, default=str)
+    return getattr(query, "template", UNKNOWN), hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class RequestTrace:
+    """
+    The queries sent to Jena while handling a request, as [query, seconds, rows] entries
+    """
+    __slots__ = ("queries",)
+
+    def __init__(self) -> None:
+        self.queries: list[list] = []
+
+
+_trace: contextvars.ContextVar[RequestTrace | None] = contextvars.ContextVar("paralog_request_trace", default=None)
+
+
+def record_query(query, seconds: float, rows: int | None = None):
+    """
+    Records a query answered by Jena against the current request, if there is one
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace.queries.append([query, seconds, rows])
+
+
+def record_rows(query, rows: int):
+    """
+    Records the rows of a streamed query, which are only known once it has been read
+    """
+    trace = _trace.get()
+    if trace is not None:
+        for entry in reversed(trace.queries):
+            if entry[0] is query:
+                entry[2] = rows
+                return
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of every thread every `interval` seconds while at least one sampled request is in
+    flight, counting identical stacks. The counts are read in collapsed stack format ("outer;inner count" lines),
+    which flame graph tools such as flamegraph.pl and speedscope read directly.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self._stacks: collections.Counter[str] = collections.Counter()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        with self._lock:
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.__run, name="paralog-stack-sampler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def stop(self):
+        with self._lock:
+            self._active -= 1
+
+    def __run(self) -> None:
+        own = threading.get_ident()
+        names: dict[int | None, str] = {}
+        while True:
+            with self._lock:
+                while self._active == 0:
+                    self._wake.wait()
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident != own:
+                    self.__count(names.get(ident, str(ident)), frame)
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def __count(self, thread_name: str, frame):
+        functions = []
+        while frame is not None:
+            code = frame.f_code
+            functions.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+            frame = frame.f_back
+        functions.append(thread_name)
+        stack = ";".join(reversed(functions))
+        if stack not in self._stacks and len(self._stacks) >= MAX_STACKS:
+            stack = OTHER_STACKS
+        self._stacks[stack] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def clear(self):
+        self._stacks.clear()
+        self.samples = 0
+
+    def stats(self) -> dict:
+        return {"active": self._active, "samples": self.samples, "stacks": len(self._stacks)}
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware tracing the Jena queries of each request for the slow query log and, for a sampled fraction of
+    requests, running the stack sampler.
+
+    When a query takes at least `slow_query_seconds`, or the whole request does, a record is logged for each of the
+    request's queries with its fingerprint, Jena time and rows, and the request's post-processing time (the time not
+    spent waiting for Jena).
+    """
+    def __init__(
+        self,
+        app,
+        slow_query_seconds: float | None = 1.0,
+        sample_rate: float = 0.0,
+        sampler: StackSampler | None = None,
+    ):
+        self.app = app
+        self.slow_query_seconds = slow_query_seconds
+        self.sample_rate = sample_rate
+        self.sampler = sampler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace() if self.slow_query_seconds is not None else None
+        token = _trace.set(trace)
+        sampler = self.sampler if self.sample_rate > 0 and random.random() < self.sample_rate else None
+        if sampler is not None:
+            sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            if sampler is not None:
+                sampler.stop()
+            _trace.reset(token)
+            if trace is not None and trace.queries:
+                self.__log_if_slow(scope, trace, elapsed)
+
+    def __log_if_slow(self, scope, trace: RequestTrace, elapsed: float):
+        threshold = self.slow_query_seconds or 0.0
+        if elapsed < threshold and all(seconds < threshold for _, seconds, _ in trace.queries):
+            return
+        jena_seconds = sum(seconds for _, seconds, _ in trace.queries)
+        route = getattr(scope.get("route"), "path", scope.get("path"))
+        for query, seconds, rows in trace.queries:
+            template, params_hash = fingerprint(query)
+            logger.warning(json.dumps({
+                "route": route,
+                "method": scope["method"],
+                "query": template,
+                "params_hash": params_hash,
+                "fingerprint": f"{template}:{params_hash}",
+                "jena_ms": round(seconds * 1000, 3),
+                "rows": rows,
+                "post_processing_ms": round(max(elapsed - jena_seconds, 0) * 1000, 3),
+                "request_ms": round(elapsed * 1000, 3),
+            }))
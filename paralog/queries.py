@@ -1,3 +1,5 @@
+from paralog.templates import QueryTemplate, RenderedQuery
+
 __license__ = """
 Copyright (c) Telicent Ltd.
 
@@ -23,11 +25,39 @@ PREFIX ndt: <http://nationaldigitaltwin.gov.uk/ontology#>
 PREFIX iesuncertainty: <http://ies.data.gov.uk/ontology/ies_uncertainty_proposal/v2.0#>
 """
 
+# States have EPC ratings among their types, which are the types in this namespace
+EPC_NAMESPACE = "http://gov.uk/government/organisations/department-for-levelling-up-housing-and-communities/ontology/epc#"
 
-async def get_all_assessments():
-    return (
-        PREFIXES
-        + """
+
+# Fragments spliced into the queries below
+EMPTY = QueryTemplate("empty", "").render()
+TYPE_FILTER = QueryTemplate("type_filter", "FILTER (?{{var:var}} IN ({{types:iri_list}}))")
+KEY_FILTER = QueryTemplate("key_filter", "FILTER (STR(?{{var:var}}) > {{after:literal}})")
+PAGE = QueryTemplate("page", "ORDER BY ?{{var:var}}\n        LIMIT {{limit:int}}")
+ORDER_BY = QueryTemplate("order_by", "ORDER BY ?{{var:var}}")
+BIND_URI = QueryTemplate("bind_uri", "BIND ({{uri:iri}} as ?{{var:var}})")
+VALUES_URIS = QueryTemplate("values_uris", "VALUES ?{{var:var}} { {{uris:iri_values}} }")
+
+
+def _type_filter(var: str, types: list[str] | None) -> RenderedQuery:
+    if not types:
+        return EMPTY
+    # Sorted so that the same types in any order give the same query (and result cache key)
+    return TYPE_FILTER.render(var=var, types=sorted(set(types)))
+
+
+def _page(key_var: str, limit: int | None, after: str | None) -> tuple[RenderedQuery, RenderedQuery]:
+    """
+    Returns the keyset filter and the solution modifiers for one page of results, ordered by `key_var` and starting
+    after the key `after`. Both are empty when not paging.
+    """
+    if limit is None:
+        return EMPTY, EMPTY
+    key_filter = KEY_FILTER.render(var=key_var, after=after) if after else EMPTY
+    return key_filter, PAGE.render(var=key_var, limit=int(limit))
+
+
+ALL_ASSESSMENTS = QueryTemplate("get_all_assessments", PREFIXES + """
         SELECT ?uri ?name (COUNT(?asset) AS ?numberOfAssessedItems)
         WHERE {
             ?uri a ies:CarverAssessment .
@@ -38,27 +68,18 @@ async def get_all_assessments():
             }
         }
         GROUP BY ?uri ?name
-    """
-    )
+    """)
 
 
-async def get_assets_by_assessment(assessment_uri: str, types: list[str] | None = None):
-    if types is None:
-        types = []
-    if len(types) > 0:
-        types_list = ", ".join([f"<{value}>" for value in types])
-        types_str = "FILTER (?type IN (" + types_list + "))"
-    else:
-        types_str = ""
-    return (
-        PREFIXES
-        + '''
+async def get_all_assessments():
+    return ALL_ASSESSMENTS.render()
+
+
+ASSETS_BY_ASSESSMENT = QueryTemplate("get_assets_by_assessment", PREFIXES + """
         SELECT DISTINCT ?uri ?type ?lat ?lon (COUNT(?dependencyUri) AS ?dependentCount) (SUM(?criticalityRating) AS
         ?dependentCriticalitySum) (COUNT(?part) AS ?partCount)
         WHERE {
-            BIND (URI("'''
-        + assessment_uri
-        + """") as ?assessment)
+            BIND ({{assessment:iri}} as ?assessment)
             BIND(0.0 as ?defaultCrit)
             ?assessment ies:assessed ?uri .
             ?uri rdf:type ?type .
@@ -87,24 +108,30 @@ async def get_assets_by_assessment(assessment_uri: str, types: list[str] | None
             FILTER NOT EXISTS {
                 ?uri a ies:Dependency
             }
-            """
-        + types_str
-        + """
+            {{types_filter:fragment}}
+            {{key_filter:fragment}}
         }
         GROUP BY ?uri ?type ?lat ?lon
-    """
+        {{page:fragment}}
+    """)
+
+
+async def get_assets_by_assessment(
+    assessment_uri: str, types: list[str] | None = None, limit: int | None = None, after: str | None = None
+):
+    key_filter, page = _page("uri", limit, after)
+    return ASSETS_BY_ASSESSMENT.render(
+        assessment=assessment_uri,
+        types_filter=_type_filter("type", types),
+        key_filter=key_filter,
+        page=page,
     )
 
 
-async def get_asset_types_by_assessment(assessment_uri):
-    return (
-            PREFIXES
-            + '''
+ASSET_TYPES_BY_ASSESSMENT = QueryTemplate("get_asset_types_by_assessment", PREFIXES + """
         SELECT ?uri (COUNT(?asset) AS ?assetCount)
         WHERE {
-            BIND (URI("'''
-            + assessment_uri
-            + """") as ?assessment)
+            BIND ({{assessment:iri}} as ?assessment)
             ?assessment ies:assessed ?asset .
             ?asset rdf:type ?uri .
             NOT EXISTS {
@@ -112,30 +139,18 @@ async def get_asset_types_by_assessment(assessment_uri):
             }
         }
         GROUP BY ?uri
-    """
-    )
+    """)
+
+
+async def get_asset_types_by_assessment(assessment_uri):
+    return ASSET_TYPES_BY_ASSESSMENT.render(assessment=assessment_uri)
 
 
-async def get_dependencies_by_assessment(assessment_uri: str, types: list[str] | None = None):
-    if types is None:
-        types = []
-    if len(types) > 0:
-        types_list = ", ".join([f"<{value}>" for value in types])
-        dep_types_str = "FILTER (?dependentNodeType IN (" + types_list + "))"
-        prov_types_str = "FILTER (?providerNodeType IN (" + types_list + "))"
-    else:
-        dep_types_str = ""
-        prov_types_str = ""
-
-    return (
-        PREFIXES
-        + '''
+DEPENDENCIES_BY_ASSESSMENT = QueryTemplate("get_dependencies_by_assessment", PREFIXES + """
         SELECT DISTINCT ?dependencyUri ?providerNode ?providerNodeType
         ?dependentNode ?dependentNodeType ?criticalityRating ?osmID
         WHERE {
-            BIND (URI("'''
-        + assessment_uri
-        + """") as ?assessment)
+            BIND ({{assessment:iri}} as ?assessment)
             ?provider ies:isParticipationOf ?providerNode .
             ?providerNode a ?providerNodeType .
             ?provider ies:isParticipantIn ?dependencyUri .
@@ -152,29 +167,33 @@ async def get_dependencies_by_assessment(assessment_uri: str, types: list[str] |
                 ?osmIDobj a ies:OpenStreetmapIdentifier .
                 ?osmIDobj ies:representationValue ?osmID .
             }
-            """
-        + dep_types_str
-        + """
-            """
-        + prov_types_str
-        + """
+            {{dependent_types_filter:fragment}}
+            {{provider_types_filter:fragment}}
+            {{key_filter:fragment}}
         }
-        ORDER BY ?id
-    """
+        {{page:fragment}}
+    """)
+
+
+async def get_dependencies_by_assessment(
+    assessment_uri: str, types: list[str] | None = None, limit: int | None = None, after: str | None = None
+):
+    key_filter, page = _page("dependencyUri", limit, after)
+    return DEPENDENCIES_BY_ASSESSMENT.render(
+        assessment=assessment_uri,
+        dependent_types_filter=_type_filter("dependentNodeType", types),
+        provider_types_filter=_type_filter("providerNodeType", types),
+        key_filter=key_filter,
+        page=page or ORDER_BY.render(var="id"),
     )
 
 
-async def get_asset(asset_uri: str):
-    return (
-        PREFIXES
-        + '''
+ASSET = QueryTemplate("get_asset", PREFIXES + """
         SELECT DISTINCT ?uri ?assetType ?name ?osmID ?lat ?lon ?desc ?wikipediaPage
         ?webPage ?address (COUNT(?dependencyUri) AS ?dependentCount) (SUM(?criticalityRating)
         AS ?dependentCriticalitySum)
         WHERE {
-            BIND (URI("'''
-        + asset_uri
-        + """") as ?uri)
+            {{uri_clause:fragment}}
             ?uri a ?assetType
             OPTIONAL {
                 ?uri ies:isIdentifiedBy ?osmIDobj .
@@ -224,25 +243,22 @@ async def get_asset(asset_uri: str):
             BIND(COALESCE(?crit, ?defaultCrit) as ?criticalityRating)
         }
         GROUP BY ?uri ?assetType ?name ?osmID ?lat ?lon ?desc ?wikipediaPage ?webPage ?address
-    """
-    )
+    """)
 
 
-async def get_dependencies(asset_uri: str, direction: str):
-    if direction == "providers":
-        bind_str = f'BIND (URI("{asset_uri}") as ?dependentNode)'
-    else:
-        bind_str = f'BIND (URI("{asset_uri}") as ?providerNode)'
-
-    return (
-        PREFIXES
-        + """
+async def get_asset(asset_uri: str):
+    return ASSET.render(uri_clause=BIND_URI.render(uri=asset_uri, var="uri"))
+
+
+async def get_assets(asset_uris: list[str]):
+    return ASSET.render(uri_clause=VALUES_URIS.render(uris=asset_uris, var="uri"))
+
+
+DEPENDENCIES = QueryTemplate("get_dependencies", PREFIXES + """
         SELECT ?dependentNode ?dependentNodeType ?dependencyUri ?criticalityRating
         ?osmID ?providerNode ?providerNodeType ?dependentName ?providerName
         WHERE {
-            """
-        + bind_str
-        + """
+            {{asset_clause:fragment}}
             ?provider ies:isParticipationOf ?providerNode .
             ?providerNode a ?providerNodeType .
             ?provider ies:isParticipantIn ?dependencyUri .
@@ -266,19 +282,38 @@ async def get_dependencies(asset_uri: str, direction: str):
                 ?providerNode <http://telicent.io/ontology/primaryName> ?providerName .
             }
         }
-    """
-    )
+    """)
 
 
-async def get_asset_parts(assetUri: str):
-    return (
-        PREFIXES
-        + '''
+async def get_dependencies(asset_uri: str, direction: str):
+    node = "dependentNode" if direction == "providers" else "providerNode"
+    return DEPENDENCIES.render(asset_clause=BIND_URI.render(uri=asset_uri, var=node))
+
+
+ALL_DEPENDENCIES = QueryTemplate("get_all_dependencies", PREFIXES + """
+        SELECT DISTINCT ?dependencyUri ?providerNode ?dependentNode ?criticalityRating
+        WHERE {
+            ?provider ies:isParticipationOf ?providerNode .
+            ?provider ies:isParticipantIn ?dependencyUri .
+            ?provider a ies:Provider .
+            ?dependent ies:isParticipantIn ?dependencyUri .
+            ?dependent a ies:Dependent .
+            ?dependent ies:isParticipationOf  ?dependentNode .
+            OPTIONAL {
+                ?dependencyUri ies:criticalityRating ?criticalityRating
+            }
+        }
+    """)
+
+
+async def get_all_dependencies():
+    return ALL_DEPENDENCIES.render()
+
+
+ASSET_PARTS = QueryTemplate("get_asset_parts", PREFIXES + """
         SELECT DISTINCT ?uri ?lat1 ?lon1 ?lat2 ?lon2 ?id ?type
         WHERE {
-            BIND (URI("'''
-        + assetUri
-        + """") as ?assetUri)
+            BIND ({{asset:iri}} as ?assetUri)
             ?uri rdf:type ?type .
             ?uri ies:isPartOf ?assetUri.
             OPTIONAL {
@@ -300,18 +335,17 @@ async def get_asset_parts(assetUri: str):
             FILTER (?loc1 != ?loc2)
     }
         ORDER BY ?uri
-    """
-    )
+    """)
 
-async def get_residents(asset_uri):
-   return (
-        PREFIXES
-        + '''
+
+async def get_asset_parts(assetUri: str):
+    return ASSET_PARTS.render(asset=assetUri)
+
+
+RESIDENTS = QueryTemplate("get_residents", PREFIXES + """
         SELECT DISTINCT ?uri ?type ?name
         WHERE {
-            BIND (URI("'''
-        + asset_uri
-        + """") as ?assetUri)
+            BIND ({{asset:iri}} as ?assetUri)
             ?residentState ies:isStateOf ?uri .
             ?residentState ies:residesIn ?assetUri .
             ?uri rdf:type ?type .
@@ -321,57 +355,51 @@ async def get_residents(asset_uri):
             }
         }
         ORDER BY ?uri
-    """
-    )
+    """)
 
 
-async def get_participations(asset_uri):
-    return (
-        PREFIXES
-        + '''
+async def get_residents(asset_uri):
+    return RESIDENTS.render(asset=asset_uri)
+
+
+PARTICIPATIONS = QueryTemplate("get_participations", PREFIXES + """
         SELECT DISTINCT ?participationType ?event ?eventType
         WHERE {
-            BIND (URI("'''
-        + asset_uri
-        + """") as ?assetUri)
+            BIND ({{asset:iri}} as ?assetUri)
             ?participation ies:isParticipationOf ?assetUri .
             ?participation rdf:type ?participationType .
             ?participation ies:isParticipantIn ?event .
             ?event rdf:type ?eventType .
         }
         ORDER BY ?uri
-    """
-    )
+    """)
 
 
-async def get_participants(event_uri):
-    return (
-        PREFIXES
-        + '''
+async def get_participations(asset_uri):
+    return PARTICIPATIONS.render(asset=asset_uri)
+
+
+PARTICIPANTS = QueryTemplate("get_participants", PREFIXES + """
         SELECT DISTINCT ?participationType ?asset ?assetType
         WHERE {
-            BIND (URI("'''
-        + event_uri
-        + """") as ?event)
+            BIND ({{event:iri}} as ?event)
             ?participation ies:isParticipationOf ?asset .
             ?participation rdf:type ?participationType .
             ?participation ies:isParticipantIn ?event .
             ?asset rdf:type ?assetType .
         }
         ORDER BY ?uri
-    """
-    )
+    """)
 
 
-async def get_residence(person_uri: str):
-    return (
-        PREFIXES
-        + '''
+async def get_participants(event_uri):
+    return PARTICIPANTS.render(event=event_uri)
+
+
+RESIDENCE = QueryTemplate("get_residence", PREFIXES + """
         SELECT DISTINCT ?uri ?assetType ?name ?osmID ?lat ?lon ?desc ?wikipediaPage ?webPage ?address
         WHERE {
-            BIND (URI("'''
-        + person_uri
-        + """") as ?resident)
+            BIND ({{person:iri}} as ?resident)
             ?residentState ies:isStateOf ?resident .
             ?residentState ies:residesIn ?uri .
             ?uri rdf:type ?assetType .
@@ -413,14 +441,14 @@ async def get_residence(person_uri: str):
             }
         }
         ORDER BY ?residence
-    """
-    )
+    """)
 
 
-async def get_flood_areas():
-    return (
-        PREFIXES
-        + """
+async def get_residence(person_uri: str):
+    return RESIDENCE.render(person=person_uri)
+
+
+FLOOD_AREAS = QueryTemplate("get_flood_areas", PREFIXES + """
         SELECT ?floodWatchArea ?floodWatchAreaName ?geoJsonUri ?floodArea ?floodAreaName ?faGeoJsonUri
         WHERE {
             ?floodWatchArea rdf:type <http://ies.data.gov.uk/ontology/ies4#FloodWatchArea> .
@@ -432,58 +460,65 @@ async def get_flood_areas():
                 ?floodArea  ies:isRepresentedAs ?faGeoJsonUri .
             }
         }
-    """
-    )
+    """)
 
 
-async def get_flood_area_polygon(uri):
-    return (
-        PREFIXES
-        + """
-        SELECT ?geoJsonValue
+async def get_flood_areas():
+    return FLOOD_AREAS.render()
+
+
+FLOOD_AREA_POLYGONS = QueryTemplate("get_flood_area_polygons", PREFIXES + """
+        SELECT ?polygon ?geoJsonValue
         WHERE {
-        <""" + uri + """> ies:representationValue ?geoJsonValue .
+        VALUES ?polygon { {{polygons:iri_values}} }
+        ?polygon ies:representationValue ?geoJsonValue .
         }
-        """
-    )
+        """)
 
 
-async def get_states(uri):
-    return (
-        PREFIXES
-        + """
-        SELECT ?stateUri ?stateType ?starts ?ends ?inPeriod ?repType ?repValue
+async def get_flood_area_polygons(uris: list[str]):
+    return FLOOD_AREA_POLYGONS.render(polygons=uris)
+
+
+# Each facet of a state is matched in its own branch of a UNION, so a state has a row per type, period, start, end and
+# representation rather than a row for every combination of them. Rows are ordered so each state's are adjacent.
+STATES = QueryTemplate("get_states", PREFIXES + """
+        SELECT ?parent ?stateUri ?stateType ?starts ?ends ?inPeriod ?repType ?repValue
         WHERE {
-            ?stateUri ies:isStateOf <""" + uri + """>  .
-            ?stateUri a ?stateType .
-            OPTIONAL {
+            VALUES ?parent { {{parents:iri_values}} }
+            ?stateUri ies:isStateOf ?parent .
+            {
+                ?stateUri a ?stateType .
+            } UNION {
                 ?stateUri ies:inPeriod ?pp .
                 ?pp ies:iso8601PeriodRepresentation ?inPeriod .
-            }
-            OPTIONAL {
+            } UNION {
                 ?startState ies:isStartOf ?stateUri .
                 ?startState ies:inPeriod ?startPP .
                 ?startPP ies:iso8601PeriodRepresentation ?starts .
-            }
-            OPTIONAL {
+            } UNION {
                 ?endState ies:isEndOf ?stateUri .
                 ?endState ies:inPeriod ?endPP .
                 ?endPP ies:iso8601PeriodRepresentation ?ends .
-            }
-            OPTIONAL {
+            } UNION {
                 ?stateUri ies:isRepresentedAs ?repObject .
                 ?repObject rdf:type ?repType .
                 ?repObject ies:representationValue ?repValue
             }
         }
-        """
-    )
+        ORDER BY ?parent ?stateUri
+        """)
+
+
+async def get_states(uri):
+    return STATES.render(parents=(uri,))
 
 
-async def get_buildings():
-    return (
-        PREFIXES
-        + """
+async def get_states_for_parents(uris: list[str]):
+    return STATES.render(parents=uris)
+
+
+BUILDINGS = QueryTemplate("get_buildings", PREFIXES + """
 SELECT
     ?name
     ?building
@@ -513,7 +548,7 @@ WHERE {
 
     ?state ies:isStateOf ?building .
     ?state a ?epc_rating .
-
+    {{key_filter:fragment}}
 }
 GROUP BY
     ?name
@@ -522,67 +557,76 @@ GROUP BY
     ?lat_literal
     ?lon_literal
     ?epc_rating
-    """
-    )
+    {{page:fragment}}
+    """)
+
+
+async def get_buildings(limit: int | None = None, after: str | None = None):
+    key_filter, page = _page("building", limit, after)
+    return BUILDINGS.render(key_filter=key_filter, page=page)
+
+
+BUILDING_DETAILS = QueryTemplate("get_building_details", PREFIXES + """
+SELECT
+    ?name
+    ?uprn_id
+    ?building
+    (GROUP_CONCAT(DISTINCT ?building_type; SEPARATOR="; ") AS ?building_types)
+    ?inspection_date_literal
+    ?epc_rating
+    ?sap_points
+    ?line_of_address_literal
+    ?postcode_literal
+    ?lat_literal
+    ?lon_literal
+WHERE {
+    VALUES ?uprn_id { {{uprns:literal_values}} }
+    ?uprn ies:representationValue ?uprn_id .
+    ?building ies:isIdentifiedBy ?uprn .
+    ?building telicent:primaryName ?name .
+    ?building rdf:type ?building_type.
+    ?building ies:inLocation ?address .
+    ?address ies:isIdentifiedBy ?postcode .
+    ?postcode rdf:type ies:PostalCode .
+    ?postcode ies:representationValue ?postcode_literal .
+    ?address ies:isIdentifiedBy ?line_of_address .
+    ?line_of_address rdf:type ies:FirstLineOfAddress .
+    ?line_of_address ies:representationValue ?line_of_address_literal .
+    OPTIONAL {
+        ?building ies:inLocation ?geopoint .
+        ?geopoint rdf:type ies:GeoPoint .
+        ?geopoint ies:isIdentifiedBy ?lat .
+        ?lat rdf:type ies:Latitude .
+        ?lat ies:representationValue ?lat_literal .
+        ?geopoint ies:isIdentifiedBy ?lon .
+        ?lon rdf:type ies:Longitude .
+        ?lon ies:representationValue ?lon_literal .
+    }
+    ?state ies:isStateOf ?building .
+    ?state ies:inPeriod ?inspection_date .
+    ?inspection_date ies:iso8601PeriodRepresentation ?inspection_date_literal .
+    ?state a ?epc_rating .
+    FILTER(STRSTARTS(STR(?epc_rating), {{epc_namespace:literal}}))
+    ?state ies:hasCharacteristic ?quantity .
+    ?quantity qudt:value ?sap_points .
+}
+GROUP BY
+    ?name
+    ?uprn_id
+    ?building
+    ?inspection_date_literal
+    ?epc_rating
+    ?sap_points
+    ?line_of_address_literal
+    ?postcode_literal
+    ?lat_literal
+    ?lon_literal
+    """)
 
 
 async def get_building(id):
-    query = (
-        "{p}"
-        "SELECT "
-        "?name "
-        "({uri} as ?uprn_id) "
-        "?building "
-        '(GROUP_CONCAT(DISTINCT ?building_type; SEPARATOR="; ") AS ?building_types) '
-        "?inspection_date_literal "
-        "?epc_rating "
-        "?sap_points "
-        "?line_of_address_literal "
-        "?postcode_literal "
-        "?lat_literal "
-        "?lon_literal "
-        "WHERE {{"
-        "?building telicent:primaryName ?name . "
-        "?building ies:isIdentifiedBy ?uprn . "
-        "?uprn ies:representationValue '{uri}' . "
-        "?building rdf:type ?building_type. "
-        "?building ies:inLocation ?address . "
-        "?address ies:isIdentifiedBy ?postcode . "
-        "?postcode rdf:type ies:PostalCode . "
-        "?postcode ies:representationValue ?postcode_literal . "
-        "?address ies:isIdentifiedBy ?line_of_address . "
-        "?line_of_address rdf:type ies:FirstLineOfAddress . "
-        "?line_of_address ies:representationValue ?line_of_address_literal . "
-        "OPTIONAL {{"
-        "?building ies:inLocation ?geopoint . "
-        "?geopoint rdf:type ies:GeoPoint . "
-        "?geopoint ies:isIdentifiedBy ?lat . "
-        "?lat rdf:type ies:Latitude . "
-        "?lat ies:representationValue ?lat_literal . "
-        "?geopoint ies:isIdentifiedBy ?lon . "
-        "?lon rdf:type ies:Longitude . "
-        "?lon ies:representationValue ?lon_literal . "
-        "}} "
-        "?state ies:isStateOf ?building . "
-        "?state ies:inPeriod ?inspection_date . "
-        "?inspection_date ies:iso8601PeriodRepresentation ?inspection_date_literal . "
-        "?state a ?epc_rating . "
-        "?state ies:hasCharacteristic ?quantity . "
-        "?quantity qudt:value ?sap_points . "
-        "FILTER ("
-        'regex(str(?epc_rating), "^http://gov.uk/government/organisations/department-for-levelling-up-housing-and-communities/ontology/epc#")'
-        ")"
-        "}}"
-        "GROUP BY"
-        "?name "
-        "?building "
-        "?inspection_date_literal "
-        "?epc_rating "
-        "?sap_points "
-        "?line_of_address_literal "
-        "?postcode_literal "
-        "?lat_literal "
-        "?lon_literal "
-    )
-    query = query.format(uri=id, p=PREFIXES)
-    return query
+    return BUILDING_DETAILS.render(uprns=(id,), epc_namespace=EPC_NAMESPACE)
+
+
+async def get_buildings_details(uprns: list[str]):
+    return BUILDING_DETAILS.render(uprns=uprns, epc_namespace=EPC_NAMESPACE)
@@ -0,0 +1,167 @@
+import functools
+import json
+import math
+import types
+import typing
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    # orjson is an optional extra, without it the standard library encoder is used
+    orjson = None  # type: ignore[assignment]
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialises plain Python data (dicts, lists, strings and numbers) to compact JSON, with orjson when the optional
+    orjson extra is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), allow_nan=False, default=_reject).encode()
+
+
+def _reject(value):
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable")
+
+
+def _to_str(value) -> str:
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_int(value) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f"invalid integer: {value!r}")
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not number.is_integer():
+            raise
+        return int(number)
+
+
+def _to_float(value) -> float | None:
+    if isinstance(value, bool):
+        raise ValueError(f"invalid number: {value!r}")
+    number = float(value)
+    # Like pydantic, infinities and NaN are written as null rather than as invalid JSON
+    return number if math.isfinite(number) else None
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "1"):
+        return True
+    if isinstance(value, str) and value.lower() in ("false", "0"):
+        return False
+    raise ValueError(f"invalid boolean: {value!r}")
+
+
+_SCALARS: dict[Any, Callable[[Any], Any]] = {
+    str: _to_str,
+    int: _to_int,
+    float: _to_float,
+    bool: _to_bool,
+    Any: lambda value: value,
+}
+
+
+class ModelConverter:
+    """
+    Converts a dict to the fields of a pydantic model, coercing values (e.g. the strings in SPARQL bindings to ints
+    and floats) as validating it against the model would, but without building a model instance. Fields missing from
+    the dict take their defaults and keys that are not fields are dropped.
+    """
+    def __init__(self, model: type[BaseModel]):
+        self.model = model
+        self.fields = [
+            (
+                name,
+                converter(field.annotation),
+                field.is_required(),
+                None if field.is_required() else field.get_default(call_default_factory=True),
+            )
+            for name, field in model.model_fields.items()
+        ]
+        self.required = frozenset(name for name, _, required, _ in self.fields if required)
+
+    def __call__(self, row: dict) -> dict:
+        converted = {}
+        for name, convert, required, default in self.fields:
+            value = row.get(name)
+            if value is None:
+                if required:
+                    raise ValueError(f"{self.model.__name__}.{name} is required")
+                converted[name] = default
+            elif convert is _to_str and value.__class__ is str:
+                # Most fields are strings that are already strings, so skip the call
+                converted[name] = value
+            else:
+                converted[name] = convert(value)
+        return converted
+
+
+def _optional(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda value: None if value is None else convert(value)
+
+
+def _models_union(models: list[ModelConverter]) -> Callable[[dict], dict]:
+    def convert(row: dict) -> dict:
+        # The first model whose required fields are all present, e.g. a point cluster rather than a building
+        for model in models:
+            if model.required <= row.keys():
+                return model(row)
+        return models[-1](row)
+    return convert
+
+
+@functools.cache
+def converter(annotation) -> Callable[[Any], Any]:
+    """
+    Returns a function converting plain data to the shape of a type annotation: a pydantic model, a scalar, a list
+    or dict of those, or an optional or union of models. Converters are built once per annotation.
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return ModelConverter(annotation)
+    if annotation in _SCALARS:
+        return _SCALARS[annotation]
+
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is list:
+        convert_item = converter(args[0])
+        return lambda values: [convert_item(value) for value in values]
+    if origin is dict:
+        convert_key, convert_value = converter(args[0]), converter(args[1])
+        return lambda values: {convert_key(key): convert_value(value) for key, value in values.items()}
+    if origin is typing.Union or origin is types.UnionType:
+        members = [arg for arg in args if arg is not type(None)]
+        if len(members) == 1:
+            return _optional(converter(members[0]))
+        if all(isinstance(member, type) and issubclass(member, BaseModel) for member in members):
+            return _optional(_models_union([ModelConverter(member) for member in members]))
+    raise TypeError(f"cannot build a converter for {annotation}")
+
+
+def serialise(content: Any, annotation) -> bytes:
+    """
+    Converts content to the shape of `annotation` and serialises it to JSON
+    """
+    return dumps(converter(annotation)(content))
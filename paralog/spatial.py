@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+# Width and height, in degrees, of a grid cell in the point index
+DEFAULT_CELL_SIZE = 0.01
+
+# Clusters are roughly this many to a 256px map tile
+CLUSTERS_PER_TILE = 4
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    return min(max(value, low), high)
+
+
+def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    """
+    Parses a bounding box of the form "min_lon,min_lat,max_lon,max_lat", clamped to longitudes of [-180, 180] and
+    latitudes of [-90, 90]. Raises ValueError if it is not valid.
+    """
+    parts = bbox.split(",")
+    if len(parts) != 4:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = (float(part) for part in parts)
+    if not all(math.isfinite(v) for v in (min_lon, min_lat, max_lon, max_lat)):
+        raise ValueError("bbox must be finite")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not be greater than its maximums")
+    return _clamp(min_lon, -180, 180), _clamp(min_lat, -90, 90), _clamp(max_lon, -180, 180), _clamp(max_lat, -90, 90)
+
+
+def points_in_rings(lons: np.ndarray, lats: np.ndarray, rings: list[np.ndarray]) -> np.ndarray:
+    """
+    Even-odd ray casting test of points against a polygon's rings (so holes are excluded). Rings are arrays of
+    (lon, lat) rows.
+
+    With the points sorted by latitude, the points level with each edge are found by binary search, so only the
+    point/edge pairs where the ray can cross the edge are ever compared.
+    """
+    order = np.argsort(lats, kind="stable")
+    sorted_lats = lats[order]
+    sorted_lons = lons[order]
+    crossings = np.zeros(len(lats), dtype=np.int64)
+    for ring in rings:
+        x0, y0 = ring[:, 0], ring[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        # A ray from a point crosses an edge only if min(y0, y1) <= y < max(y0, y1)
+        starts = np.searchsorted(sorted_lats, np.minimum(y0, y1), side="left")
+        lengths = np.searchsorted(sorted_lats, np.maximum(y0, y1), side="left") - starts
+        total = int(lengths.sum())
+        if total == 0:
+            continue
+        edges = np.repeat(np.arange(len(ring)), lengths)
+        points = np.arange(total) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        ex0, ey0, ex1, ey1 = x0[edges], y0[edges], x1[edges], y1[edges]
+        crossing_lons = (ex1 - ex0) * (sorted_lats[points] - ey0) / (ey1 - ey0) + ex0
+        crossings += np.bincount(points[sorted_lons[points] < crossing_lons], minlength=len(lats))
+    inside = np.zeros(len(lats), dtype=bool)
+    inside[order] = crossings % 2 == 1
+    return inside
+
+
+def to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class PointIndex:
+    """
+    Uniform grid index over points held in NumPy coordinate arrays.
+
+    Points are sorted by grid cell, so the points in a run of cells along a row of the grid are contiguous and can be
+    found with a binary search. `rows` holds the object for each point, in the same order as the coordinates.
+    """
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, rows: list, cell_size: float = DEFAULT_CELL_SIZE):
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        lats = lats[valid]
+        lons = lons[valid]
+        kept = np.flatnonzero(valid)
+
+        self.cell_size = cell_size
+        self.columns = int(math.ceil(360 / cell_size)) + 1
+        cells = self.__cells(lats, lons)
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.rows = [rows[i] for i in kept[order]]
+        # The extent of the occupied cells, which queries are clamped to
+        if len(self.cells):
+            self.extent = (
+                int((self.cells % self.columns).min()),
+                int(self.cells[0] // self.columns),
+                int((self.cells % self.columns).max()),
+                int(self.cells[-1] // self.columns),
+            )
+
+    @classmethod
+    def from_rows(cls, rows: list[dict], lat_key: str, lon_key: str, cell_size: float = DEFAULT_CELL_SIZE):
+        lats = np.fromiter((to_float(row.get(lat_key)) for row in rows), dtype=np.float64, count=len(rows))
+        lons = np.fromiter((to_float(row.get(lon_key)) for row in rows), dtype=np.float64, count=len(rows))
+        return cls(lats, lons, rows, cell_size=cell_size)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __cells(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        x = np.floor((lons + 180) / self.cell_size).astype(np.int64)
+        y = np.floor((lats + 90) / self.cell_size).astype(np.int64)
+        return y * self.columns + x
+
+    def query(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> np.ndarray:
+        """
+        Returns the positions of the points inside the bounding box
+        """
+        if len(self.rows) == 0:
+            return np.empty(0, dtype=np.int64)
+        x0, y0 = (int(v) for v in np.floor([(min_lon + 180) / self.cell_size, (min_lat + 90) / self.cell_size]))
+        x1, y1 = (int(v) for v in np.floor([(max_lon + 180) / self.cell_size, (max_lat + 90) / self.cell_size]))
+        min_x, min_y, max_x, max_y = self.extent
+        x0, y0, x1, y1 = max(x0, min_x), max(y0, min_y), min(x1, max_x), min(y1, max_y)
+        if x0 > x1 or y0 > y1:
+            return np.empty(0, dtype=np.int64)
+
+        grid_rows = np.arange(y0, y1 + 1, dtype=np.int64) * self.columns
+        starts = np.searchsorted(self.cells, grid_rows + x0, side="left")
+        ends = np.searchsorted(self.cells, grid_rows + x1, side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        if total > len(self.rows) // 2:
+            candidates = np.arange(len(self.rows))
+        else:
+            # Expand each [start, end) run into its positions without a Python loop
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            candidates = np.arange(total) + offsets
+
+        lats = self.lats[candidates]
+        lons = self.lons[candidates]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return candidates[inside]
+
+    def within(self, polygons: list[list[np.ndarray]]) -> np.ndarray:
+        """
+        Returns the positions of the points inside any of the polygons, each given as its rings. Only the points
+        inside a polygon's bounding box are tested against it.
+        """
+        found = []
+        for rings in polygons:
+            if not rings:
+                continue
+            outer = rings[0]
+            candidates = self.query(
+                float(outer[:, 0].min()), float(outer[:, 1].min()), float(outer[:, 0].max()), float(outer[:, 1].max())
+            )
+            inside = points_in_rings(self.lons[candidates], self.lats[candidates], rings)
+            found.append(candidates[inside])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def select(self, positions: np.ndarray) -> list:
+        return [self.rows[i] for i in positions]
+
+    def cluster(self, positions: np.ndarray, zoom: int) -> list[dict]:
+        """
+        Groups the given points into clusters sized for the zoom level, returning the centre and size of each
+        """
+        if len(positions) == 0:
+            return []
+        size = 360 / (2 ** zoom) / CLUSTERS_PER_TILE
+        lats = self.lats[positions]
+        lons = self.lons[positions]
+        keys = np.floor((lats + 90) / size).astype(np.int64) * (int(360 / size) + 1)
+        keys += np.floor((lons + 180) / size).astype(np.int64)
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        lat_sums = np.bincount(inverse, weights=lats)
+        lon_sums = np.bincount(inverse, weights=lons)
+        return [
+            {"lat": float(lat), "lon": float(lon), "count": int(count)}
+            for lat, lon, count in zip(lat_sums / counts, lon_sums / counts, counts, strict=True)
+        ]
@@ -0,0 +1,186 @@
+import json
+import re
+from collections.abc import AsyncIterator, Iterable
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+NDJSON = "application/x-ndjson"
+
+# Responses are flushed to the client in chunks of roughly this many bytes
+CHUNK_SIZE = 64 * 1024
+
+_VARS = re.compile(r'"vars"\s*:\s*')
+_BINDINGS = re.compile(r'"bindings"\s*:\s*\[')
+_SEPARATORS = " \t\r\n,"
+
+
+class BindingsParser:
+    """
+    Incremental parser for SPARQL results JSON.
+
+    Text is fed in as it arrives and each complete binding is returned as soon as it has been read, so only the
+    binding currently being received is ever held in memory.
+    """
+    def __init__(self) -> None:
+        self.vars: list[str] | None = None
+        self.done = False
+        self._buffer = ""
+        self._in_bindings = False
+        self._decoder = json.JSONDecoder()
+
+    def __find_bindings(self, buffer: str) -> int | None:
+        """
+        Reads the head of the document, returning the position of the first binding once it has been reached
+        """
+        if self.vars is None:
+            match = _VARS.search(buffer)
+            if match is not None:
+                try:
+                    self.vars, _ = self._decoder.raw_decode(buffer, match.end())
+                except json.JSONDecodeError:
+                    pass
+        match = _BINDINGS.search(buffer)
+        if match is None:
+            return None
+        self._in_bindings = True
+        return match.end()
+
+    def feed(self, text: str) -> list[dict]:
+        buffer = self._buffer + text
+        pos = 0
+        bindings: list[dict] = []
+
+        if not self._in_bindings:
+            start = self.__find_bindings(buffer)
+            if start is None:
+                self._buffer = buffer
+                return bindings
+            pos = start
+
+        length = len(buffer)
+        while not self.done:
+            while pos < length and buffer[pos] in _SEPARATORS:
+                pos += 1
+            if pos >= length:
+                break
+            if buffer[pos] == "]":
+                self.done = True
+                pos += 1
+                break
+            try:
+                binding, pos = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The binding is incomplete, wait for more text
+                break
+            bindings.append(binding)
+
+        self._buffer = "" if self.done else buffer[pos:]
+        return bindings
+
+    def close(self):
+        """
+        Checks that the whole document has been read once there is no more text. Raises ValueError if it has not,
+        e.g. when the response was cut short or was not SPARQL results JSON at all.
+        """
+        if self.done:
+            return
+        if not self._in_bindings:
+            raise ValueError(f"not a SPARQL results document: {self._buffer[:100]!r}")
+        raise ValueError("SPARQL results ended before the last binding")
+
+
+class SparqlBindings:
+    """
+    Async iterator over the bindings of a SPARQL results JSON document, parsed from text chunks as they arrive.
+    `vars` is populated once the head of the document has been read. Raises ValueError once the chunks run out if the
+    document was incomplete, so that a truncated result is never taken for a complete one.
+    """
+    def __init__(self, chunks: AsyncIterator[str]):
+        self._chunks = chunks
+        self._parser = BindingsParser()
+
+    @property
+    def vars(self) -> list[str]:
+        return self._parser.vars or []
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        async for text in self._chunks:
+            for binding in self._parser.feed(text):
+                yield binding
+        self._parser.close()
+
+
+async def iterate(items: Iterable) -> AsyncIterator:
+    for item in items:
+        yield item
+
+
+async def prime(items: AsyncIterator) -> AsyncIterator:
+    """
+    Fetches the first item straight away, so that errors (e.g. from Jena) are raised before a response has started,
+    and returns an iterator over all of the items.
+    """
+    iterator = aiter(items)
+    try:
+        first = await anext(iterator)
+    except StopAsyncIteration:
+        return iterate([])
+
+    async def chain():
+        yield first
+        async for item in iterator:
+            yield item
+
+    return chain()
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+async def json_array(rows: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = bytearray(b"[")
+    first = True
+    async for row in rows:
+        if not first:
+            buffer += b","
+        buffer += row
+        first = False
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+async def json_lines(rows: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for row in rows:
+        buffer += row
+        buffer += b"\n"
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def stream_rows(request: Request, rows: AsyncIterator[bytes], headers: dict | None = None) -> StreamingResponse:
+    """
+    Streams already serialised rows to the client, either as a JSON array or, when the client accepts it, as
+    newline delimited JSON. Either way the response varies by the Accept header, which caches are told.
+    """
+    headers = {**(headers or {}), "Vary": "Accept"}
+    if wants_ndjson(request):
+        return StreamingResponse(json_lines(rows), media_type=NDJSON, headers=headers)
+    return StreamingResponse(json_array(rows), media_type="application/json", headers=headers)
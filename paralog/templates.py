@@ -0,0 +1,156 @@
+import functools
+import re
+from collections.abc import Callable, Iterable
+from typing import Any
+
+__license__ = """
+Copyright (c) Telicent Ltd.
+
+This software is licensed under the terms found in the LICENSE file of this repository.
+
+The above copyright notice and license conditions shall be included in all
+copies or substantial portions of the Software.
+"""
+
+# Placeholders are written {{name:kind}}, which cannot be mistaken for SPARQL's own braces or variables
+_PLACEHOLDER = re.compile(r"\{\{(\w+):(\w+)\}\}")
+
+_INVALID_IRI = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+_VARIABLE = re.compile(r"^\w+$")
+
+# Rendered queries kept for repeated parameter sets
+RENDER_CACHE_SIZE = 1024
+
+
+class InvalidParameter(ValueError):
+    """
+    Raised when a value cannot be safely bound into a query, e.g. a URI containing characters not allowed in an IRI
+    """
+
+
+def iri(value: str) -> str:
+    """
+    Quotes a string as a SPARQL IRI
+    """
+    if not isinstance(value, str) or _INVALID_IRI.search(value):
+        raise InvalidParameter(f"invalid IRI: {value}")
+    return f"<{value}>"
+
+
+def literal(value: str) -> str:
+    """
+    Quotes a string as a SPARQL literal
+    """
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+    return f'"{escaped}"'
+
+
+def variable(value: str) -> str:
+    if not _VARIABLE.match(value):
+        raise InvalidParameter(f"invalid variable name: {value}")
+    return value
+
+
+def integer(value: int) -> str:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise InvalidParameter(f"invalid integer: {value}")
+    return str(value)
+
+
+def fragment(value: str) -> str:
+    """
+    Only text rendered from another template can be spliced into a query, never arbitrary strings
+    """
+    if not isinstance(value, RenderedQuery):
+        raise InvalidParameter("query fragments must be rendered from a template")
+    return value
+
+
+def iri_list(values: Iterable[str]) -> str:
+    """
+    Comma separated IRIs, e.g. for `FILTER (?x IN (...))`
+    """
+    return ", ".join(iri(value) for value in values)
+
+
+def iri_values(values: Iterable[str]) -> str:
+    """
+    Space separated IRIs, e.g. for `VALUES ?x { ... }`
+    """
+    return " ".join(iri(value) for value in values)
+
+
+def literal_values(values: Iterable[str]) -> str:
+    """
+    Space separated literals, e.g. for `VALUES ?x { ... }`
+    """
+    return " ".join(literal(value) for value in values)
+
+
+KINDS: dict[str, Callable[[Any], str]] = {
+    "iri": iri,
+    "literal": literal,
+    "var": variable,
+    "int": integer,
+    "fragment": fragment,
+    "iri_list": iri_list,
+    "iri_values": iri_values,
+    "literal_values": literal_values,
+}
+
+
+class RenderedQuery(str):
+    """
+    The text of a query, remembering the template and parameters it was rendered from
+    """
+    template: str
+    params: dict
+
+
+class QueryTemplate:
+    """
+    A SPARQL query with {{name:kind}} placeholders, split into its literal text and placeholders once, when it is
+    defined. Rendering escapes each parameter according to its kind and joins the pieces, and repeated renders with
+    the same parameters are served from a cache.
+    """
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.segments: list[str] = []
+        self.placeholders: list[tuple[str, str]] = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            param, kind = match.groups()
+            if kind not in KINDS:
+                raise ValueError(f"unknown placeholder kind '{kind}' in query template {name}")
+            self.segments.append(text[position:match.start()])
+            self.placeholders.append((param, kind))
+            position = match.end()
+        self.segments.append(text[position:])
+        self.params = frozenset(param for param, _ in self.placeholders)
+
+    def __repr__(self):
+        return f"QueryTemplate({self.name!r})"
+
+    def render(self, **params) -> RenderedQuery:
+        if params.keys() != self.params:
+            raise TypeError(f"query template {self.name} takes {sorted(self.params)}, got {sorted(params)}")
+        return _render(self, tuple(sorted((key, _hashable(value)) for key, value in params.items())))
+
+
+def _hashable(value):
+    if isinstance(value, list | tuple):
+        return tuple(value)
+    return value
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(template: QueryTemplate, params: tuple) -> RenderedQuery:
+    values = dict(params)
+    pieces = [template.segments[0]]
+    for (param, kind), segment in zip(template.placeholders, template.segments[1:], strict=True):
+        pieces.append(KINDS[kind](values[param]))
+        pieces.append(segment)
+    query = RenderedQuery("".join(pieces))
+    query.template = template.name
+    query.params = values
+    return query
@@ -1,3 +1,11 @@
+import asyncio
+import base64
+import binascii
+import functools
+import json
+from collections.abc import Callable, Iterable
+from typing import Any
+
 __license__ = """
 Copyright (c) Telicent Ltd.
 
@@ -7,6 +15,12 @@ The above copyright notice and license conditions shall be included in all
 copies or substantial portions of the Software.
 """
 
+# Results with more rows than this are mapped in a worker thread
+THREAD_ROWS = 10_000
+
+# Compiled row mappers kept, one per distinct set of fields (e.g. a query's head.vars)
+ROW_MAPPER_CACHE_SIZE = 256
+
 
 async def get_headers(headers):
     pass_through_headers = [
@@ -23,58 +37,188 @@ async def get_headers(headers):
     return forward_headers
 
 
+def flatten_binding(binding: dict) -> dict:
+    """
+    Flattens a single SPARQL binding to a dict of variable name to value
+    """
+    return {v: binding[v]["value"] for v in binding if binding[v] is not None}
+
+
+# A field of a row mapper: the key in the row, the variable it comes from, how to convert it and whether it is required
+RowField = tuple[str, str, Callable[[str], Any] | None, bool]
+
+
+@functools.lru_cache(maxsize=ROW_MAPPER_CACHE_SIZE)
+def compile_row_mapper(fields: tuple[RowField, ...]) -> Callable[[dict], dict]:
+    """
+    Generates a function mapping a SPARQL binding to a dict, specialised to the fields given as
+    (key, variable, conversion, required) tuples. Each key and variable is written into the function as a constant, so
+    mapping a row is a fixed sequence of lookups with no loop over the variables. A required variable missing from a
+    binding raises KeyError, an optional one leaves its key out of the row. Mappers are cached by their fields.
+    """
+    namespace: dict[str, Any] = {}
+
+    def value(i: int, term: str) -> str:
+        convert = fields[i][2]
+        if convert is None:
+            return f"{term}['value']"
+        namespace[f"convert_{i}"] = convert
+        return f"convert_{i}({term}['value'])"
+
+    if all(required for *_, required in fields):
+        items = ", ".join(f"{key!r}: {value(i, f'binding[{var!r}]')}" for i, (key, var, *_) in enumerate(fields))
+        body = [f"    return {{{items}}}"]
+    else:
+        body = ["    row = {}"]
+        for i, (key, var, _, required) in enumerate(fields):
+            if required:
+                body.append(f"    row[{key!r}] = {value(i, f'binding[{var!r}]')}")
+            else:
+                body.append(f"    if (term := binding.get({var!r})) is not None:")
+                body.append(f"        row[{key!r}] = {value(i, 'term')}")
+        body.append("    return row")
+    exec("\n".join(["def map_row(binding):", *body]), namespace)
+    return namespace["map_row"]
+
+
+def flat_mapper(variables: Iterable[str]) -> Callable[[dict], dict]:
+    """
+    A compiled mapper from a binding to a dict of variable name to value, for the variables (the `head.vars` of a
+    result) that are bound
+    """
+    return compile_row_mapper(tuple((var, var, None, False) for var in variables))
+
+
+def field_mapper(*fields: tuple[str, str] | tuple[str, str, Callable[[str], Any]]) -> Callable[[dict], dict]:
+    """
+    A compiled mapper from a binding to a dict of the given (key, variable) or (key, variable, conversion) fields,
+    all of which must be bound
+    """
+    return compile_row_mapper(tuple((key, var, convert[0] if convert else None, True) for key, var, *convert in fields))
+
+
+async def map_rows(data: dict, mapper: Callable[[dict], Any]) -> list:
+    """
+    Maps every binding of a query result with `mapper`, in a worker thread for results of more than THREAD_ROWS
+    rows so that the event loop is not held up while they are mapped
+    """
+    bindings = data["results"]["bindings"] or []
+    if len(bindings) > THREAD_ROWS:
+        return await asyncio.to_thread(lambda: [mapper(binding) for binding in bindings])
+    return [mapper(binding) for binding in bindings]
+
+
 async def flatten_out(data, return_first_obj=False):
-    results = []
-    if data["results"]["bindings"] is not None:
-        for stmt in data["results"]["bindings"]:
-            obj = {}
-            for v in data["head"]["vars"]:
-                if v in stmt and stmt[v] is not None:
-                    obj[v] = stmt[v]["value"]
-            results.append(obj)
+    results = await map_rows(data, flat_mapper(data["head"]["vars"]))
     if return_first_obj:
         return results[0]
     else:
         return results
 
 
+def _map_flood_areas(bindings: list[dict], head: list[str]) -> list[dict]:
+    area_var, name_var, polygon_var, flood_area_var, flood_area_name_var, flood_area_polygon_var = head[:6]
+    flood_area = field_mapper(
+        ("uri", flood_area_var),
+        ("name", flood_area_name_var),
+        ("polygon_uri", flood_area_polygon_var),
+    )
+    flood_areas: dict[str, dict] = {}
+    for binding in bindings:
+        uri = binding[area_var]["value"]
+        area = flood_areas.get(uri)
+        if area is None:
+            area = flood_areas[uri] = {
+                "uri": uri,
+                "name": binding[name_var]["value"],
+                "polygon_uri": binding[polygon_var]["value"],
+                "flood_areas": [],
+            }
+        area["flood_areas"].append(flood_area(binding))
+    return list(flood_areas.values())
+
+
 async def map_flood_areas(data):
-    bindings = data['results']['bindings']
-    head = data['head']['vars']
-
-    flood_areas = {}
-    if bindings is not None:
-        for binding in bindings:
-            if binding[head[0]]['value']not in flood_areas.keys():
-                flood_areas[binding[head[0]]['value']] = {
-                    'uri': binding[head[0]]['value'],
-                    'name': binding[head[1]]['value'],
-                    'polygon_uri': binding[head[2]]['value'],
-                    'flood_areas': []
-                }
-            flood_areas[binding[head[0]]['value']]['flood_areas'].append({
-                'uri': binding[head[3]]['value'],
-                'name': binding[head[4]]['value'],
-                'polygon_uri': binding[head[5]]['value']
-            })
+    bindings = data["results"]["bindings"] or []
+    if len(bindings) > THREAD_ROWS:
+        return await asyncio.to_thread(_map_flood_areas, bindings, data["head"]["vars"])
+    return _map_flood_areas(bindings, data["head"]["vars"])
 
-    return list(flood_areas.values())
 
+# The variables of the `get_states` query that set a field of the state, as (key, variable)
+_STATE_PERIODS = (("period", "inPeriod"), ("end", "ends"), ("start", "starts"))
 
-async def aggregate(data, agg_var):
-    results = {}
-    if data["results"]["bindings"] is not None:
-        for stmt in data["results"]["bindings"]:
-            if stmt[agg_var]['value'] in results:
-                obj = results[stmt[agg_var]['value']]
+
+def _map_states(bindings: list[dict]) -> dict[str, dict[str, dict]]:
+    grouped: dict[str, dict[str, dict]] = {}
+    current = None
+    state: dict = {}
+    for binding in bindings:
+        parent = binding["parent"]["value"]
+        uri = binding["stateUri"]["value"]
+        # Rows are ordered by parent and state, so the state only has to be looked up when it changes
+        if (parent, uri) != current:
+            current = (parent, uri)
+            states = grouped.get(parent)
+            if states is None:
+                states = grouped[parent] = {}
+            existing = states.get(uri)
+            if existing is not None:
+                state = existing
             else:
-                obj = {}
-                for v in data['head']['vars']:
-                    if v != agg_var:
-                        obj[v] = []
-                results[stmt[agg_var]['value']] = obj
-            for v in data['head']['vars']:
-                if v in stmt and v != agg_var:
-
-                    obj[v].append(stmt[v]['value'])
-    return results
+                state = states[uri] = {
+                    "end": "",
+                    "period": "",
+                    "start": "",
+                    "type": "",
+                    "uri": uri,
+                    "relations": [],
+                    "representations": [],
+                }
+        state_type = binding.get("stateType")
+        if state_type is not None and not state["type"]:
+            state["type"] = state_type["value"]
+        for key, var in _STATE_PERIODS:
+            value = binding.get(var)
+            if value is not None:
+                state[key] = value["value"]
+        rep_type = binding.get("repType")
+        rep_value = binding.get("repValue")
+        if rep_type is not None and rep_value is not None:
+            state["representations"].append({rep_type["value"]: rep_value["value"]})
+    # Only states with a type are returned
+    return {
+        parent: {uri: state for uri, state in states.items() if state["type"]}
+        for parent, states in grouped.items()
+    }
+
+
+async def map_states(data):
+    """
+    Groups the bindings of the `get_states` query, in one pass, into states keyed by parent URI and state URI, with
+    their type, period, start, end and representations
+    """
+    bindings = data["results"]["bindings"] or []
+    if len(bindings) > THREAD_ROWS:
+        return await asyncio.to_thread(_map_states, bindings)
+    return _map_states(bindings)
+
+
+def encode_cursor(key: str) -> str:
+    """
+    Encodes the key of the last row of a page as an opaque continuation token
+    """
+    return base64.urlsafe_b64encode(json.dumps({"after": key}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """
+    Decodes a continuation token created by `encode_cursor`. Raises ValueError if the token is not valid.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(data, dict) or not isinstance(data.get("after"), str):
+        raise ValueError("invalid cursor")
+    return data["after"]
@@ -0,0 +1,133 @@
+import itertools
+import unittest
+from collections import deque
+
+import numpy as np
+
+from paralog.analytics import NetworkMetrics, betweenness, components
+from paralog.graph import Adjacency, DependencyIndex
+
+
+def adjacency(edges: list[tuple[int, int]], size: int) -> Adjacency:
+    sources = np.array([s for s, _ in edges], dtype=np.int64)
+    targets = np.array([t for _, t in edges], dtype=np.int64)
+    return Adjacency(sources, targets, np.zeros(len(edges)), size)
+
+
+def shortest_paths(edges: list[tuple[int, int]], size: int, source: int) -> tuple[list[int], list[int]]:
+    """
+    Distances and numbers of shortest paths from a node, by a plain breadth first search
+    """
+    neighbours: list[list[int]] = [[] for _ in range(size)]
+    for s, t in edges:
+        neighbours[s].append(t)
+    distance, paths = [-1] * size, [0] * size
+    distance[source], paths[source] = 0, 1
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for neighbour in neighbours[node]:
+            if distance[neighbour] < 0:
+                distance[neighbour] = distance[node] + 1
+                queue.append(neighbour)
+            if distance[neighbour] == distance[node] + 1:
+                paths[neighbour] += paths[node]
+    return distance, paths
+
+
+def reference_betweenness(edges: list[tuple[int, int]], size: int) -> list[float]:
+    """
+    Betweenness from its definition: for every pair, the fraction of their shortest paths through each other node
+    """
+    bfs = [shortest_paths(edges, size, node) for node in range(size)]
+    centrality = [0.0] * size
+    for s, t in itertools.permutations(range(size), 2):
+        distance_s, paths_s = bfs[s]
+        if distance_s[t] < 0:
+            continue
+        for v in range(size):
+            distance_v, paths_v = bfs[v]
+            if v not in (s, t) and distance_s[v] >= 0 and distance_s[v] + distance_v[t] == distance_s[t]:
+                centrality[v] += paths_s[v] * paths_v[t] / paths_s[t]
+    return [c / ((size - 1) * (size - 2)) for c in centrality]
+
+
+class TestComponents(unittest.TestCase):
+
+    def test_labels_weakly_connected_components(self):
+        sources = np.array([0, 2, 5, 6], dtype=np.int64)
+        targets = np.array([1, 1, 4, 5], dtype=np.int64)
+        self.assertEqual(components(sources, targets, 8).tolist(), [0, 0, 0, 1, 2, 2, 2, 3])
+
+    def test_long_chains(self):
+        size = 1000
+        sources = np.arange(size - 1, 0, -1, dtype=np.int64)
+        targets = sources - 1
+        self.assertEqual(components(sources, targets, size).tolist(), [0] * size)
+
+    def test_no_edges(self):
+        empty = np.empty(0, dtype=np.int64)
+        self.assertEqual(components(empty, empty, 3).tolist(), [0, 1, 2])
+
+
+class TestBetweenness(unittest.TestCase):
+
+    def test_path(self):
+        # 0 -> 1 -> 2 -> 3
+        centrality = betweenness(adjacency([(0, 1), (1, 2), (2, 3)], 4), 4, samples=4)
+        self.assertEqual(centrality.tolist(), [0.0, 2 / 6, 2 / 6, 0.0])
+
+    def test_star(self):
+        # Three leaves depend on the centre, 0, which three other leaves depend on
+        edges = [(leaf, 0) for leaf in (1, 2, 3)] + [(0, leaf) for leaf in (4, 5, 6)]
+        centrality = betweenness(adjacency(edges, 7), 7, samples=7)
+        self.assertAlmostEqual(centrality[0], 9 / 30)
+        self.assertEqual(centrality[1:].tolist(), [0.0] * 6)
+
+    def test_matches_definition(self):
+        rng = np.random.default_rng(5)
+        for size in [3, 8, 20]:
+            edges = sorted({(int(s), int(t)) for s, t in rng.integers(0, size, (size * 2, 2)) if s != t})
+            with self.subTest(size=size):
+                centrality = betweenness(adjacency(edges, size), size, samples=size)
+                np.testing.assert_allclose(centrality, reference_betweenness(edges, size), atol=1e-12)
+
+    def test_sampling_is_repeatable(self):
+        rng = np.random.default_rng(11)
+        size = 200
+        edges = [(int(s), int(t)) for s, t in rng.integers(0, size, (600, 2)) if s != t]
+        graph = adjacency(edges, size)
+        first = betweenness(graph, size, samples=20, seed=3)
+        self.assertEqual(first.tolist(), betweenness(graph, size, samples=20, seed=3).tolist())
+        self.assertNotEqual(first.tolist(), betweenness(graph, size, samples=20, seed=4).tolist())
+        self.assertGreater(first.sum(), 0)
+
+    def test_small_graphs(self):
+        self.assertEqual(betweenness(adjacency([(0, 1)], 2), 2, samples=2).tolist(), [0.0, 0.0])
+        self.assertEqual(betweenness(adjacency([(0, 1), (1, 2)], 3), 3, samples=0).tolist(), [0.0] * 3)
+
+
+class TestNetworkMetrics(unittest.TestCase):
+
+    def test_metrics_per_asset(self):
+        rows = [
+            {
+                "dependencyUri": {"value": f"d{i}"},
+                "providerNode": {"value": provider},
+                "dependentNode": {"value": dependent},
+                "criticalityRating": {"value": rating},
+            }
+            for i, (provider, dependent, rating) in enumerate([("a", "b", "2"), ("b", "c", "3"), ("x", "y", "1")])
+        ]
+        metrics = NetworkMetrics(DependencyIndex(rows))
+        assets = {asset["uri"]: asset for asset in metrics.assets()}
+        self.assertEqual(assets["b"]["dependentCount"], 1)
+        self.assertEqual(assets["b"]["dependentCriticalitySum"], 3.0)
+        self.assertEqual(assets["b"]["providerCount"], 1)
+        self.assertEqual(assets["b"]["providerCriticalitySum"], 2.0)
+        self.assertGreater(assets["b"]["betweenness"], 0)
+        self.assertEqual(assets["a"]["betweenness"], 0)
+        self.assertEqual(
+            [(c["size"], c["assets"]) for c in metrics.component_members()],
+            [(3, ["a", "b", "c"]), (2, ["x", "y"])],
+        )
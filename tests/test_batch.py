@@ -0,0 +1,103 @@
+import re
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from paralog import app as paralog_app
+
+ASSET_TYPE = "http://example.com/Facility"
+
+
+def asset(uri: str, name: str) -> dict:
+    return {
+        "uri": {"type": "uri", "value": uri},
+        "assetType": {"type": "uri", "value": ASSET_TYPE},
+        "name": {"type": "literal", "value": name},
+        "lat": {"type": "literal", "value": "51.5"},
+        "lon": {"type": "literal", "value": "-0.1"},
+        "dependentCount": {"type": "literal", "value": "2"},
+    }
+
+
+class FakeJena:
+    """
+    Answers asset queries from the URIs bound in their VALUES block, recording the URIs of each query
+    """
+    def __init__(self, assets: dict[str, dict]):
+        self.assets = assets
+        self.queries: list[list[str]] = []
+
+    async def get(self, query, headers=None, timeout=None):
+        uris = re.findall(r"<([^>]*)>", re.search(r"VALUES \?uri \{([^}]*)\}", query).group(1))
+        self.queries.append(uris)
+        bindings = [self.assets[uri] for uri in uris if uri in self.assets]
+        return {"head": {"vars": list(asset("", "")) + ["address"]}, "results": {"bindings": bindings}}
+
+
+class TestAssetsBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+        uris = [f"http://example.com/{i}" for i in range(7)]
+        self.jena = FakeJena({uri: asset(uri, f"Asset {uri[-1]}") for uri in uris})
+        patcher = mock.patch.object(paralog_app.jena, "get", self.jena.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, uris: list[str]):
+        return self.client.post("/assets:batch", json={"uris": uris})
+
+    def test_returns_assets_keyed_by_uri(self):
+        response = self.post(["http://example.com/1", "http://example.com/2"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["http://example.com/1"], {
+            "uri": "http://example.com/1",
+            "assetType": ASSET_TYPE,
+            "name": "Asset 1",
+            "lat": 51.5,
+            "lon": -0.1,
+            "address": None,
+            "desc": None,
+            "osmID": None,
+            "wikipediaPage": None,
+            "webPage": None,
+            "dependentCount": 2,
+            "dependentCriticalitySum": None,
+        })
+        self.assertEqual(list(response.json()), ["http://example.com/1", "http://example.com/2"])
+
+    def test_splits_uris_into_chunks(self):
+        uris = [f"http://example.com/{i}" for i in range(7)]
+        with mock.patch.object(paralog_app, "ASSET_BATCH_CHUNK_SIZE", 3):
+            response = self.post(uris)
+        self.assertEqual(list(response.json()), uris)
+        self.assertEqual(self.jena.queries, [uris[0:3], uris[3:6], uris[6:]])
+
+    def test_duplicate_uris_are_fetched_once_in_first_seen_order(self):
+        uris = ["http://example.com/3", "http://example.com/1", "http://example.com/3", "http://example.com/2"]
+        response = self.post(uris)
+        self.assertEqual(list(response.json()), ["http://example.com/3", "http://example.com/1", "http://example.com/2"])
+        self.assertEqual(self.jena.queries, [["http://example.com/3", "http://example.com/1", "http://example.com/2"]])
+
+    def test_unknown_uris_are_left_out(self):
+        response = self.post(["http://example.com/1", "http://example.com/unknown"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()), ["http://example.com/1"])
+
+    def test_empty_list(self):
+        response = self.post([])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {})
+        self.assertEqual(self.jena.queries, [])
+
+    def test_rejects_too_many_uris(self):
+        with mock.patch.object(paralog_app, "ASSET_BATCH_MAX_SIZE", 2):
+            response = self.post(["http://example.com/1", "http://example.com/2", "http://example.com/3"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.jena.queries, [])
+
+    def test_rejects_invalid_uris(self):
+        response = self.post(["http://example.com/1> . ?s ?p ?o"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.jena.queries, [])
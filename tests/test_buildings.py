@@ -0,0 +1,150 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from rdflib import Graph
+
+from paralog import app as paralog_app
+from paralog import queries
+
+EPC = queries.EPC_NAMESPACE
+
+BUILDINGS_DATA = f"""
+@prefix ies: <http://ies.data.gov.uk/ontology/ies4#> .
+@prefix telicent: <http://telicent.io/ontology/> .
+@prefix qudt: <http://qudt.org/2.1/schema/qudt/> .
+@prefix epc: <{EPC}> .
+@prefix ex: <http://example.com/> .
+
+ex:uprn100 ies:representationValue "100" .
+ex:uprn200 ies:representationValue "200" .
+ex:uprn300 ies:representationValue "300" .
+
+ex:b100 ies:isIdentifiedBy ex:uprn100 ; telicent:primaryName "1 High Street" ; a ies:Building ;
+    ies:inLocation ex:address100, ex:point100 .
+ex:address100 ies:isIdentifiedBy ex:postcode100, ex:line100 .
+ex:postcode100 a ies:PostalCode ; ies:representationValue "AB1 2CD" .
+ex:line100 a ies:FirstLineOfAddress ; ies:representationValue "1 High Street" .
+ex:point100 a ies:GeoPoint ; ies:isIdentifiedBy ex:lat100, ex:lon100 .
+ex:lat100 a ies:Latitude ; ies:representationValue "51.5" .
+ex:lon100 a ies:Longitude ; ies:representationValue "-0.1" .
+# The state's other types are not EPC ratings
+ex:state100 ies:isStateOf ex:b100 ; ies:inPeriod ex:period100 ; a epc:BuildingWithEnergyRatingOfC, ies:State,
+    ex:InspectedState ;
+    ies:hasCharacteristic ex:sap100 .
+ex:period100 ies:iso8601PeriodRepresentation "2021-03-04" .
+ex:sap100 qudt:value "71" .
+
+ex:b200 ies:isIdentifiedBy ex:uprn200 ; telicent:primaryName "2 High Street" ; a ies:Building ;
+    ies:inLocation ex:address200, ex:point200 .
+ex:point200 a ies:GeoPoint ; ies:isIdentifiedBy ex:lat200, ex:lon200 .
+ex:lat200 a ies:Latitude ; ies:representationValue "51.6" .
+ex:lon200 a ies:Longitude ; ies:representationValue "-0.2" .
+ex:address200 ies:isIdentifiedBy ex:postcode200, ex:line200 .
+ex:postcode200 a ies:PostalCode ; ies:representationValue "AB1 2CE" .
+ex:line200 a ies:FirstLineOfAddress ; ies:representationValue "2 High Street" .
+ex:state200 ies:isStateOf ex:b200 ; ies:inPeriod ex:period200 ; a ies:State, epc:BuildingWithEnergyRatingOfA ;
+    ies:hasCharacteristic ex:sap200 .
+ex:period200 ies:iso8601PeriodRepresentation "2022-05-06" .
+ex:sap200 qudt:value "92" .
+
+# A building with a state but no EPC rating
+ex:b300 ies:isIdentifiedBy ex:uprn300 ; telicent:primaryName "3 High Street" ; a ies:Building ;
+    ies:inLocation ex:address300, ex:point300 .
+ex:point300 a ies:GeoPoint ; ies:isIdentifiedBy ex:lat300, ex:lon300 .
+ex:lat300 a ies:Latitude ; ies:representationValue "51.7" .
+ex:lon300 a ies:Longitude ; ies:representationValue "-0.2" .
+ex:address300 ies:isIdentifiedBy ex:postcode300, ex:line300 .
+ex:postcode300 a ies:PostalCode ; ies:representationValue "AB1 2CF" .
+ex:line300 a ies:FirstLineOfAddress ; ies:representationValue "3 High Street" .
+ex:state300 ies:isStateOf ex:b300 ; ies:inPeriod ex:period300 ; a ies:State ; ies:hasCharacteristic ex:sap300 .
+ex:period300 ies:iso8601PeriodRepresentation "2020-01-02" .
+ex:sap300 qudt:value "40" .
+"""
+
+
+class RdflibJena:
+    """
+    Runs the queries sent to Jena over an in-memory graph
+    """
+    def __init__(self, graph: Graph):
+        self.graph = graph
+        self.queries: list[str] = []
+
+    def run(self, query: str) -> dict:
+        self.queries.append(query)
+        results = json.loads(self.graph.query(query).serialize(format="json"))
+        # rdflib answers a grouped query without solutions with one empty group, where Jena returns no rows
+        results["results"]["bindings"] = [row for row in results["results"]["bindings"] if "building" in row]
+        return results
+
+    async def get(self, query, headers=None, timeout=None):
+        return self.run(query)
+
+    async def stream(self, query, headers=None, timeout=None):
+        yield json.dumps(self.run(query))
+
+
+class TestBuildingDetails(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.graph = Graph().parse(data=BUILDINGS_DATA, format="turtle")
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+        self.jena = RdflibJena(self.graph)
+        for name in ["get", "stream"]:
+            patcher = mock.patch.object(paralog_app.jena, name, getattr(self.jena, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_building_has_its_epc_rating(self):
+        response = self.client.get("/buildings/100")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "uri": "http://example.com/b100",
+            "uprn": "100",
+            "types": ["http://ies.data.gov.uk/ontology/ies4#Building"],
+            "lat": "51.5",
+            "lon": "-0.1",
+            "epc_rating": EPC + "BuildingWithEnergyRatingOfC",
+            "name": "1 High Street",
+            "postcode": "AB1 2CD",
+            "address": "1 High Street",
+            "sap_points": 71.0,
+        })
+
+    def test_rating_is_filtered_in_the_query(self):
+        # Without the filter, the state's other types would come back as rows of their own
+        for uprn in ["100", "200"]:
+            with self.subTest(uprn=uprn):
+                rows = self.jena.run(asyncio.run(queries.get_building(uprn)))["results"]["bindings"]
+                self.assertEqual(len(rows), 1)
+                self.assertTrue(rows[0]["epc_rating"]["value"].startswith(EPC))
+
+    def test_building_without_epc_rating_has_no_rows(self):
+        self.assertEqual(self.jena.run(asyncio.run(queries.get_building("300")))["results"]["bindings"], [])
+
+    def test_details_have_one_row_per_building_with_its_epc_rating(self):
+        response = self.client.post("/buildings/details", json={"uprns": ["200", "300", "100", "999"]})
+        self.assertEqual(response.status_code, 200)
+        buildings = {building["uprn"]: building for building in response.json()}
+        self.assertEqual(sorted(buildings), ["100", "200"])
+        self.assertEqual(buildings["100"]["epc_rating"], EPC + "BuildingWithEnergyRatingOfC")
+        self.assertEqual(buildings["200"]["epc_rating"], EPC + "BuildingWithEnergyRatingOfA")
+        self.assertEqual(buildings["200"]["sap_points"], 92.0)
+        self.assertEqual(response.headers["vary"], "Accept")
+
+    def test_details_as_ndjson(self):
+        response = self.client.post(
+            "/buildings/details", json={"uprns": ["100", "200"]}, headers={"Accept": "application/x-ndjson"}
+        )
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        self.assertEqual(response.headers["vary"], "Accept")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(sorted(line["epc_rating"] for line in lines), [
+            EPC + "BuildingWithEnergyRatingOfA", EPC + "BuildingWithEnergyRatingOfC"
+        ])
@@ -0,0 +1,226 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from paralog.cache import MemoryBackend, ResultCache, SingleFlight, TTLCache, parse_ttls, query_key
+
+
+class Clock:
+    """
+    Stands in for time.monotonic, only moving when told to
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("paralog.cache.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_and_set(self):
+        cache = TTLCache(maxsize=4)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("b", "default"), "default")
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+
+    def test_caches_falsy_values(self):
+        cache = TTLCache(maxsize=4)
+        cache.set("none", None)
+        cache.set("zero", 0)
+        self.assertIn("none", cache)
+        self.assertEqual(cache.get("zero", "default"), 0)
+
+    def test_entries_expire(self):
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=20)
+        self.clock.now += 9.9
+        self.assertEqual(cache.get("a"), 1)
+        self.clock.now += 0.1
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.clock.now += 10
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["expirations"], 2)
+
+    def test_entries_without_ttl_never_expire(self):
+        cache = TTLCache(maxsize=4)
+        cache.set("a", 1)
+        self.clock.now += 1e9
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_does_not_cache_with_ttl_of_zero_or_less(self):
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set("a", 1, ttl=0)
+        cache.set("b", 2, ttl=-5)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(len(TTLCache(maxsize=0)), 0)
+
+    def test_resetting_replaces_value_and_expiry(self):
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set("a", 1)
+        self.clock.now += 5
+        cache.set("a", 2)
+        self.clock.now += 9
+        self.assertEqual(cache.get("a"), 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=3)
+        for key in "abc":
+            cache.set(key, key)
+        cache.get("a")
+        cache.set("d", "d")
+        self.assertEqual(cache.keys(), ["c", "a", "d"])
+        self.assertNotIn("b", cache)
+        cache.set("c", "c2")
+        cache.set("e", "e")
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.get("c"), "c2")
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_counts_hits_and_misses(self):
+        cache = TTLCache(maxsize=3)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"], stats["maxsize"]), (2, 1, 1, 3))
+
+    def test_pop_and_clear(self):
+        cache = TTLCache(maxsize=3)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertIsNone(cache.pop("a"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_shares_one_call_between_concurrent_callers(self):
+        flights = SingleFlight()
+        release = asyncio.Event()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"rows": 1}
+
+        waiters = [asyncio.ensure_future(flights.do("q", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        self.assertEqual(len(flights), 1)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(flights.stats(), {"in_flight": 0, "calls": 1, "shared": 4})
+
+    async def test_different_keys_are_not_shared(self):
+        flights = SingleFlight()
+
+        async def fetch(value):
+            await asyncio.sleep(0)
+            return value
+
+        results = await asyncio.gather(flights.do("a", lambda: fetch(1)), flights.do("b", lambda: fetch(2)))
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(flights.calls, 2)
+
+    async def test_sequential_calls_are_not_shared(self):
+        flights = SingleFlight()
+        fetch = mock.AsyncMock(side_effect=[1, 2])
+        self.assertEqual(await flights.do("q", fetch), 1)
+        self.assertEqual(await flights.do("q", fetch), 2)
+        self.assertEqual(len(flights), 0)
+
+    async def test_exceptions_reach_every_caller(self):
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise RuntimeError("Jena is down")
+
+        waiters = [asyncio.ensure_future(flights.do("q", fail)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertEqual([str(result) for result in results], ["Jena is down"] * 3)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(len(flights), 0)
+        self.assertEqual(await flights.do("q", mock.AsyncMock(return_value="retried")), "retried")
+
+    async def test_cancelled_caller_does_not_cancel_the_call(self):
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "result"
+
+        first = asyncio.ensure_future(flights.do("q", fetch))
+        second = asyncio.ensure_future(flights.do("q", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        self.assertEqual(await second, "result")
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+
+class TestResultCache(unittest.IsolatedAsyncioTestCase):
+
+    def test_keys_depend_on_query_and_identity(self):
+        key = query_key("SELECT 1", {"x-amzn-oidc-identity": "alice"})
+        self.assertEqual(key, query_key("SELECT 1", {"x-amzn-oidc-identity": "alice"}))
+        self.assertNotEqual(key, query_key("SELECT 1", {"x-amzn-oidc-identity": "bob"}))
+        self.assertNotEqual(key, query_key("SELECT 2", {"x-amzn-oidc-identity": "alice"}))
+        self.assertNotEqual(key, query_key("SELECT 1"))
+        self.assertEqual(query_key("SELECT 1"), query_key("SELECT 1", {}))
+        self.assertEqual(query_key("q", {"a": "1", "b": "2"}), query_key("q", {"b": "2", "a": "1"}))
+
+    def test_parses_endpoint_ttls(self):
+        self.assertEqual(parse_ttls("/assessments=60, /buildings=300,"), {"/assessments": 60.0, "/buildings": 300.0})
+        self.assertEqual(parse_ttls(None), {})
+        with self.assertRaises(ValueError):
+            parse_ttls("/buildings=soon")
+
+    async def test_caches_per_endpoint(self):
+        results = ResultCache(MemoryBackend(), default_ttl=0, endpoint_ttls={"/buildings": 60, "/assessments": 60})
+        await results.set("/buildings", "k", {"rows": 1})
+        await results.set("/states", "k", {"rows": 2})
+        self.assertEqual(await results.get("/buildings", "k"), {"rows": 1})
+        self.assertIsNone(await results.get("/assessments", "k"))
+        self.assertIsNone(await results.get("/states", "k"))
+
+    async def test_invalidates_one_or_every_endpoint(self):
+        results = ResultCache(MemoryBackend(), default_ttl=60)
+        for endpoint in ["/buildings", "/buildings/details", "/assessments"]:
+            await results.set(endpoint, "k", endpoint)
+        await results.invalidate("/buildings")
+        self.assertIsNone(await results.get("/buildings", "k"))
+        self.assertEqual(await results.get("/buildings/details", "k"), "/buildings/details")
+        await results.invalidate()
+        self.assertIsNone(await results.get("/assessments", "k"))
+
+    async def test_backend_failures_are_cache_misses(self):
+        backend = mock.Mock(get=mock.AsyncMock(side_effect=ConnectionError), set=mock.AsyncMock(side_effect=OSError))
+        results = ResultCache(backend, default_ttl=60)
+        with self.assertLogs("paralog.cache", "WARNING"):
+            await results.set("/buildings", "k", {"rows": 1})
+            self.assertIsNone(await results.get("/buildings", "k"))
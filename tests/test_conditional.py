@@ -0,0 +1,140 @@
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from paralog import app as paralog_app
+from paralog import conditional
+
+TAG = conditional.etag(b"body")
+OTHER_TAG = conditional.etag(b"other body")
+
+ASSESSMENTS = {
+    "head": {"vars": ["uri", "name", "numberOfAssessedItems"]},
+    "results": {"bindings": [
+        {
+            "uri": {"type": "uri", "value": "http://example.com/assessment"},
+            "name": {"type": "literal", "value": "Assessment"},
+            "numberOfAssessedItems": {"type": "literal", "value": "3"},
+        },
+    ]},
+}
+
+
+class TestEtagMatches(unittest.TestCase):
+
+    def test_strong_and_weak_tags(self):
+        self.assertTrue(conditional.etag_matches(TAG, TAG))
+        self.assertTrue(conditional.etag_matches(f"W/{TAG}", TAG))
+        self.assertFalse(conditional.etag_matches(OTHER_TAG, TAG))
+        self.assertFalse(conditional.etag_matches(f"W/{OTHER_TAG}", TAG))
+
+    def test_unquoted_tags_do_not_match(self):
+        self.assertFalse(conditional.etag_matches(TAG.strip('"'), TAG))
+
+    def test_any(self):
+        self.assertTrue(conditional.etag_matches("*", TAG))
+        self.assertTrue(conditional.etag_matches(" * ", TAG))
+
+    def test_lists(self):
+        self.assertTrue(conditional.etag_matches(f"{OTHER_TAG}, {TAG}", TAG))
+        self.assertTrue(conditional.etag_matches(f'"a",W/{TAG} , "b"', TAG))
+        self.assertFalse(conditional.etag_matches(f'{OTHER_TAG}, "a"', TAG))
+
+    def test_missing_header(self):
+        self.assertFalse(conditional.etag_matches(None, TAG))
+        self.assertFalse(conditional.etag_matches("", TAG))
+
+
+class TestVersionEtag(unittest.TestCase):
+
+    def test_version_etags_depend_on_every_part(self):
+        tag = conditional.version_etag("v1", "query", "json")
+        self.assertEqual(tag, conditional.version_etag("v1", "query", "json"))
+        self.assertNotEqual(tag, conditional.version_etag("v2", "query", "json"))
+        self.assertNotEqual(tag, conditional.version_etag("v1", "query", "ndjson"))
+        self.assertRegex(tag, r'^"[0-9a-f]{32}"$')
+
+
+class TestDatasetVersion(unittest.IsolatedAsyncioTestCase):
+
+    async def test_probes_once_per_ttl(self):
+        probe = mock.AsyncMock(return_value={"results": {"bindings": [{"version": {"value": "7"}}]}})
+        version = conditional.DatasetVersion(probe, ttl=60)
+        self.assertEqual(await version.get(), "7")
+        self.assertEqual(await version.get(), "7")
+        self.assertEqual(probe.await_count, 1)
+        version.clear()
+        await version.get()
+        self.assertEqual(probe.await_count, 2)
+
+    async def test_failed_probes_have_no_version(self):
+        for probe in [
+            mock.AsyncMock(side_effect=ConnectionError("Jena is down")),
+            mock.AsyncMock(return_value={"results": {"bindings": []}}),
+        ]:
+            with self.subTest(probe=probe), self.assertLogs("paralog.conditional", "WARNING"):
+                self.assertIsNone(await conditional.DatasetVersion(probe).get())
+
+    async def test_no_probe(self):
+        self.assertIsNone(await conditional.DatasetVersion(None).get())
+
+
+class TestConditionalResponses(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+        self.jena_get = mock.AsyncMock(return_value=ASSESSMENTS)
+        patcher = mock.patch.object(paralog_app.jena, "get", self.jena_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_not_modified(self, response, tag: str):
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["etag"], tag)
+        self.assertEqual(response.headers["cache-control"], "private, no-cache")
+        self.assertNotIn("last-modified", response.headers)
+
+    def test_response_has_validators(self):
+        response = self.client.get("/assessments")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["etag"], conditional.etag(response.content))
+        self.assertEqual(response.headers["cache-control"], "private, no-cache")
+        self.assertNotIn("last-modified", response.headers)
+        self.assertNotIn("vary", response.headers)
+
+    def test_not_modified_keeps_validators(self):
+        tag = self.client.get("/assessments").headers["etag"]
+        for if_none_match in [tag, f"W/{tag}", "*", f'"other", {tag}']:
+            with self.subTest(if_none_match=if_none_match):
+                self.assert_not_modified(self.client.get("/assessments", headers={"If-None-Match": if_none_match}), tag)
+
+    def test_if_modified_since_is_ignored(self):
+        # Responses have no modification time, so a date cannot show that the client has the current one
+        response = self.client.get("/assessments", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_changed_response_is_sent(self):
+        response = self.client.get("/assessments", headers={"If-None-Match": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["uri"], "http://example.com/assessment")
+
+    def test_dataset_version_answers_without_jena(self):
+        probe = mock.AsyncMock(return_value={"results": {"bindings": [{"version": {"value": "7"}}]}})
+        with mock.patch.object(paralog_app, "dataset_version", conditional.DatasetVersion(probe)):
+            tag = self.client.get("/assessments").headers["etag"]
+            self.assertEqual(self.jena_get.await_count, 1)
+            self.assert_not_modified(self.client.get("/assessments", headers={"If-None-Match": tag}), tag)
+        self.assertEqual(self.jena_get.await_count, 1)
+
+    def test_dataset_version_etags_vary_by_accept(self):
+        probe = mock.AsyncMock(return_value={"results": {"bindings": [{"version": {"value": "7"}}]}})
+        with mock.patch.object(paralog_app, "dataset_version", conditional.DatasetVersion(probe)):
+            response = self.client.get("/assessments")
+            self.assertEqual(response.headers["vary"], "Accept")
+            ndjson = self.client.get("/assessments", headers={"Accept": "application/x-ndjson"})
+            self.assertNotEqual(ndjson.headers["etag"], response.headers["etag"])
+            not_modified = self.client.get("/assessments", headers={"If-None-Match": response.headers["etag"]})
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.headers["vary"], "Accept")
@@ -0,0 +1,67 @@
+import time
+import unittest
+from unittest import mock
+
+import jwt
+
+from paralog.decode_token import AccessMiddleware
+
+SECRET = "a-secret-that-is-long-enough-for-hs256"
+
+
+def token(**claims) -> str:
+    return jwt.encode(claims, SECRET, algorithm="HS256", headers={"kid": "test"})
+
+
+class TestTokenCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.middleware = AccessMiddleware(
+            app=None,
+            jwt_header="x-token",
+            jwks_url="http://jwks.invalid/keys",
+            token_cache_max_ttl=300,
+        )
+        self.addAsyncCleanup(self.middleware.aclose)
+        self.get_signing_key = mock.AsyncMock(return_value=SECRET)
+        self.middleware.key_cache.get_signing_key = self.get_signing_key
+        self.set = mock.Mock(wraps=self.middleware.token_cache.set)
+        self.middleware.token_cache.set = self.set
+
+    def cached_ttl(self) -> float:
+        return self.set.call_args.kwargs["ttl"]
+
+    async def test_verifies_each_token_once(self):
+        encoded = token(sub="user", exp=time.time() + 3600)
+        self.assertEqual((await self.middleware.validate_token(encoded))["sub"], "user")
+        self.assertEqual((await self.middleware.validate_token(encoded))["sub"], "user")
+        self.assertEqual(self.get_signing_key.await_count, 1)
+        await self.middleware.validate_token(token(sub="other", exp=time.time() + 3600))
+        self.assertEqual(self.get_signing_key.await_count, 2)
+
+    async def test_ttl_is_capped_at_expiry(self):
+        expires = time.time() + 30
+        await self.middleware.validate_token(token(sub="user", exp=expires))
+        self.assertLessEqual(self.cached_ttl(), 30)
+        self.assertGreater(self.cached_ttl(), 25)
+
+    async def test_ttl_is_capped_at_max_ttl(self):
+        await self.middleware.validate_token(token(sub="user", exp=time.time() + 3600))
+        self.assertEqual(self.cached_ttl(), 300)
+
+    async def test_tokens_without_expiry_are_cached_for_max_ttl(self):
+        await self.middleware.validate_token(token(sub="user"))
+        self.assertEqual(self.cached_ttl(), 300)
+
+    async def test_cached_token_is_not_served_after_expiry(self):
+        encoded = token(sub="user", exp=time.time() + 30)
+        await self.middleware.validate_token(encoded)
+        with mock.patch("paralog.cache.time.monotonic", return_value=time.monotonic() + 31):
+            self.assertIsNone(self.middleware.token_cache.get(self.set.call_args.args[0]))
+
+    async def test_invalid_tokens_are_not_cached(self):
+        for encoded in [token(sub="user", exp=time.time() - 10), token(sub="user")[:-4] + "AAAA"]:
+            with self.subTest(token=encoded), self.assertRaises(jwt.exceptions.InvalidTokenError):
+                await self.middleware.validate_token(encoded)
+        self.set.assert_not_called()
+        self.assertEqual(len(self.middleware.token_cache), 0)
@@ -0,0 +1,153 @@
+import json
+import sys
+import unittest
+from unittest import mock
+
+import pyarrow as pa
+import pyarrow.ipc
+from fastapi.testclient import TestClient
+
+from paralog import app as paralog_app
+from paralog import export
+
+ASSESSMENT = "http://example.com/assessment"
+EX = "http://example.com/"
+
+
+def binding(dependency: str, provider: str, provider_type: str, dependent: str, dependent_type: str, **optional):
+    row = {
+        "dependencyUri": {"type": "uri", "value": EX + dependency},
+        "providerNode": {"type": "uri", "value": EX + provider},
+        "providerNodeType": {"type": "uri", "value": EX + provider_type},
+        "dependentNode": {"type": "uri", "value": EX + dependent},
+        "dependentNodeType": {"type": "uri", "value": EX + dependent_type},
+    }
+    row.update({name: {"type": "literal", "value": value} for name, value in optional.items()})
+    return row
+
+
+# d1 has a row for each type of its provider, and the rating of d2 is not a number
+BINDINGS = [
+    binding("d2", "b", "Substation", "c", "Hospital", criticalityRating="high"),
+    binding("d1", "a", "PowerStation", "b", "Substation", criticalityRating="3", osmID="way/1"),
+    binding("d1", "a", "Facility", "b", "Substation", criticalityRating="3", osmID="way/1"),
+]
+
+TYPES = [EX + "Facility", EX + "Hospital", EX + "PowerStation", EX + "Substation"]
+NODES = {"uri": [EX + "a", EX + "b", EX + "c"], "types": [[0, 2], [3], [1]]}
+EDGES = {
+    "uri": [EX + "d1", EX + "d2"],
+    "provider": [0, 1],
+    "dependent": [1, 2],
+    "criticalityRating": [3.0, 0.0],
+    "osmID": ["way/1", None],
+}
+
+
+def dependency_graph(bindings: list[dict] = BINDINGS) -> export.DependencyGraph:
+    graph = export.DependencyGraph()
+    for row in bindings:
+        graph.add(row)
+    return graph
+
+
+def read_arrow(body: bytes) -> pa.Table:
+    return pyarrow.ipc.open_stream(body).read_all()
+
+
+class TestDependencyGraph(unittest.TestCase):
+
+    def test_json_columns_round_trip(self):
+        self.assertEqual(json.loads(dependency_graph().to_json()), {"types": TYPES, "nodes": NODES, "edges": EDGES})
+
+    def test_ids_do_not_depend_on_result_order(self):
+        self.assertEqual(dependency_graph(BINDINGS[::-1]).to_json(), dependency_graph().to_json())
+
+    def test_edges_arrow_stream(self):
+        table = read_arrow(dependency_graph().to_arrow("edges"))
+        self.assertEqual(table.schema.field("provider").type, pa.int32())
+        self.assertEqual(table.to_pydict(), EDGES)
+
+    def test_nodes_arrow_stream_carries_the_type_dictionary(self):
+        table = read_arrow(dependency_graph().to_arrow("nodes"))
+        self.assertEqual(table.schema.field("types").type, pa.list_(pa.dictionary(pa.int32(), pa.string())))
+        self.assertEqual(table.column("uri").to_pylist(), NODES["uri"])
+        types = table.column("types").combine_chunks()
+        self.assertEqual(types.flatten().dictionary.to_pylist(), TYPES)
+        self.assertEqual(types.to_pylist(), [[TYPES[i] for i in ids] for ids in NODES["types"]])
+
+    def test_empty_graph(self):
+        self.assertEqual(
+            json.loads(export.DependencyGraph().to_json()),
+            {"types": [], "nodes": {"uri": [], "types": []}, "edges": {name: [] for name in EDGES}},
+        )
+        self.assertEqual(read_arrow(export.DependencyGraph().to_arrow("edges")).num_rows, 0)
+        self.assertEqual(read_arrow(export.DependencyGraph().to_arrow("nodes")).num_rows, 0)
+
+    def test_requires_the_arrow_extra(self):
+        with mock.patch.dict(sys.modules, {"pyarrow": None, "pyarrow.ipc": None}):
+            with self.assertRaisesRegex(RuntimeError, "'arrow' extra"):
+                export.require_arrow()
+
+
+class TestExportEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+        self.queries: list[str] = []
+
+        async def stream(query, headers=None, timeout=None):
+            self.queries.append(query)
+            yield json.dumps({"head": {"vars": list(BINDINGS[0])}, "results": {"bindings": BINDINGS}})
+
+        patcher = mock.patch.object(paralog_app.jena, "stream", stream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def export(self, headers: dict | None = None, **params):
+        return self.client.get(
+            "/assessments/dependencies/export", params={"assessment": ASSESSMENT, **params}, headers=headers
+        )
+
+    def test_json_by_default(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(response.json(), {"types": TYPES, "nodes": NODES, "edges": EDGES})
+
+    def test_arrow_edges(self):
+        response = self.export(format="arrow")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], export.ARROW_STREAM)
+        self.assertEqual(read_arrow(response.content).to_pydict(), EDGES)
+
+    def test_arrow_nodes_from_the_accept_header(self):
+        response = self.export(headers={"Accept": export.ARROW_STREAM}, table="nodes")
+        self.assertEqual(response.headers["content-type"], export.ARROW_STREAM)
+        self.assertEqual(read_arrow(response.content).column("uri").to_pylist(), NODES["uri"])
+
+    def test_format_overrides_the_accept_header(self):
+        response = self.export(headers={"Accept": export.ARROW_STREAM}, format="json")
+        self.assertEqual(response.json()["edges"], EDGES)
+        self.assertNotIn("vary", response.headers)
+
+    def test_varies_by_accept_without_a_format(self):
+        for headers in [None, {"Accept": export.ARROW_STREAM}]:
+            with self.subTest(headers=headers):
+                self.assertEqual(self.export(headers=headers).headers["vary"], "Accept")
+
+    def test_rejects_invalid_format_and_table(self):
+        for params in [{"format": "csv"}, {"format": "arrow", "table": "types"}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.export(**params).status_code, 422)
+        self.assertEqual(self.queries, [])
+
+    def test_arrow_without_the_extra(self):
+        with mock.patch.dict(sys.modules, {"pyarrow": None, "pyarrow.ipc": None}):
+            response = self.export(format="arrow")
+        self.assertEqual(response.status_code, 501)
+        self.assertIn("'arrow' extra", response.json()["detail"])
+        self.assertEqual(self.queries, [])
+        # JSON does not need pyarrow
+        with mock.patch.dict(sys.modules, {"pyarrow": None, "pyarrow.ipc": None}):
+            self.assertEqual(self.export().status_code, 200)
@@ -0,0 +1,387 @@
+import json
+import re
+import unittest
+from unittest import mock
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from paralog import app as paralog_app
+from paralog import queries
+from paralog.flood import (
+    MIN_RING_POINTS,
+    FloodAreaIndex,
+    Polygon,
+    PolygonStore,
+    douglas_peucker,
+    polygon_rings,
+    simplify,
+)
+from paralog.spatial import points_in_rings
+
+SQUARE = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+HOLE = [[2, 2], [8, 2], [8, 8], [2, 8], [2, 2]]
+
+
+def ring(coordinates: list) -> np.ndarray:
+    return np.asarray(coordinates, dtype=np.float64)
+
+
+def crossing_number(lon: float, lat: float, rings: list[np.ndarray]) -> bool:
+    """
+    The textbook even-odd test, one point and one edge at a time
+    """
+    inside = False
+    for points in rings:
+        for (x0, y0), (x1, y1) in zip(points, np.roll(points, -1, axis=0), strict=True):
+            if min(y0, y1) <= lat < max(y0, y1) and lon < (x1 - x0) * (lat - y0) / (y1 - y0) + x0:
+                inside = not inside
+    return inside
+
+
+class TestPointsInRings(unittest.TestCase):
+
+    def test_excludes_points_in_holes(self):
+        lons = np.array([1.0, 5.0, 9.0, 5.0, 11.0, -1.0])
+        lats = np.array([1.0, 5.0, 9.0, 1.0, 5.0, 5.0])
+        inside = points_in_rings(lons, lats, [ring(SQUARE), ring(HOLE)])
+        self.assertEqual(inside.tolist(), [True, False, True, True, False, False])
+
+    def test_matches_crossing_number(self):
+        rng = np.random.default_rng(7)
+        star = ring([[5 + r * np.cos(a), 5 + r * np.sin(a)] for a, r in zip(
+            np.linspace(0, 2 * np.pi, 11)[:-1], [4, 1.5] * 5, strict=True
+        )])
+        for rings in [[ring(SQUARE)], [ring(SQUARE), ring(HOLE)], [star], [ring(SQUARE), star]]:
+            lons, lats = rng.uniform(-1, 11, 500), rng.uniform(-1, 11, 500)
+            with self.subTest(rings=len(rings)):
+                expected = [crossing_number(lon, lat, rings) for lon, lat in zip(lons, lats, strict=True)]
+                self.assertEqual(points_in_rings(lons, lats, rings).tolist(), expected)
+
+    def test_open_rings_are_closed(self):
+        inside = points_in_rings(np.array([5.0, 15.0]), np.array([5.0, 5.0]), [ring(SQUARE[:-1])])
+        self.assertEqual(inside.tolist(), [True, False])
+
+    def test_no_points(self):
+        self.assertEqual(points_in_rings(np.empty(0), np.empty(0), [ring(SQUARE)]).tolist(), [])
+
+
+class TestPolygonRings(unittest.TestCase):
+
+    def test_collects_polygons(self):
+        geo_json = {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [SQUARE, HOLE]}},
+                {"type": "Feature", "geometry": {"type": "MultiPolygon", "coordinates": [[SQUARE], [HOLE]]}},
+                {"type": "Feature", "geometry": {"type": "Point", "coordinates": [1, 1]}},
+            ],
+        }
+        polygons = polygon_rings(geo_json)
+        self.assertEqual([len(rings) for rings in polygons], [2, 1, 1])
+        self.assertEqual(polygons[0][1].tolist(), HOLE)
+
+    def test_drops_invalid_rings(self):
+        rings = polygon_rings({"type": "Polygon", "coordinates": [SQUARE, [[0, 0], [1, 1]], [["a", "b"]], [[1, 2, 3]]]})
+        self.assertEqual(len(rings[0]), 1)
+
+    def test_keeps_only_lon_and_lat(self):
+        rings = polygon_rings({"type": "Polygon", "coordinates": [[[x, y, 100] for x, y in SQUARE]]})
+        self.assertEqual(rings[0][0].tolist(), SQUARE)
+
+
+class TestDouglasPeucker(unittest.TestCase):
+
+    def test_keeps_endpoints(self):
+        rng = np.random.default_rng(3)
+        for tolerance in [0.0, 0.1, 1.0, 100.0]:
+            points = np.cumsum(rng.normal(size=(200, 2)), axis=0)
+            with self.subTest(tolerance=tolerance):
+                simplified = douglas_peucker(points, tolerance)
+                self.assertEqual(simplified[0].tolist(), points[0].tolist())
+                self.assertEqual(simplified[-1].tolist(), points[-1].tolist())
+
+    def test_drops_collinear_points(self):
+        points = np.array([[0, 0], [1, 0], [2, 0], [3, 0]], dtype=np.float64)
+        self.assertEqual(douglas_peucker(points, 0.01).tolist(), [[0, 0], [3, 0]])
+
+    def test_keeps_points_further_than_tolerance(self):
+        points = np.array([[0, 0], [1, 0.5], [2, 0], [3, 2], [4, 0]], dtype=np.float64)
+        self.assertEqual(douglas_peucker(points, 1.0).tolist(), [[0, 0], [2, 0], [3, 2], [4, 0]])
+        self.assertEqual(douglas_peucker(points, 0.1).tolist(), points.tolist())
+
+    def test_closed_rings(self):
+        points = ring([[0, 0], [5, 0.01], [10, 0], [10, 10], [0, 10], [0, 0]])
+        self.assertEqual(douglas_peucker(points, 0.1).tolist(), [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+
+    def test_short_lines(self):
+        points = np.array([[0, 0], [1, 1]], dtype=np.float64)
+        self.assertIs(douglas_peucker(points, 1.0), points)
+
+
+class TestSimplify(unittest.TestCase):
+
+    def test_simplified_rings_stay_closed_with_enough_points(self):
+        wiggly = [[x / 10, 0.001 * (x % 2)] for x in range(100)] + [[10, 10], [0, 10], [0, 0]]
+        simplified = simplify({"type": "Polygon", "coordinates": [wiggly, HOLE]}, 1.0)
+        outer, hole = simplified["coordinates"]
+        self.assertEqual(outer[0], outer[-1])
+        self.assertGreaterEqual(len(outer), MIN_RING_POINTS)
+        self.assertLess(len(outer), len(wiggly))
+        self.assertEqual(hole, HOLE)
+
+    def test_never_collapses_a_ring(self):
+        simplified = simplify({"type": "Polygon", "coordinates": [SQUARE]}, 100.0)
+        self.assertEqual(simplified["coordinates"], [SQUARE])
+
+    def test_keeps_other_members(self):
+        geo_json = {
+            "type": "Feature",
+            "id": "x",
+            "properties": {"name": "area"},
+            "geometry": {"type": "LineString", "coordinates": [[0, 0], [1, 0], [2, 0]]},
+        }
+        simplified = simplify(geo_json, 0.1)
+        self.assertEqual(simplified["properties"], {"name": "area"})
+        self.assertEqual(simplified["geometry"]["coordinates"], [[0, 0], [2, 0]])
+
+    def test_polygon_caches_simplified_body(self):
+        polygon = Polygon(json.dumps({"type": "Polygon", "coordinates": [SQUARE]}).encode())
+        self.assertIs(polygon.simplified(None), polygon.body)
+        self.assertIs(polygon.simplified(1.0), polygon.simplified(1.0))
+        self.assertEqual(len(polygon.polygons), 1)
+
+
+EX = "http://example.com/"
+# Around (-0.1, 51.5), with a wiggle along its southern edge that simplifying removes
+AREA = [[-0.2 + i * 0.01, 51.4 + 0.0001 * (i % 2)] for i in range(20)] + [
+    [0.0, 51.4], [0.0, 51.6], [-0.2, 51.6], [-0.2, 51.4]
+]
+POLYGONS = {
+    EX + "polygon/area": json.dumps({"type": "Polygon", "coordinates": [AREA]}),
+    EX + "polygon/elsewhere": json.dumps({"type": "Polygon", "coordinates": [[[1, 1], [2, 1], [2, 2], [1, 1]]]}),
+}
+
+
+def literal(value: str) -> dict:
+    return {"type": "literal", "value": value}
+
+
+def uri(value: str) -> dict:
+    return {"type": "uri", "value": EX + value}
+
+
+FLOOD_AREAS = [
+    {
+        "floodWatchArea": uri("watch/1"), "floodWatchAreaName": literal("Watch 1"), "geoJsonUri": uri("polygon/area"),
+        "floodArea": uri("area/1"), "floodAreaName": literal("Area 1"), "faGeoJsonUri": uri("polygon/area"),
+    },
+    {
+        "floodWatchArea": uri("watch/1"), "floodWatchAreaName": literal("Watch 1"), "geoJsonUri": uri("polygon/area"),
+        "floodArea": uri("area/2"), "floodAreaName": literal("Area 2"), "faGeoJsonUri": uri("polygon/elsewhere"),
+    },
+]
+
+
+def building(name: str, lat: str, lon: str) -> dict:
+    return {
+        "building": uri(name), "uprn_id": literal(name), "building_types": literal(EX + "Building;" + EX + "House"),
+        "lat_literal": literal(lat), "lon_literal": literal(lon), "epc_rating": uri("RatingC"), "name": literal(name),
+    }
+
+
+def asset(name: str, lat: str, lon: str) -> dict:
+    return {"uri": uri(name), "type": uri("Facility"), "lat": literal(lat), "lon": literal(lon)}
+
+
+class FakeJena:
+    """
+    Answers the flood area, polygon, building and asset queries from canned bindings, recording the template of each
+    query it is sent
+    """
+    def __init__(self):
+        self.queries: list[str] = []
+
+    async def get(self, query, headers=None, timeout=None):
+        self.queries.append(query.template)
+        if query.template == queries.FLOOD_AREAS.name:
+            bindings = FLOOD_AREAS
+        elif query.template == queries.FLOOD_AREA_POLYGONS.name:
+            polygons = re.findall(r"<([^>]*)>", re.search(r"VALUES \?polygon \{([^}]*)\}", query).group(1))
+            bindings = [
+                {"polygon": {"type": "uri", "value": polygon}, "geoJsonValue": literal(POLYGONS[polygon])}
+                for polygon in polygons if polygon in POLYGONS
+            ]
+        elif query.template == queries.BUILDINGS.name:
+            bindings = [building("inside", "51.5", "-0.1"), building("outside", "52.5", "-0.1")]
+        else:
+            bindings = [asset("inside", "51.45", "-0.05"), asset("outside", "51.5", "0.1")]
+        return {"head": {"vars": list(bindings[0]) if bindings else []}, "results": {"bindings": bindings}}
+
+
+class TestFloodAreaIndex(unittest.TestCase):
+
+    def test_serialises_the_areas_once(self):
+        areas = [{"uri": "a", "name": "A", "polygon_uri": "p", "flood_areas": [
+            {"uri": "b", "name": "B", "polygon_uri": "q"},
+        ]}]
+        index = FloodAreaIndex(areas)
+        self.assertEqual(json.loads(index.body), areas)
+        self.assertEqual(index.polygon_uris, {"p", "q"})
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.etag, FloodAreaIndex(json.loads(index.body)).etag)
+        self.assertNotEqual(index.etag, FloodAreaIndex([]).etag)
+
+
+class TestPolygonStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.store = PolygonStore()
+        self.fetched: list[list[str]] = []
+
+    async def fetch(self, uris: list[str]) -> dict[str, str]:
+        self.fetched.append(uris)
+        return {uri: POLYGONS[uri] for uri in uris if uri in POLYGONS}
+
+    async def test_fetches_only_missing_polygons_together(self):
+        area, elsewhere, unknown = EX + "polygon/area", EX + "polygon/elsewhere", EX + "polygon/unknown"
+        first = await self.store.get_many("alice", [area], self.fetch)
+        polygons = await self.store.get_many("alice", [elsewhere, unknown, area], self.fetch)
+        self.assertEqual(list(polygons), [elsewhere, area])
+        self.assertIs(polygons[area], first[area])
+        self.assertEqual(polygons[area].body, POLYGONS[area].encode())
+        self.assertEqual(self.fetched, [[area], [elsewhere, unknown]])
+
+    async def test_polygons_are_kept_per_identity(self):
+        await self.store.get_many("alice", [EX + "polygon/area"], self.fetch)
+        await self.store.get_many("bob", [EX + "polygon/area"], self.fetch)
+        self.assertEqual(len(self.fetched), 2)
+        self.store.clear()
+        await self.store.get_many("alice", [EX + "polygon/area"], self.fetch)
+        self.assertEqual(len(self.fetched), 3)
+
+
+class TestFloodEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+        self.jena = FakeJena()
+        patcher = mock.patch.object(paralog_app.jena, "get", self.jena.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for view in [
+            paralog_app.flood_indexes, paralog_app.polygon_store, paralog_app.polygon_joins, paralog_app.spatial_indexes
+        ]:
+            view.clear()
+            self.addCleanup(view.clear)
+
+    def test_flood_watch_areas(self):
+        response = self.client.get("/flood-watch-areas")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{
+            "uri": EX + "watch/1",
+            "name": "Watch 1",
+            "polygon_uri": EX + "polygon/area",
+            "flood_areas": [
+                {"uri": EX + "area/1", "name": "Area 1", "polygon_uri": EX + "polygon/area"},
+                {"uri": EX + "area/2", "name": "Area 2", "polygon_uri": EX + "polygon/elsewhere"},
+            ],
+        }])
+        not_modified = self.client.get("/flood-watch-areas", headers={"If-None-Match": response.headers["etag"]})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.jena.queries, [queries.FLOOD_AREAS.name])
+
+    def test_polygon(self):
+        response = self.client.get("/flood-watch-areas/polygon", params={"polygon_uri": EX + "polygon/area"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), json.loads(POLYGONS[EX + "polygon/area"]))
+        self.assertEqual(response.headers["cache-control"], paralog_app.CACHE_CONTROL)
+        not_modified = self.client.get(
+            "/flood-watch-areas/polygon",
+            params={"polygon_uri": EX + "polygon/area"},
+            headers={"If-None-Match": response.headers["etag"]},
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers["etag"], response.headers["etag"])
+        self.assertEqual(not_modified.headers["cache-control"], paralog_app.CACHE_CONTROL)
+        self.assertEqual(self.jena.queries, [queries.FLOOD_AREA_POLYGONS.name])
+
+    def test_simplified_polygon(self):
+        params = {"polygon_uri": EX + "polygon/area"}
+        full = self.client.get("/flood-watch-areas/polygon", params=params)
+        response = self.client.get("/flood-watch-areas/polygon", params={**params, "tolerance": 0.001})
+        self.assertEqual(response.status_code, 200)
+        ring = response.json()["coordinates"][0]
+        self.assertEqual(ring, [[-0.2, 51.4], [0.0, 51.4], [0.0, 51.6], [-0.2, 51.6], [-0.2, 51.4]])
+        self.assertNotEqual(response.headers["etag"], full.headers["etag"])
+        # Each tolerance has its own ETag
+        for tolerance, status in [(0.001, 304), (0.0001, 200)]:
+            with self.subTest(tolerance=tolerance):
+                conditional = self.client.get(
+                    "/flood-watch-areas/polygon",
+                    params={**params, "tolerance": tolerance},
+                    headers={"If-None-Match": response.headers["etag"]},
+                )
+                self.assertEqual(conditional.status_code, status)
+        zero = self.client.get("/flood-watch-areas/polygon", params={**params, "tolerance": 0})
+        self.assertEqual(zero.status_code, 422)
+        self.assertEqual(len(self.jena.queries), 1)
+
+    def test_unknown_polygon(self):
+        response = self.client.get("/flood-watch-areas/polygon", params={"polygon_uri": EX + "polygon/unknown"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json())
+
+    def test_polygons(self):
+        uris = [EX + "polygon/elsewhere", EX + "polygon/unknown", EX + "polygon/area", EX + "polygon/elsewhere"]
+        response = self.client.post("/flood-watch-areas/polygons", json={"uris": uris})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {uri: json.loads(POLYGONS[uri]) for uri in [uris[0], uris[2]]})
+        # A POST cannot be made conditional, so an ETag would be of no use
+        self.assertNotIn("etag", response.headers)
+        simplified = self.client.post("/flood-watch-areas/polygons", json={"uris": uris, "tolerance": 0.001})
+        self.assertEqual(len(simplified.json()[EX + "polygon/area"]["coordinates"][0]), 5)
+        # Polygons that do not exist are not held in the store, so are looked up again
+        self.assertEqual(self.jena.queries, [queries.FLOOD_AREA_POLYGONS.name] * 2)
+
+    def test_polygons_in_chunks(self):
+        uris = [EX + "polygon/area", EX + "polygon/elsewhere", EX + "polygon/unknown"]
+        with mock.patch.object(paralog_app, "FLOOD_POLYGON_CHUNK_SIZE", 2):
+            response = self.client.post("/flood-watch-areas/polygons", json={"uris": uris})
+        self.assertEqual(list(response.json()), uris[:2])
+        self.assertEqual(self.jena.queries, [queries.FLOOD_AREA_POLYGONS.name] * 2)
+
+    def test_rejects_too_many_polygons(self):
+        with mock.patch.object(paralog_app, "FLOOD_POLYGON_MAX_SIZE", 1):
+            response = self.client.post("/flood-watch-areas/polygons", json={"uris": [EX + "a", EX + "b"]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.jena.queries, [])
+
+    def test_buildings_in_polygon(self):
+        params = {"polygon_uri": EX + "polygon/area"}
+        response = self.client.get("/flood-watch-areas/polygon/buildings", params=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([building["uri"] for building in response.json()], [EX + "inside"])
+        self.assertEqual(response.json()[0]["types"], [EX + "Building", EX + "House"])
+        # The join is cached against the spatial index and the polygon
+        self.assertEqual(self.client.get("/flood-watch-areas/polygon/buildings", params=params).json(), response.json())
+        self.assertEqual(self.jena.queries, [queries.FLOOD_AREA_POLYGONS.name, queries.BUILDINGS.name])
+        self.assertEqual(len(paralog_app.polygon_joins), 1)
+
+    def test_assets_in_polygon(self):
+        response = self.client.get(
+            "/flood-watch-areas/polygon/assets",
+            params={"polygon_uri": EX + "polygon/area", "assessment": EX + "assessment"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([asset["uri"] for asset in response.json()], [EX + "inside"])
+
+    def test_points_in_unknown_polygon(self):
+        for path, params in [
+            ("/flood-watch-areas/polygon/buildings", {}),
+            ("/flood-watch-areas/polygon/assets", {"assessment": EX + "assessment"}),
+        ]:
+            with self.subTest(path=path):
+                response = self.client.get(path, params={"polygon_uri": EX + "polygon/unknown", **params})
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.jena.queries, [queries.FLOOD_AREA_POLYGONS.name] * 2)
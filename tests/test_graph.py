@@ -0,0 +1,89 @@
+import unittest
+
+from paralog.graph import DEPENDENTS, PROVIDERS, DependencyIndex, to_rating
+
+
+def binding(dependency: str, provider: str, dependent: str, rating=None) -> dict:
+    row = {
+        "dependencyUri": {"type": "uri", "value": dependency},
+        "providerNode": {"type": "uri", "value": provider},
+        "dependentNode": {"type": "uri", "value": dependent},
+    }
+    if rating is not None:
+        row["criticalityRating"] = {"type": "literal", "value": str(rating)}
+    return row
+
+
+def dependencies(*edges: tuple) -> DependencyIndex:
+    """
+    An index over (provider, dependent, rating) edges
+    """
+    return DependencyIndex([binding(f"d{i}", *edge) for i, edge in enumerate(edges)])
+
+
+def reached(index: DependencyIndex, uri: str, direction: str = DEPENDENTS, depth: int = 10, max_nodes: int = 100):
+    assets, truncated = index.traverse(uri, direction, depth, max_nodes)
+    return {asset["uri"]: (asset["distance"], asset["criticality"]) for asset in assets}, truncated
+
+
+class TestDependencyIndex(unittest.TestCase):
+
+    def test_interns_nodes_and_keeps_one_row_per_dependency(self):
+        index = DependencyIndex([
+            binding("d1", "a", "b", 2),
+            binding("d1", "a", "b", 2),
+            binding("d2", "b", "c"),
+        ])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.uris, ["a", "b", "c"])
+        self.assertEqual(index.providers.tolist(), [0, 1])
+        self.assertEqual(index.dependents.tolist(), [1, 2])
+        self.assertEqual(index.ratings.tolist(), [2.0, 0.0])
+        self.assertGreater(index.nbytes(), 0)
+
+    def test_ratings_that_are_not_numbers_count_as_zero(self):
+        self.assertEqual(to_rating("3"), 3.0)
+        self.assertEqual(to_rating("high"), 0.0)
+        self.assertEqual(to_rating(None), 0.0)
+
+
+class TestTraverse(unittest.TestCase):
+
+    def setUp(self):
+        # a -> b -> c -> d, and a -> e -> d
+        self.index = dependencies(("a", "b", 1), ("b", "c", 2), ("c", "d", 3), ("a", "e", 5), ("e", "d", 1))
+
+    def test_traverses_dependents(self):
+        assets, truncated = reached(self.index, "a")
+        self.assertEqual(assets, {"b": (1, 1.0), "e": (1, 5.0), "c": (2, 3.0), "d": (2, 6.0)})
+        self.assertFalse(truncated)
+
+    def test_traverses_providers(self):
+        assets, _ = reached(self.index, "d", PROVIDERS)
+        self.assertEqual(assets, {"c": (1, 3.0), "e": (1, 1.0), "b": (2, 5.0), "a": (2, 6.0)})
+
+    def test_stops_at_depth(self):
+        for depth, expected in [(0, set()), (1, {"b", "e"}), (2, {"b", "c", "d", "e"})]:
+            with self.subTest(depth=depth):
+                self.assertEqual(set(reached(self.index, "a", depth=depth)[0]), expected)
+
+    def test_terminates_on_cycles(self):
+        index = dependencies(("a", "b", 1), ("b", "c", 1), ("c", "a", 1), ("c", "d", 1))
+        assets, truncated = reached(index, "a", depth=100)
+        self.assertEqual(assets, {"b": (1, 1.0), "c": (2, 2.0), "d": (3, 3.0)})
+        self.assertFalse(truncated)
+
+    def test_leaf_and_unknown_assets(self):
+        self.assertEqual(reached(self.index, "d"), ({}, False))
+        self.assertEqual(reached(self.index, "z"), ({}, False))
+
+    def test_keeps_most_critical_assets_when_truncated(self):
+        index = dependencies(("a", "b", 1), ("a", "c", 3), ("a", "d", 2), ("c", "e", 1))
+        assets, truncated = reached(index, "a", max_nodes=2)
+        self.assertEqual(assets, {"c": (1, 3.0), "d": (1, 2.0)})
+        self.assertTrue(truncated)
+
+    def test_not_truncated_at_exactly_max_nodes(self):
+        assets, truncated = reached(self.index, "a", max_nodes=4)
+        self.assertEqual(len(assets), 4)
+        self.assertFalse(truncated)
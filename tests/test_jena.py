@@ -0,0 +1,150 @@
+import functools
+import json
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs
+
+import httpx
+
+from paralog.jena import MAX_GET_QUERY_LENGTH, SPARQL_RESULTS_JSON, JenaConnector
+
+RESULTS = {"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://example.com/a"}}]}}
+
+
+class CutShort(httpx.AsyncByteStream):
+    """
+    A response body that stops part way through, as when Jena drops the connection
+    """
+    async def __aiter__(self):
+        yield b'{"head": {"vars": ["s"]}, "results": {"bindings": ['
+        raise httpx.RemoteProtocolError("peer closed connection without sending complete message body")
+
+
+class TestJenaConnector(unittest.IsolatedAsyncioTestCase):
+
+    def connect(self, handler, **kwargs) -> JenaConnector:
+        """
+        A connector whose client, built as usual, sends its requests to `handler` rather than Jena
+        """
+        self.requests: list[httpx.Request] = []
+
+        def record(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            self.assertEqual(jena.in_flight, 1)
+            return handler(request)
+
+        patcher = mock.patch.object(
+            httpx, "AsyncClient", functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(record))
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        jena = JenaConnector("jena.invalid", 3030, "ds", **kwargs)
+        self.addAsyncCleanup(jena.aclose)
+        return jena
+
+    @staticmethod
+    def query_of(request: httpx.Request) -> str:
+        if request.method == "POST":
+            return parse_qs(request.content.decode())["query"][0]
+        return request.url.params["query"]
+
+    async def test_short_queries_are_sent_in_the_url(self):
+        jena = self.connect(lambda request: httpx.Response(200, json=RESULTS))
+        query = "SELECT * WHERE { ?s ?p ?o } " + "#" * (MAX_GET_QUERY_LENGTH - 28)
+        self.assertEqual(len(query), MAX_GET_QUERY_LENGTH)
+        self.assertEqual(await jena.get(query), RESULTS)
+        request = self.requests[0]
+        self.assertEqual(request.method, "GET")
+        self.assertEqual(str(request.url).split("?")[0], "http://jena.invalid:3030/ds/query")
+        self.assertEqual(self.query_of(request), query)
+        self.assertEqual(request.headers["accept"], SPARQL_RESULTS_JSON)
+
+    async def test_long_queries_are_posted(self):
+        jena = self.connect(lambda request: httpx.Response(200, json=RESULTS))
+        query = "SELECT * WHERE { ?s ?p ?o } " + "#" * (MAX_GET_QUERY_LENGTH - 27)
+        self.assertEqual(await jena.get(query), RESULTS)
+        request = self.requests[0]
+        self.assertEqual(request.method, "POST")
+        self.assertEqual(request.url.params, httpx.QueryParams())
+        self.assertEqual(request.headers["content-type"], "application/x-www-form-urlencoded")
+        self.assertEqual(self.query_of(request), query)
+
+    async def test_forwards_identity_headers(self):
+        jena = self.connect(lambda request: httpx.Response(200, json=RESULTS))
+        headers = {"x-amzn-oidc-identity": "alice", "Accept": "text/csv"}
+        await jena.get("SELECT 1", headers=headers)
+        [chunk async for chunk in jena.stream("SELECT 1", headers=headers)]
+        for request in self.requests:
+            self.assertEqual(request.headers["x-amzn-oidc-identity"], "alice")
+            self.assertEqual(request.headers["accept"], SPARQL_RESULTS_JSON)
+        self.assertEqual(headers["Accept"], "text/csv")
+
+    async def test_uses_digest_auth(self):
+        challenge = 'Digest realm="jena", nonce="abc123", qop="auth", algorithm=MD5'
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if not request.headers.get("authorization", "").startswith("Digest "):
+                return httpx.Response(401, headers={"www-authenticate": challenge})
+            return httpx.Response(200, json=RESULTS)
+
+        jena = self.connect(handler, user="admin", pwd="secret")
+        self.assertEqual(await jena.get("SELECT 1"), RESULTS)
+        self.assertEqual(len(self.requests), 2)
+        authorization = self.requests[1].headers["authorization"]
+        self.assertIn('username="admin"', authorization)
+        self.assertIn('realm="jena"', authorization)
+        self.assertNotIn("secret", authorization)
+
+    async def test_no_auth_without_credentials(self):
+        jena = self.connect(lambda request: httpx.Response(200, json=RESULTS), user="admin")
+        await jena.get("SELECT 1")
+        self.assertNotIn("authorization", self.requests[0].headers)
+
+    async def test_raises_for_error_statuses(self):
+        for status in [400, 403, 500, 503]:
+            with self.subTest(status=status):
+                jena = self.connect(lambda request, status=status: httpx.Response(status, text="error"))
+                with self.assertRaises(httpx.HTTPStatusError):
+                    await jena.get("SELECT 1")
+                with self.assertRaises(httpx.HTTPStatusError):
+                    [chunk async for chunk in jena.stream("SELECT 1")]
+                self.assertEqual(jena.in_flight, 0)
+                self.assertEqual(jena.stats()["requests"], 2)
+
+    async def test_in_flight_is_released_after_each_query(self):
+        jena = self.connect(lambda request: httpx.Response(200, json=RESULTS))
+        await jena.get("SELECT 1")
+        self.assertEqual(jena.in_flight, 0)
+        self.assertEqual(json.loads("".join([chunk async for chunk in jena.stream("SELECT 1")])), RESULTS)
+        self.assertEqual(jena.in_flight, 0)
+        self.assertEqual(jena.stats()["requests"], 2)
+
+    async def test_in_flight_is_released_when_the_request_fails(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ConnectError("connection refused", request=request)
+
+        jena = self.connect(handler)
+        with self.assertRaises(httpx.ConnectError):
+            await jena.get("SELECT 1")
+        with self.assertRaises(httpx.ConnectError):
+            [chunk async for chunk in jena.stream("SELECT 1")]
+        self.assertEqual(jena.in_flight, 0)
+
+    async def test_stream_raises_when_the_response_is_cut_short(self):
+        jena = self.connect(lambda request: httpx.Response(200, stream=CutShort()))
+        chunks = []
+        with mock.patch("paralog.jena.metrics.query_failed") as query_failed:
+            with self.assertRaises(httpx.RemoteProtocolError):
+                async for chunk in jena.stream("SELECT 1"):
+                    chunks.append(chunk)
+        self.assertEqual(len(chunks), 1)
+        query_failed.assert_called_once_with("SELECT 1")
+        self.assertEqual(jena.in_flight, 0)
+
+    async def test_stream_closed_early_releases_the_query(self):
+        jena = self.connect(lambda request: httpx.Response(200, json=RESULTS))
+        chunks = jena.stream("SELECT 1")
+        await anext(chunks)
+        self.assertEqual(jena.in_flight, 1)
+        await chunks.aclose()
+        self.assertEqual(jena.in_flight, 0)
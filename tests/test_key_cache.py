@@ -0,0 +1,163 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from jwt.exceptions import PyJWKClientError
+
+from paralog.key_cache import PublicKeyCache
+
+JWKS_URL = "http://jwks.invalid/keys"
+PUBLIC_KEY_URL = "http://elb.invalid/keys/"
+
+
+class Clock:
+    """
+    Stands in for time.monotonic, only moving when told to. It starts shortly after zero, as on a freshly booted host.
+    """
+    def __init__(self):
+        self.now = 5.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def private_key() -> rsa.RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def jwk(key: rsa.RSAPrivateKey, kid: str) -> dict:
+    return {**json.loads(RSAAlgorithm.to_jwk(key.public_key())), "kid": kid, "use": "sig"}
+
+
+class KeyCacheTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("paralog.key_cache.time", mock.Mock(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.requests: list[httpx.Request] = []
+
+    def make_key_cache(self, handler, **kwargs) -> PublicKeyCache:
+        def record(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            return handler(request)
+
+        key_cache = PublicKeyCache(**kwargs)
+        key_cache._client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+        self.addAsyncCleanup(key_cache.aclose)
+        return key_cache
+
+
+class TestJwks(KeyCacheTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.keys = {"a": private_key(), "b": private_key()}
+        self.published = ["a"]
+        self.key_cache = self.make_key_cache(
+            lambda request: httpx.Response(200, json={"keys": [jwk(self.keys[kid], kid) for kid in self.published]}),
+            jwks_url=JWKS_URL,
+            ttl=300,
+            min_refresh_interval=10,
+        )
+
+    def assertKey(self, key, kid: str):
+        self.assertEqual(key.public_numbers(), self.keys[kid].public_key().public_numbers())
+
+    async def test_first_lookup_fetches_soon_after_boot(self):
+        self.assertKey(await self.key_cache.get_signing_key("a"), "a")
+        self.assertEqual([str(request.url) for request in self.requests], [JWKS_URL])
+
+    async def test_known_keys_are_served_from_the_cache(self):
+        await self.key_cache.get_signing_key("a")
+        self.clock.now += 299
+        self.assertKey(await self.key_cache.get_signing_key("a"), "a")
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_unknown_kid_refreshes_at_most_once_per_interval(self):
+        await self.key_cache.get_signing_key("a")
+        self.published = ["a", "b"]
+        with self.assertRaises(PyJWKClientError):
+            await self.key_cache.get_signing_key("b")
+        self.assertEqual(len(self.requests), 1)
+
+        self.clock.now += 10
+        self.assertKey(await self.key_cache.get_signing_key("b"), "b")
+        self.assertEqual(len(self.requests), 2)
+
+        with self.assertRaises(PyJWKClientError):
+            await self.key_cache.get_signing_key("c")
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_keys_are_refetched_after_their_ttl(self):
+        await self.key_cache.get_signing_key("a")
+        self.published = ["b"]
+        self.clock.now += 301
+        # The refreshed set no longer has the rotated-out key
+        with self.assertRaises(PyJWKClientError):
+            await self.key_cache.get_signing_key("a")
+        self.assertEqual(len(self.requests), 2)
+        self.assertKey(await self.key_cache.get_signing_key("b"), "b")
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_concurrent_lookups_share_one_fetch(self):
+        keys = await asyncio.gather(*(self.key_cache.get_signing_key("a") for _ in range(5)))
+        for key in keys:
+            self.assertKey(key, "a")
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_clear_forgets_keys_and_the_last_refresh(self):
+        await self.key_cache.get_signing_key("a")
+        self.key_cache.clear()
+        await self.key_cache.get_signing_key("a")
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_failed_fetches_raise(self):
+        key_cache = self.make_key_cache(lambda request: httpx.Response(503), jwks_url=JWKS_URL)
+        with self.assertRaisesRegex(PyJWKClientError, "Fail to fetch"):
+            await key_cache.get_signing_key("a")
+
+    async def test_tokens_without_kid_are_rejected(self):
+        with self.assertRaisesRegex(PyJWKClientError, "no kid"):
+            await self.key_cache.get_signing_key(None)
+        self.assertEqual(self.requests, [])
+
+
+class TestElbPublicKey(KeyCacheTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.private_key = private_key()
+        pem = self.private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.key_cache = self.make_key_cache(
+            lambda request: httpx.Response(200, content=pem), public_key_url=PUBLIC_KEY_URL
+        )
+
+    async def test_fetches_and_loads_pem_keys(self):
+        key = await self.key_cache.get_signing_key("kid/1")
+        self.assertEqual(key.public_numbers(), self.private_key.public_key().public_numbers())
+        self.assertEqual(str(self.requests[0].url), PUBLIC_KEY_URL + "kid%2F1")
+
+    async def test_keys_are_fetched_per_kid_and_cached(self):
+        await asyncio.gather(*(self.key_cache.get_signing_key("a") for _ in range(3)))
+        await self.key_cache.get_signing_key("a")
+        self.assertEqual(len(self.requests), 1)
+        await self.key_cache.get_signing_key("b")
+        self.assertEqual(len(self.requests), 2)
+        self.clock.now += 301
+        await self.key_cache.get_signing_key("a")
+        self.assertEqual(len(self.requests), 3)
+
+    async def test_keys_that_are_not_pem_are_kept_as_text(self):
+        key_cache = self.make_key_cache(
+            lambda request: httpx.Response(200, text="a-shared-secret"), public_key_url=PUBLIC_KEY_URL
+        )
+        self.assertEqual(await key_cache.get_signing_key("a"), "a-shared-secret")
@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from paralog import app as paralog_app
+from paralog import metrics
+
+
+def literal(value: str) -> dict:
+    return {"type": "literal", "value": value}
+
+
+BUILDING = {
+    "building": {"type": "uri", "value": "http://example.com/b100"},
+    "uprn_id": literal("100"),
+    "building_types": literal("http://example.com/Building"),
+    "lat_literal": literal("51.5"),
+    "lon_literal": literal("-0.1"),
+    "epc_rating": {"type": "uri", "value": "http://example.com/RatingC"},
+    "name": literal("1 High Street"),
+    "sap_points": literal("71"),
+    "postcode_literal": literal("AB1 2CD"),
+    "line_of_address_literal": literal("1 High Street"),
+}
+
+
+def requests_recorded(route: str, status: int, method: str = "GET") -> float:
+    labels = {"route": route, "method": method, "status": str(status)}
+    return metrics.registry.get_sample_value("paralog_request_seconds_count", labels) or 0.0
+
+
+class TestRequestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+
+        async def get(query, headers=None, timeout=None):
+            return {"head": {"vars": list(BUILDING)}, "results": {"bindings": [BUILDING]}}
+
+        patcher = mock.patch.object(paralog_app.jena, "get", get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_are_labelled_with_their_route_template(self):
+        before = requests_recorded("/buildings/{uprn}", 200)
+        for uprn in ["100", "200", "300"]:
+            self.assertEqual(self.client.get(f"/buildings/{uprn}").status_code, 200)
+        self.assertEqual(requests_recorded("/buildings/{uprn}", 200), before + 3)
+        self.assertEqual(requests_recorded("/buildings/100", 200), 0)
+
+    def test_unmatched_paths_share_one_label(self):
+        before = requests_recorded(metrics.UNMATCHED, 404)
+        for path in ["/no/such/path", "/another/missing/path"]:
+            self.assertEqual(self.client.get(path).status_code, 404)
+        self.assertEqual(requests_recorded(metrics.UNMATCHED, 404), before + 2)
+        self.assertEqual(requests_recorded("/no/such/path", 404), 0)
+
+    def test_errors_are_labelled_with_their_status(self):
+        before = requests_recorded("/buildings/details", 422, "POST")
+        self.assertEqual(self.client.post("/buildings/details", json={}).status_code, 422)
+        self.assertEqual(requests_recorded("/buildings/details", 422, "POST"), before + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get("/buildings/100")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], metrics.CONTENT_TYPE)
+        text = response.text
+        self.assertIn("# TYPE paralog_request_seconds histogram", text)
+        self.assertIn('paralog_request_seconds_count{method="GET",route="/buildings/{uprn}",status="200"}', text)
+        self.assertIn('paralog_cache_hits_total{cache="results"}', text)
@@ -0,0 +1,115 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from paralog import ontology
+from paralog.ontology import OntologyIndex
+
+EX = "http://example.com/ont#"
+
+TURTLE = """
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix ex: <http://example.com/ont#> .
+
+ex:Building rdfs:subClassOf ex:Structure .
+ex:Structure rdfs:subClassOf ex:Asset .
+ex:House rdfs:subClassOf ex:Building, ex:Dwelling .
+ex:Dwelling rdfs:subClassOf ex:Asset .
+"""
+
+
+class TestOntologyIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = OntologyIndex({
+            "house": ("building", "dwelling"),
+            "building": ("structure",),
+            "structure": ("asset",),
+            "dwelling": ("asset",),
+        })
+
+    def test_ancestors_are_nearest_first(self):
+        self.assertEqual(self.index.get_ancestors("house"), ["building", "dwelling", "structure", "asset"])
+        self.assertEqual(self.index.get_ancestors("structure"), ["asset"])
+        self.assertEqual(self.index.get_ancestors("asset"), [])
+        self.assertEqual(self.index.get_ancestors("unknown"), [])
+
+    def test_ancestors_tolerate_cycles(self):
+        index = OntologyIndex({"a": ("b",), "b": ("c",), "c": ("a",)})
+        self.assertEqual(index.get_ancestors("a"), ["b", "c"])
+
+    def test_subclasses_and_superclasses(self):
+        self.assertEqual(self.index.subclasses["asset"], ("structure", "dwelling"))
+        self.assertEqual(self.index.get_class("house"), {"house": {"superClass": ["building", "dwelling"]}})
+        self.assertEqual(
+            self.index.get_superclasses(("building", "unknown")), {"building": {"superClass": ["structure"]}}
+        )
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.ttl = os.path.join(directory.name, "ont.ttl")
+        with open(self.ttl, "w") as f:
+            f.write(TURTLE)
+        self.paths = (self.ttl,)
+        self.snapshot = os.path.join(directory.name, "ontology.snapshot")
+
+    def load(self) -> OntologyIndex:
+        return ontology.load(self.snapshot, self.paths)
+
+    def assertParsed(self, index: OntologyIndex):
+        self.assertEqual(index.get_ancestors(EX + "House")[:2], [EX + "Building", EX + "Dwelling"])
+        self.assertEqual(set(index.get_ancestors(EX + "House")[2:]), {EX + "Structure", EX + "Asset"})
+
+    def test_parses_and_writes_a_missing_snapshot(self):
+        with self.assertLogs("paralog.ontology", "WARNING"):
+            self.assertParsed(self.load())
+        self.assertTrue(os.path.exists(self.snapshot))
+
+    def test_loads_the_snapshot_without_parsing(self):
+        ontology.write_snapshot(ontology.parse(self.paths), self.snapshot, self.paths)
+        with mock.patch("paralog.ontology.parse") as parse:
+            self.assertParsed(self.load())
+        parse.assert_not_called()
+
+    def test_rebuilds_a_stale_snapshot(self):
+        self.load()
+        with open(self.ttl, "a") as f:
+            f.write(f"<{EX}Flat> <http://www.w3.org/2000/01/rdf-schema#subClassOf> <{EX}Dwelling> .\n")
+        with self.assertLogs("paralog.ontology", "WARNING") as logs:
+            index = self.load()
+        self.assertIn("stale", logs.output[0])
+        self.assertEqual(index.get_ancestors(EX + "Flat"), [EX + "Dwelling", EX + "Asset"])
+        # The rewritten snapshot is current again
+        with mock.patch("paralog.ontology.parse") as parse:
+            self.assertEqual(self.load().get_ancestors(EX + "Flat"), [EX + "Dwelling", EX + "Asset"])
+        parse.assert_not_called()
+
+    def test_rebuilds_a_snapshot_from_another_version(self):
+        self.load()
+        with open(self.snapshot, "rb") as f:
+            data = pickle.load(f)
+        with open(self.snapshot, "wb") as f:
+            pickle.dump({**data, "version": ontology.SNAPSHOT_VERSION + 1, "superclasses": {}}, f)
+        with self.assertLogs("paralog.ontology", "WARNING"):
+            self.assertParsed(self.load())
+
+    def test_rebuilds_a_corrupt_snapshot(self):
+        for content in [b"", b"not a pickle", pickle.dumps(["not", "a", "dict"])]:
+            with self.subTest(content=content):
+                with open(self.snapshot, "wb") as f:
+                    f.write(content)
+                with self.assertLogs("paralog.ontology", "WARNING") as logs:
+                    self.assertParsed(self.load())
+                self.assertIn("could not be loaded", logs.output[0])
+
+    def test_unwritable_snapshot_still_loads(self):
+        with mock.patch("paralog.ontology.write_snapshot", side_effect=PermissionError):
+            with self.assertLogs("paralog.ontology", "WARNING"):
+                self.assertParsed(self.load())
+        self.assertFalse(os.path.exists(self.snapshot))
@@ -0,0 +1,133 @@
+import asyncio
+import re
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from fastapi.testclient import TestClient
+
+from paralog import app as paralog_app
+from paralog import queries, utils
+
+ASSESSMENT = "http://example.com/assessment"
+
+
+def rows(*uris: str) -> list[dict]:
+    return [
+        {"uri": {"type": "uri", "value": uri}, "type": {"type": "uri", "value": "http://example.com/Asset"}}
+        for uri in uris
+    ]
+
+
+class FakeJena:
+    """
+    Answers paged queries from a list of bindings sorted by ?uri, applying the query's key filter and limit
+    """
+    def __init__(self, bindings: list[dict]):
+        self.bindings = bindings
+        self.limits: list[int] = []
+
+    async def get(self, query, headers=None, timeout=None):
+        limit = int(re.search(r"LIMIT (\d+)", query).group(1))
+        after = re.search(r'FILTER \(STR\(\?uri\) > "([^"]*)"\)', query)
+        self.limits.append(limit)
+        bindings = [b for b in self.bindings if after is None or b["uri"]["value"] > after.group(1)]
+        return {"head": {"vars": ["uri"]}, "results": {"bindings": bindings[:limit]}}
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trips_keys(self):
+        for key in ["http://example.com/a", "", "ünïcode / ?&=", "a" * 1000]:
+            with self.subTest(key=key):
+                cursor = utils.encode_cursor(key)
+                self.assertRegex(cursor, r"^[A-Za-z0-9_-]*$")
+                self.assertEqual(utils.decode_cursor(cursor), key)
+
+    def test_rejects_malformed_cursors(self):
+        for cursor in ["!!!", "abc", utils.encode_cursor("x")[:-3], "bnVsbA", "eyJhZnRlciI6IDF9", "W10"]:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                utils.decode_cursor(cursor)
+
+
+class TestPageQuery(unittest.TestCase):
+
+    def test_not_paged_without_limit(self):
+        self.assertEqual(queries._page("uri", None, None), (queries.EMPTY, queries.EMPTY))
+
+    def test_renders_key_filter_and_limit(self):
+        key_filter, page = queries._page("uri", 11, "http://example.com/b")
+        self.assertEqual(key_filter, 'FILTER (STR(?uri) > "http://example.com/b")')
+        self.assertEqual(re.sub(r"\s+", " ", page), "ORDER BY ?uri LIMIT 11")
+
+    def test_first_page_has_no_key_filter(self):
+        key_filter, _ = queries._page("uri", 11, None)
+        self.assertEqual(key_filter, queries.EMPTY)
+
+    def test_paged_query_filters_orders_and_limits(self):
+        query = asyncio.run(queries.get_assets_by_assessment(ASSESSMENT, [], 11, 'http://example.com/"b"'))
+        self.assertIn('FILTER (STR(?uri) > "http://example.com/\\"b\\"")', query)
+        self.assertRegex(query, r"ORDER BY \?uri\s+LIMIT 11")
+
+
+class TestPages(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+
+    def get(self, jena: FakeJena, url: str):
+        with mock.patch.object(paralog_app.jena, "get", jena.get):
+            return self.client.get(url)
+
+    def pages(self, jena: FakeJena, limit: int) -> list[list[str]]:
+        """
+        Follows the next links from the first page, returning the URIs of each page
+        """
+        url = f"/assessments/assets?assessment={ASSESSMENT}&limit={limit}"
+        pages = []
+        while url is not None:
+            response = self.get(jena, url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row["uri"] for row in response.json()])
+            url = response.links.get("next", {}).get("url")
+        return pages
+
+    def test_fetches_one_row_more_than_the_page(self):
+        jena = FakeJena(rows("a", "b", "c"))
+        self.get(jena, f"/assessments/assets?assessment={ASSESSMENT}&limit=2")
+        self.assertEqual(jena.limits, [3])
+
+    def test_links_to_next_page(self):
+        jena = FakeJena(rows("a", "b", "c"))
+        response = self.get(jena, f"/assessments/assets?assessment={ASSESSMENT}&limit=2")
+        self.assertEqual([row["uri"] for row in response.json()], ["a", "b"])
+        next_url = urlparse(response.links["next"]["url"])
+        params = parse_qs(next_url.query)
+        self.assertEqual(next_url.path, "/assessments/assets")
+        self.assertEqual(params["assessment"], [ASSESSMENT])
+        self.assertEqual(params["limit"], ["2"])
+        self.assertEqual(utils.decode_cursor(params["cursor"][0]), "b")
+
+    def test_last_page_has_no_next_link(self):
+        for uris in [("a", "b", "c"), ("a", "b", "c", "d")]:
+            with self.subTest(rows=len(uris)):
+                self.assertEqual(self.pages(FakeJena(rows(*uris)), 2)[-1], list(uris[2:]))
+
+    def test_exactly_full_last_page_has_no_next_link(self):
+        response = self.get(FakeJena(rows("a", "b")), f"/assessments/assets?assessment={ASSESSMENT}&limit=2")
+        self.assertEqual([row["uri"] for row in response.json()], ["a", "b"])
+        self.assertNotIn("link", response.headers)
+
+    def test_empty_results_have_no_next_link(self):
+        response = self.get(FakeJena([]), f"/assessments/assets?assessment={ASSESSMENT}&limit=2")
+        self.assertEqual(response.json(), [])
+        self.assertNotIn("link", response.headers)
+
+    def test_never_splits_a_key_across_pages(self):
+        jena = FakeJena(rows("a", "b", "b", "c", "c", "c", "c", "d"))
+        self.assertEqual(self.pages(jena, 2), [["a"], ["b", "b"], ["c", "c", "c", "c"], ["d"]])
+
+    def test_rejects_malformed_cursor(self):
+        response = self.get(FakeJena([]), f"/assessments/assets?assessment={ASSESSMENT}&limit=2&cursor=!!!")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "invalid cursor"})
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from paralog import app as paralog_app
+from paralog import profiling
+from paralog.templates import QueryTemplate
+
+QUERY = QueryTemplate("get_thing", "SELECT * WHERE { {{thing:iri}} ?p ?o }")
+
+
+def scope(path: str = "/things") -> dict:
+    return {"type": "http", "method": "GET", "path": path}
+
+
+async def receive():
+    return {"type": "http.request"}
+
+
+async def send(message):
+    pass
+
+
+class TestSlowQueryLog(unittest.IsolatedAsyncioTestCase):
+
+    def middleware(self, queries: list[tuple[str, float, int | None]], **kwargs) -> profiling.ProfilingMiddleware:
+        """
+        Middleware around an app that records each of `queries` as answered by Jena in the given seconds
+        """
+        async def app(scope, receive, send):
+            for thing, seconds, rows in queries:
+                query = QUERY.render(thing=thing)
+                profiling.record_query(query, seconds)
+                if rows is not None:
+                    profiling.record_rows(query, rows)
+
+        return profiling.ProfilingMiddleware(app, **kwargs)
+
+    async def test_fast_queries_are_not_logged(self):
+        middleware = self.middleware([("http://example.com/a", 0.2, 3), ("http://example.com/b", 0.9, 1)])
+        with self.assertNoLogs("paralog.profiling"):
+            await middleware(scope(), receive, send)
+
+    async def test_logs_every_query_of_a_request_with_a_slow_query(self):
+        middleware = self.middleware(
+            [("http://example.com/a", 0.25, 3), ("http://example.com/b", 1.5, None)], slow_query_seconds=1.0
+        )
+        with self.assertLogs("paralog.profiling", "WARNING") as logs:
+            await middleware(scope(), receive, send)
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual([record["jena_ms"] for record in records], [250.0, 1500.0])
+        self.assertEqual([record["rows"] for record in records], [3, None])
+        self.assertEqual({record["query"] for record in records}, {"get_thing"})
+        self.assertNotEqual(records[0]["params_hash"], records[1]["params_hash"])
+        self.assertEqual(records[0]["route"], "/things")
+        self.assertEqual(records[0]["method"], "GET")
+        # Query parameters are only logged as a hash
+        self.assertNotIn("example.com", logs.output[0])
+
+    async def test_logs_queries_of_a_slow_request(self):
+        middleware = self.middleware([("http://example.com/a", 0.5, 2)], slow_query_seconds=1.0)
+        with mock.patch("paralog.profiling.time.perf_counter", side_effect=[10.0, 12.0]):
+            with self.assertLogs("paralog.profiling", "WARNING") as logs:
+                await middleware(scope(), receive, send)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["request_ms"], 2000.0)
+        self.assertEqual(record["post_processing_ms"], 1500.0)
+
+    async def test_threshold_can_be_lowered_and_turned_off(self):
+        queries = [("http://example.com/a", 0.05, 1)]
+        with self.assertLogs("paralog.profiling", "WARNING"):
+            await self.middleware(queries, slow_query_seconds=0.01)(scope(), receive, send)
+        with self.assertNoLogs("paralog.profiling"):
+            await self.middleware(queries, slow_query_seconds=0.1)(scope(), receive, send)
+        with self.assertNoLogs("paralog.profiling"):
+            await self.middleware([("http://example.com/a", 60.0, 1)], slow_query_seconds=None)(
+                scope(), receive, send
+            )
+
+    async def test_queries_outside_a_request_are_not_recorded(self):
+        profiling.record_query(QUERY.render(thing="http://example.com/a"), 5.0)
+        with self.assertNoLogs("paralog.profiling"):
+            await self.middleware([])(scope(), receive, send)
+
+
+class TestStackSampler(unittest.TestCase):
+
+    def wait_for_samples(self, sampler: profiling.StackSampler, samples: int):
+        deadline = time.monotonic() + 5
+        while sampler.samples < samples:
+            self.assertLess(time.monotonic(), deadline, "the sampler did not take samples")
+            time.sleep(0.005)
+
+    def test_samples_only_while_started(self):
+        sampler = profiling.StackSampler(interval=0.001)
+        self.assertEqual(sampler.stats(), {"active": 0, "samples": 0, "stacks": 0})
+        sampler.start()
+        self.wait_for_samples(sampler, 3)
+        sampler.stop()
+        self.assertEqual(sampler.stats()["active"], 0)
+        # The sample under way when stopped may still be counted
+        time.sleep(0.02)
+        stopped = sampler.samples
+        time.sleep(0.05)
+        self.assertEqual(sampler.samples, stopped)
+
+        collapsed = sampler.collapsed()
+        self.assertIn("MainThread;", collapsed)
+        self.assertNotIn("paralog-stack-sampler", collapsed)
+        for line in collapsed.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+        sampler.start()
+        self.wait_for_samples(sampler, stopped + 1)
+        sampler.stop()
+        sampler.clear()
+        self.assertEqual(sampler.collapsed(), "")
+
+    def test_middleware_starts_and_stops_the_sampler(self):
+        async def fails(scope, receive, send):
+            raise RuntimeError("failed")
+
+        sampler = mock.Mock(spec=profiling.StackSampler)
+        middleware = profiling.ProfilingMiddleware(fails, sample_rate=1.0, sampler=sampler)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(middleware(scope(), receive, send))
+        sampler.start.assert_called_once_with()
+        sampler.stop.assert_called_once_with()
+
+        sampler.reset_mock()
+        with self.assertRaises(RuntimeError):
+            asyncio.run(profiling.ProfilingMiddleware(fails, sample_rate=0.0, sampler=sampler)(scope(), receive, send))
+        sampler.start.assert_not_called()
+
+
+class TestAdminEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(paralog_app.app)
+
+    def test_not_found_unless_enabled(self):
+        with mock.patch.object(paralog_app, "ADMIN_ENDPOINTS", False):
+            self.assertEqual(self.client.get("/admin/profile").status_code, 404)
+            self.assertEqual(self.client.delete("/admin/profile").status_code, 404)
+            self.assertEqual(self.client.delete("/admin/cache").status_code, 404)
+
+    def test_profile_when_enabled(self):
+        with mock.patch.object(paralog_app, "ADMIN_ENDPOINTS", True):
+            response = self.client.get("/admin/profile")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["content-type"], "text/plain; charset=utf-8")
+            response = self.client.delete("/admin/profile")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(sorted(response.json()), ["cleared", "samples"])
+            self.assertEqual(self.client.get("/admin/profile").text, "")
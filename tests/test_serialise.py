@@ -0,0 +1,175 @@
+import json
+import typing
+import unittest
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from paralog import app as paralog_app
+from paralog import models, serialise
+
+EX = "http://example.com/"
+
+# Rows as the endpoints build them from SPARQL bindings, where every value is a string, and from in-process indexes,
+# where they are numbers. Optional fields are left out, given as None or given a value.
+ASSESSMENT = {"uri": EX + "assessment", "name": "Assessment", "numberOfAssessedItems": "12"}
+ASSET_SUMMARY = {"uri": EX + "a", "type": EX + "Facility", "lat": "51.5", "lon": "-0.1", "dependentCount": "3"}
+CLUSTER = {"lat": 51.25, "lon": "-0.125", "count": 7}
+ASSET = {
+    "uri": EX + "a",
+    "assetType": EX + "Facility",
+    "name": "Asset",
+    "lat": "51.5",
+    "lon": "-1e-1",
+    "address": None,
+    "dependentCount": "2.0",
+    "dependentCriticalitySum": "4",
+    "osmID": "way/1",
+    "extra": "dropped",
+}
+DEPENDENCY = {
+    "dependencyUri": EX + "d",
+    "providerNode": EX + "a",
+    "providerNodeType": EX + "Facility",
+    "dependentNode": EX + "b",
+    "dependentNodeType": EX + "Hospital",
+    "criticalityRating": "3",
+    "dependentName": None,
+}
+BUILDING = {
+    "uri": EX + "b",
+    "uprn": "100",
+    "types": [EX + "Building", EX + "House"],
+    "lat": "51.5",
+    "lon": "-0.1",
+    "epc_rating": EX + "RatingC",
+    "name": "1 High Street",
+}
+FULL_BUILDING = {**BUILDING, "postcode": "AB1 2CD", "address": "1 High Street", "sap_points": "71"}
+
+CASES: list[tuple[typing.Any, typing.Any]] = [
+    (list[models.Assessment], [ASSESSMENT]),
+    (list[models.AssetSummary | models.PointCluster], [ASSET_SUMMARY, CLUSTER, {"uri": EX + "b", "type": EX + "T"}]),
+    (list[models.AssetSummary], [ASSET_SUMMARY, {"uri": EX + "b", "type": EX + "T", "lat": None}]),
+    (list[models.IesType], [{"uri": EX + "T", "assetCount": "5"}, {"uri": EX + "U", "subClassOf": [EX + "T"]}]),
+    (list[models.Dependency], [DEPENDENCY, {**DEPENDENCY, "criticalityRating": None, "osmID": "node/2"}]),
+    (models.AssessmentMetrics, {
+        "assessment": EX + "assessment",
+        "nodes": 2,
+        "edges": 1,
+        "components": 1,
+        "betweennessSamples": 0,
+        "assets": [{
+            "uri": EX + "a",
+            "dependentCount": 1,
+            "dependentCriticalitySum": 3,
+            "providerCount": 0,
+            "providerCriticalitySum": 0.0,
+            "betweenness": 0.5,
+            "component": 0,
+        }],
+    }),
+    (list[models.NetworkComponent], [{"component": 0, "size": 2, "assets": [EX + "a", EX + "b"]}]),
+    (models.Asset, ASSET),
+    (models.Asset, {"uri": EX + "a", "assetType": EX + "Facility"}),
+    (list[models.Asset], [ASSET, {"uri": EX + "b", "assetType": EX + "Facility", "lat": 51.5}]),
+    (dict[str, models.Asset], {EX + "a": ASSET, EX + "b": {"uri": EX + "b", "assetType": EX + "Facility"}}),
+    (models.Impact, {
+        "uri": EX + "a",
+        "direction": "dependents",
+        "depth": 3,
+        "truncated": False,
+        "assets": [{"uri": EX + "b", "distance": 1, "criticality": 2}],
+    }),
+    (list[models.Person], [{"uri": EX + "p", "name": "Person"}, {"uri": EX + "q"}]),
+    (list[models.FloodWatchArea], [{
+        "uri": EX + "watch",
+        "name": "Watch",
+        "polygon_uri": EX + "polygon",
+        "flood_areas": [{"uri": EX + "area", "name": "Area", "polygon_uri": EX + "polygon"}],
+    }]),
+    (list[models.Building], [BUILDING]),
+    (list[models.Building | models.PointCluster], [BUILDING, CLUSTER]),
+    (list[models.FullBuilding], [FULL_BUILDING]),
+    (models.FullBuilding, FULL_BUILDING),
+    (models.OntologyAncestors, {"uri": EX + "House", "ancestors": [EX + "Building"]}),
+]
+
+
+def validated(annotation, content):
+    """
+    The content validated against the annotation and dumped back to plain data, as FastAPI does for a response model
+    """
+    adapter = TypeAdapter(annotation)
+    return adapter.dump_python(adapter.validate_python(content))
+
+
+def validated_json(annotation, content):
+    adapter = TypeAdapter(annotation)
+    return json.loads(adapter.dump_json(adapter.validate_python(content)))
+
+
+def response_models() -> set:
+    """
+    The response models of the app's endpoints that are built from this package's models
+    """
+    annotations = set()
+    for route in paralog_app.app.routes:
+        annotation = getattr(route, "response_model", None)
+        for member in typing.get_args(annotation) or (annotation,):
+            if isinstance(member, type) and issubclass(member, BaseModel) and member.__module__ == models.__name__:
+                annotations.add(annotation)
+    return annotations
+
+
+class TestConverter(unittest.TestCase):
+
+    def test_matches_pydantic_validation(self):
+        for annotation, content in CASES:
+            with self.subTest(annotation=annotation):
+                self.assertEqual(serialise.converter(annotation)(content), validated(annotation, content))
+                body = serialise.serialise(content, annotation)
+                self.assertEqual(json.loads(body), validated_json(annotation, content))
+
+    def test_covers_every_response_model(self):
+        self.assertLessEqual(response_models(), {annotation for annotation, _ in CASES})
+
+    def test_unions_pick_the_model_pydantic_would(self):
+        for annotation in [models.Building | models.PointCluster, models.AssetSummary | models.PointCluster]:
+            for row in [BUILDING, ASSET_SUMMARY, CLUSTER]:
+                with self.subTest(annotation=annotation, row=row):
+                    try:
+                        expected = validated(annotation, row)
+                    except ValidationError:
+                        continue
+                    self.assertEqual(serialise.converter(annotation)(row), expected)
+        self.assertEqual(serialise.converter(models.Building | models.PointCluster)(None), None)
+
+    def test_numeric_strings_are_coerced(self):
+        for value, expected in [("51.5", 51.5), ("-0.1", -0.1), (" 51.5", 51.5), ("1e3", 1000.0), (2, 2.0)]:
+            with self.subTest(value=value):
+                self.assertEqual(serialise.converter(float)(value), expected)
+                self.assertEqual(serialise.converter(float)(value), TypeAdapter(float).validate_python(value))
+        for value in ["2", "2.0", 2.0, " 2"]:
+            with self.subTest(value=value):
+                self.assertEqual(serialise.converter(int)(value), TypeAdapter(int).validate_python(value))
+
+    def test_invalid_values_are_rejected(self):
+        for annotation, value in [
+            (int, "2.5"),
+            (int, "two"),
+            (float, "north"),
+            (models.PointCluster, {"lat": "51.5", "lon": "-0.1"}),
+            (models.Building, {**BUILDING, "uprn": None}),
+        ]:
+            with self.subTest(annotation=annotation, value=value):
+                with self.assertRaises(ValueError):
+                    serialise.converter(annotation)(value)
+                with self.assertRaises(ValidationError):
+                    TypeAdapter(annotation).validate_python(value)
+
+    def test_non_finite_numbers_are_written_as_null(self):
+        row = {**ASSET_SUMMARY, "lat": "nan", "lon": "inf"}
+        self.assertEqual(
+            json.loads(serialise.serialise(row, models.AssetSummary)), validated_json(models.AssetSummary, row)
+        )
+        self.assertEqual(serialise.converter(models.AssetSummary)(row)["lat"], None)
@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+
+from paralog.spatial import PointIndex, parse_bbox
+
+
+def index(points: list[tuple[float, float]], cell_size: float = 0.01) -> PointIndex:
+    rows = [{"lon": lon, "lat": lat, "id": i} for i, (lon, lat) in enumerate(points)]
+    return PointIndex.from_rows(rows, "lat", "lon", cell_size=cell_size)
+
+
+def found(point_index: PointIndex, *bbox: float) -> list[int]:
+    return sorted(row["id"] for row in point_index.select(point_index.query(*bbox)))
+
+
+def brute_force(points: list[tuple[float, float]], min_lon, min_lat, max_lon, max_lat) -> list[int]:
+    return [i for i, (lon, lat) in enumerate(points) if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat]
+
+
+class TestParseBbox(unittest.TestCase):
+
+    def test_parses_bbox(self):
+        self.assertEqual(parse_bbox("-1.5,50,0.25,51.5"), (-1.5, 50.0, 0.25, 51.5))
+
+    def test_clamps_to_world(self):
+        self.assertEqual(parse_bbox("-1e300,-100,200,1e300"), (-180, -90, 180, 90))
+
+    def test_accepts_degenerate_bbox(self):
+        self.assertEqual(parse_bbox("1,2,1,2"), (1.0, 2.0, 1.0, 2.0))
+
+    def test_rejects_invalid_bbox(self):
+        for bbox in ["1,2,3", "1,2,3,4,5", "a,2,3,4", "nan,2,3,4", "1,2,inf,4", "3,2,1,4", "1,4,3,2", ""]:
+            with self.subTest(bbox=bbox), self.assertRaises(ValueError):
+                parse_bbox(bbox)
+
+    def test_rejects_bbox_crossing_antimeridian(self):
+        with self.assertRaises(ValueError):
+            parse_bbox("179,0,-179,1")
+
+
+class TestPointIndex(unittest.TestCase):
+
+    def test_finds_points_in_bbox(self):
+        rng = np.random.default_rng(1)
+        points = [(float(lon), float(lat)) for lon, lat in rng.uniform([-2, 50], [2, 54], size=(2000, 2))]
+        point_index = index(points)
+        for bbox in [(-1, 51, 0.5, 52.3), (-2, 50, 2, 54), (1.234, 52.001, 1.236, 52.5), (-180, -90, 180, 90)]:
+            with self.subTest(bbox=bbox):
+                self.assertEqual(found(point_index, *bbox), brute_force(points, *bbox))
+
+    def test_includes_points_on_bbox_edges(self):
+        point_index = index([(1, 1), (2, 2), (1, 2), (2, 1), (1.5, 1.5)])
+        self.assertEqual(found(point_index, 1, 1, 2, 2), [0, 1, 2, 3, 4])
+
+    def test_points_on_cell_boundaries(self):
+        points = [(0.0, 0.0), (0.01, 0.0), (0.02, 0.01), (-0.01, -0.01), (0.03, 0.03)]
+        point_index = index(points)
+        for bbox in [(0, 0, 0.01, 0.01), (0.01, 0, 0.02, 0.01), (-0.01, -0.01, 0, 0), (0.005, 0, 0.015, 0.005)]:
+            with self.subTest(bbox=bbox):
+                self.assertEqual(found(point_index, *bbox), brute_force(points, *bbox))
+
+    def test_degenerate_bbox(self):
+        point_index = index([(1, 1), (1, 2), (1.5, 1.5)])
+        self.assertEqual(found(point_index, 1, 1, 1, 1), [0])
+        self.assertEqual(found(point_index, 1, 0, 1, 3), [0, 1])
+        self.assertEqual(found(point_index, 1.2, 1.2, 1.2, 1.2), [])
+
+    def test_points_at_antimeridian_and_poles(self):
+        points = [(-180, 0), (180, 0), (179.999, 89.999), (-180, -90), (180, 90)]
+        point_index = index(points)
+        self.assertEqual(found(point_index, -180, -90, 180, 90), [0, 1, 2, 3, 4])
+        self.assertEqual(found(point_index, 179.99, -1, 180, 90), [1, 2, 4])
+        self.assertEqual(found(point_index, -180, -90, -179.99, 0), [0, 3])
+
+    def test_bbox_outside_points(self):
+        point_index = index([(1, 1), (2, 2)])
+        self.assertEqual(found(point_index, -180, -90, -179, -89), [])
+        self.assertEqual(found(point_index, 3, 3, 180, 90), [])
+
+    def test_empty_index(self):
+        self.assertEqual(found(index([]), -180, -90, 180, 90), [])
+
+    def test_skips_points_without_coordinates(self):
+        rows = [{"lat": "1", "lon": "1"}, {"lat": None, "lon": "1"}, {"lat": "x", "lon": "1"}, {"lon": "2"}]
+        point_index = PointIndex.from_rows(rows, "lat", "lon")
+        self.assertEqual(len(point_index), 1)
+        self.assertEqual(point_index.select(point_index.query(-180, -90, 180, 90)), [rows[0]])
+
+    def test_within_polygons(self):
+        point_index = index([(0.5, 0.5), (1.5, 0.5), (5, 5)], cell_size=1)
+        square = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]], dtype=np.float64)
+        for polygons, expected in [
+            ([[square]], [0]),
+            ([[square], [square + [1, 0]]], [0, 1]),
+            ([[square], [square]], [0]),
+            ([[], [square + 10]], []),
+        ]:
+            with self.subTest(polygons=len(polygons)):
+                within = point_index.select(point_index.within(polygons))
+                self.assertEqual(sorted(row["id"] for row in within), expected)
+
+    def test_clusters_points(self):
+        point_index = index([(0, 0), (0.001, 0.001), (10, 10)])
+        clusters = point_index.cluster(point_index.query(-180, -90, 180, 90), zoom=4)
+        self.assertEqual(sorted(cluster["count"] for cluster in clusters), [1, 2])
+        self.assertEqual(sum(cluster["count"] for cluster in clusters), 3)
+        self.assertEqual(point_index.cluster(np.empty(0, dtype=np.int64), zoom=4), [])
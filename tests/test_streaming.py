@@ -0,0 +1,110 @@
+import json
+import unittest
+
+from paralog.streaming import BindingsParser, SparqlBindings, iterate
+
+BINDINGS = [
+    {"uri": {"type": "uri", "value": "http://example.com/a"}},
+    {"uri": {"type": "uri", "value": "http://example.com/b"}, "label": {"type": "literal", "value": "say \"hi\""}},
+    {"label": {"type": "literal", "value": "back\\slash é \n new line"}},
+]
+
+DOCUMENT = json.dumps(
+    {"head": {"vars": ["uri", "label"]}, "results": {"bindings": BINDINGS}},
+    indent=1,
+    ensure_ascii=False,
+)
+
+
+def parse(chunks: list[str]) -> tuple[BindingsParser, list[dict]]:
+    parser = BindingsParser()
+    bindings = []
+    for chunk in chunks:
+        bindings.extend(parser.feed(chunk))
+    parser.close()
+    return parser, bindings
+
+
+class TestBindingsParser(unittest.TestCase):
+
+    def test_parses_whole_document(self):
+        parser, bindings = parse([DOCUMENT])
+        self.assertEqual(parser.vars, ["uri", "label"])
+        self.assertEqual(bindings, BINDINGS)
+        self.assertTrue(parser.done)
+
+    def test_parses_document_split_at_every_offset(self):
+        for offset in range(len(DOCUMENT) + 1):
+            with self.subTest(offset=offset):
+                parser, bindings = parse([DOCUMENT[:offset], DOCUMENT[offset:]])
+                self.assertEqual(parser.vars, ["uri", "label"])
+                self.assertEqual(bindings, BINDINGS)
+
+    def test_parses_document_one_character_at_a_time(self):
+        parser, bindings = parse(list(DOCUMENT))
+        self.assertEqual(parser.vars, ["uri", "label"])
+        self.assertEqual(bindings, BINDINGS)
+
+    def test_returns_bindings_as_soon_as_they_are_complete(self):
+        first = DOCUMENT.index("http://example.com/b")
+        parser = BindingsParser()
+        self.assertEqual(parser.feed(DOCUMENT[:first]), [BINDINGS[0]])
+        self.assertFalse(parser.done)
+
+    def test_parses_empty_results(self):
+        for document in [
+            '{"head": {"vars": ["uri"]}, "results": {"bindings": []}}',
+            '{"head": {"vars": []}, "results": {"bindings": [ \n ]}}',
+        ]:
+            with self.subTest(document=document):
+                parser, bindings = parse([document])
+                self.assertEqual(bindings, [])
+                self.assertTrue(parser.done)
+
+    def test_parses_head_without_vars(self):
+        parser, bindings = parse(['{"head": {}, "results": {"bindings": [{}]}}'])
+        self.assertIsNone(parser.vars)
+        self.assertEqual(bindings, [{}])
+
+    def test_rejects_documents_without_bindings(self):
+        for document in [
+            '{"head": {"vars": ["uri"]}}',
+            '{"head": {}, "boolean": true}',
+            "",
+        ]:
+            with self.subTest(document=document), self.assertRaises(ValueError):
+                parse([document])
+
+    def test_rejects_error_bodies(self):
+        for document in [
+            "Error 400: Parse error: Encountered \" \"}\" \"} \"\" at line 1",
+            "<html><body>502 Bad Gateway</body></html>",
+        ]:
+            with self.subTest(document=document):
+                parser = BindingsParser()
+                self.assertEqual(parser.feed(document), [])
+                with self.assertRaises(ValueError):
+                    parser.close()
+
+    def test_rejects_truncated_documents(self):
+        for end in [DOCUMENT.index("say"), DOCUMENT.rindex("]")]:
+            with self.subTest(end=end):
+                with self.assertRaises(ValueError):
+                    parse([DOCUMENT[:end]])
+
+
+class TestSparqlBindings(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iterates_bindings_from_chunks(self):
+        chunks = [DOCUMENT[i:i + 7] for i in range(0, len(DOCUMENT), 7)]
+        bindings = SparqlBindings(iterate(chunks))
+        self.assertEqual([binding async for binding in bindings], BINDINGS)
+        self.assertEqual(bindings.vars, ["uri", "label"])
+
+    async def test_raises_when_chunks_end_early(self):
+        bindings = SparqlBindings(iterate([DOCUMENT[:DOCUMENT.index("say")]]))
+        received = []
+        with self.assertRaises(ValueError):
+            async for binding in bindings:
+                received.append(binding)
+        self.assertEqual(received, BINDINGS[:1])
@@ -0,0 +1,169 @@
+import asyncio
+import re
+import unittest
+
+from rdflib import Graph
+from rdflib.plugins.sparql.parser import parseQuery
+
+from paralog import queries
+from paralog.templates import InvalidParameter, QueryTemplate, RenderedQuery, iri, literal
+
+# A valid value for each kind of placeholder
+VALUES = {
+    "iri": "http://example.com/asset/1",
+    "literal": "value",
+    "var": "x",
+    "int": 10,
+    "fragment": queries.EMPTY,
+    "iri_list": ["http://example.com/type/1", "http://example.com/type/2"],
+    "iri_values": ["http://example.com/asset/1", "http://example.com/asset/2"],
+    "literal_values": ["1", "2"],
+}
+
+TEMPLATES = [value for value in vars(queries).values() if isinstance(value, QueryTemplate)]
+
+
+def parse(query: str):
+    """
+    Parses a query as SPARQL 1.1, reading Jena's ARQ extension of NOT EXISTS as a graph pattern as the equivalent
+    FILTER NOT EXISTS, which rdflib does not support
+    """
+    return parseQuery(re.sub(r"(?<!FILTER )NOT EXISTS", "FILTER NOT EXISTS", query))
+
+
+def evaluate(term: str) -> str:
+    """
+    Binds a rendered term in a query and returns the value Jena (here rdflib) would see
+    """
+    rows = list(Graph().query(f"SELECT ?x WHERE {{ BIND ({term} AS ?x) }}"))
+    return str(rows[0][0])
+
+
+class TestIri(unittest.TestCase):
+
+    def test_quotes_iri(self):
+        self.assertEqual(iri("http://example.com/a#b"), "<http://example.com/a#b>")
+
+    def test_rejects_iris_that_could_escape_the_brackets(self):
+        for value in [
+            "http://example.com/a> } ; DROP ALL ; {",
+            "http://example.com/a b",
+            'http://example.com/"a"',
+            "http://example.com/a\nb",
+            "http://example.com/{a}",
+            "http://example.com/a\\b",
+            "<http://example.com/a>",
+        ]:
+            with self.subTest(value=value), self.assertRaises(InvalidParameter):
+                iri(value)
+
+    def test_rejects_non_strings(self):
+        with self.assertRaises(InvalidParameter):
+            iri(None)
+
+    def test_invalid_parameter_is_a_value_error(self):
+        self.assertTrue(issubclass(InvalidParameter, ValueError))
+
+
+class TestLiteral(unittest.TestCase):
+
+    def test_escapes_quotes_backslashes_and_newlines(self):
+        for value in ['say "hi"', "back\\slash", "two\nlines", "carriage\rreturn", '\\"', '" } ; DROP ALL ; #']:
+            with self.subTest(value=value):
+                rendered = literal(value)
+                self.assertTrue(rendered.startswith('"') and rendered.endswith('"'))
+                self.assertNotIn("\n", rendered)
+                self.assertEqual(evaluate(rendered), value)
+
+    def test_renders_non_strings_as_strings(self):
+        self.assertEqual(literal(5), '"5"')
+
+
+class TestQueryTemplate(unittest.TestCase):
+
+    def test_renders_parameters_by_kind(self):
+        template = QueryTemplate("test", "SELECT * WHERE { {{s:iri}} ?p {{o:literal}} } LIMIT {{n:int}}")
+        query = template.render(s="http://example.com/s", o='a "b"', n=5)
+        self.assertEqual(query, 'SELECT * WHERE { <http://example.com/s> ?p "a \\"b\\"" } LIMIT 5')
+        self.assertEqual(query.template, "test")
+        self.assertEqual(query.params, {"s": "http://example.com/s", "o": 'a "b"', "n": 5})
+
+    def test_rejects_unknown_kinds(self):
+        with self.assertRaises(ValueError):
+            QueryTemplate("test", "{{x:sql}}")
+
+    def test_rejects_missing_and_extra_parameters(self):
+        template = QueryTemplate("test", "{{s:iri}}")
+        with self.assertRaises(TypeError):
+            template.render()
+        with self.assertRaises(TypeError):
+            template.render(s="http://example.com/s", t="http://example.com/t")
+
+    def test_rejects_invalid_integers_and_variables(self):
+        template = QueryTemplate("test", "SELECT ?{{v:var}} WHERE {} LIMIT {{n:int}}")
+        for params in [{"v": "x", "n": "5"}, {"v": "x", "n": True}, {"v": "x } .", "n": 5}]:
+            with self.subTest(params=params), self.assertRaises(InvalidParameter):
+                template.render(**params)
+
+    def test_fragments_must_be_rendered_from_templates(self):
+        template = QueryTemplate("test", "SELECT * WHERE { {{clause:fragment}} }")
+        with self.assertRaises(InvalidParameter):
+            template.render(clause="?s ?p ?o")
+        self.assertIsInstance(template.render(clause=queries.EMPTY), RenderedQuery)
+
+    def test_repeated_renders_are_cached(self):
+        template = QueryTemplate("test", "VALUES ?x { {{uris:iri_values}} }")
+        first = template.render(uris=["http://example.com/a", "http://example.com/b"])
+        self.assertIs(template.render(uris=("http://example.com/a", "http://example.com/b")), first)
+        self.assertIsNot(template.render(uris=["http://example.com/b"]), first)
+
+
+class TestQueries(unittest.TestCase):
+
+    def test_every_template_renders_valid_sparql(self):
+        self.assertGreater(len(TEMPLATES), 0)
+        for template in TEMPLATES:
+            with self.subTest(template=template.name):
+                query = template.render(**{param: VALUES[kind] for param, kind in template.placeholders})
+                self.assertIsInstance(query, RenderedQuery)
+                self.assertNotIn("{{", query)
+                if "SELECT" in query:
+                    parse(query)
+
+    def test_query_functions_render_valid_sparql(self):
+        uri, uris, types = VALUES["iri"], VALUES["iri_values"], VALUES["iri_list"]
+        calls = [
+            queries.get_all_assessments(),
+            queries.get_assets_by_assessment(uri, types=types, limit=10, after=uri),
+            queries.get_asset_types_by_assessment(uri),
+            queries.get_dependencies_by_assessment(uri),
+            queries.get_dependencies_by_assessment(uri, types=types, limit=10, after=uri),
+            queries.get_asset(uri),
+            queries.get_assets(uris),
+            queries.get_dependencies(uri, "providers"),
+            queries.get_dependencies(uri, "dependents"),
+            queries.get_all_dependencies(),
+            queries.get_asset_parts(uri),
+            queries.get_residents(uri),
+            queries.get_participations(uri),
+            queries.get_participants(uri),
+            queries.get_residence(uri),
+            queries.get_flood_areas(),
+            queries.get_flood_area_polygons(uris),
+            queries.get_states(uri),
+            queries.get_states_for_parents(uris),
+            queries.get_buildings(),
+            queries.get_buildings(limit=10, after=uri),
+            queries.get_building("100"),
+            queries.get_buildings_details(["100", "200"]),
+        ]
+        for call in calls:
+            query = asyncio.run(call)
+            with self.subTest(template=query.template):
+                parse(query)
+
+    def test_query_functions_reject_invalid_uris(self):
+        with self.assertRaises(InvalidParameter):
+            asyncio.run(queries.get_asset("http://example.com/a> . ?s ?p ?o"))
+        with self.assertRaises(InvalidParameter):
+            asyncio.run(queries.get_assets(["http://example.com/a", "not an iri"]))
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from rdflib import Graph
+
+from paralog import queries, utils
+
+
+def original_flatten_out(data, return_first_obj=False):
+    """
+    flatten_out as it was before row mappers were compiled, which they must keep matching
+    """
+    results = []
+    if data["results"]["bindings"] is not None:
+        for stmt in data["results"]["bindings"]:
+            obj = {}
+            for v in data["head"]["vars"]:
+                if v in stmt and stmt[v] is not None:
+                    obj[v] = stmt[v]["value"]
+            results.append(obj)
+    if return_first_obj:
+        return results[0]
+    else:
+        return results
+
+
+def uri(value: str) -> dict:
+    return {"type": "uri", "value": value}
+
+
+def literal(value: str) -> dict:
+    return {"type": "literal", "value": value}
+
+
+RESULT = {
+    "head": {"vars": ["uri", "name", "lat", "count"]},
+    "results": {
+        "bindings": [
+            {"uri": uri("http://example.com/a"), "name": literal("A"), "lat": literal("51.5"), "count": literal("3")},
+            # OPTIONAL variables that did not match are left out of the binding
+            {"uri": uri("http://example.com/b"), "count": literal("0")},
+            {"uri": uri("http://example.com/c"), "name": None},
+            # Variables that are not in the head are ignored
+            {"uri": uri("http://example.com/d"), "other": literal("x")},
+            {},
+            {"name": literal("it's \"quoted\"")},
+        ]
+    },
+}
+
+
+class TestFlattenOut(unittest.TestCase):
+
+    def test_matches_original_flatten_out(self):
+        self.assertEqual(asyncio.run(utils.flatten_out(RESULT)), original_flatten_out(RESULT))
+
+    def test_keeps_key_order_of_head(self):
+        rows = asyncio.run(utils.flatten_out(RESULT))
+        self.assertEqual(list(rows[0]), ["uri", "name", "lat", "count"])
+
+    def test_first_object(self):
+        self.assertEqual(asyncio.run(utils.flatten_out(RESULT, True)), original_flatten_out(RESULT, True))
+
+    def test_empty_results(self):
+        for bindings in [[], None]:
+            result = {"head": {"vars": ["uri"]}, "results": {"bindings": bindings}}
+            with self.subTest(bindings=bindings):
+                self.assertEqual(asyncio.run(utils.flatten_out(result)), original_flatten_out(result))
+
+    def test_large_results_are_mapped_in_a_thread(self):
+        to_thread = mock.Mock(wraps=asyncio.to_thread)
+        with mock.patch.object(utils, "THREAD_ROWS", 2), mock.patch("asyncio.to_thread", to_thread):
+            self.assertEqual(asyncio.run(utils.flatten_out(RESULT)), original_flatten_out(RESULT))
+        to_thread.assert_called_once()
+
+    def test_flatten_binding(self):
+        for binding in RESULT["results"]["bindings"]:
+            with self.subTest(binding=binding):
+                expected = {v: term["value"] for v, term in binding.items() if term is not None}
+                self.assertEqual(utils.flatten_binding(binding), expected)
+
+
+class TestRowMappers(unittest.TestCase):
+
+    def test_field_mapper_renames_and_converts(self):
+        mapper = utils.field_mapper(("id", "uri"), ("latitude", "lat", float), ("types", "name", str.split))
+        binding = {"uri": uri("http://example.com/a"), "lat": literal("51.5"), "name": literal("a b")}
+        self.assertEqual(mapper(binding), {"id": "http://example.com/a", "latitude": 51.5, "types": ["a", "b"]})
+
+    def test_field_mapper_requires_every_field(self):
+        mapper = utils.field_mapper(("id", "uri"), ("name", "name"))
+        with self.assertRaises(KeyError):
+            mapper({"uri": uri("http://example.com/a")})
+
+    def test_mixed_required_and_optional_fields(self):
+        mapper = utils.compile_row_mapper((
+            ("id", "uri", None, True),
+            ("count", "count", int, False),
+            ("name", "name", None, False),
+        ))
+        self.assertEqual(mapper({"uri": uri("a"), "count": literal("3")}), {"id": "a", "count": 3})
+        self.assertEqual(mapper({"uri": uri("a"), "name": None}), {"id": "a"})
+        with self.assertRaises(KeyError):
+            mapper({"count": literal("3")})
+
+    def test_variable_names_are_not_code(self):
+        names = ["it's", 'a"b', "x\ny", "}; import os; {"]
+        mapper = utils.flat_mapper(names)
+        binding = {name: literal(name) for name in names}
+        self.assertEqual(mapper(binding), {name: name for name in names})
+
+    def test_mappers_are_cached(self):
+        self.assertIs(utils.flat_mapper(["a", "b"]), utils.flat_mapper(("a", "b")))
+        self.assertIsNot(utils.flat_mapper(["a", "b"]), utils.flat_mapper(["b", "a"]))
+
+    def test_no_fields(self):
+        self.assertEqual(utils.flat_mapper([])({"a": literal("1")}), {})
+
+
+STATES_DATA = """
+@prefix ies: <http://ies.data.gov.uk/ontology/ies4#> .
+@prefix ex: <http://example.com/> .
+
+ex:s1 ies:isStateOf ex:p1, ex:p2 ;
+    a ies:State ;
+    ies:inPeriod [ ies:iso8601PeriodRepresentation "2020" ] ;
+    ies:isRepresentedAs [ a ies:Description ; ies:representationValue "flooded" ] ,
+        [ a ies:Measure ; ies:representationValue "0.5" ] .
+[] ies:isStartOf ex:s1 ; ies:inPeriod [ ies:iso8601PeriodRepresentation "2019" ] .
+[] ies:isEndOf ex:s1 ; ies:inPeriod [ ies:iso8601PeriodRepresentation "2021" ] .
+
+ex:s2 ies:isStateOf ex:p1 ;
+    a ies:BoundingState .
+
+ex:s3 ies:isStateOf ex:p2 ;
+    a ies:State, ies:BoundingState ;
+    ies:isRepresentedAs [ a ies:Description ; ies:representationValue "two types" ] .
+
+ex:untyped ies:isStateOf ex:p1 ;
+    ies:inPeriod [ ies:iso8601PeriodRepresentation "2022" ] .
+"""
+
+# The single parent query the states were read with before it was batched
+ORIGINAL_STATES = queries.PREFIXES + """
+        SELECT ?stateUri ?stateType ?starts ?ends ?inPeriod ?repType ?repValue
+        WHERE {
+            ?stateUri ies:isStateOf <%s>  .
+            ?stateUri a ?stateType .
+            OPTIONAL {
+                ?stateUri ies:inPeriod ?pp .
+                ?pp ies:iso8601PeriodRepresentation ?inPeriod .
+            }
+            OPTIONAL {
+                ?startState ies:isStartOf ?stateUri .
+                ?startState ies:inPeriod ?startPP .
+                ?startPP ies:iso8601PeriodRepresentation ?starts .
+            }
+            OPTIONAL {
+                ?endState ies:isEndOf ?stateUri .
+                ?endState ies:inPeriod ?endPP .
+                ?endPP ies:iso8601PeriodRepresentation ?ends .
+            }
+            OPTIONAL {
+                ?stateUri ies:isRepresentedAs ?repObject .
+                ?repObject rdf:type ?repType .
+                ?repObject ies:representationValue ?repValue
+            }
+        }
+        """
+
+
+def original_states(results: dict) -> dict:
+    """
+    The /states handler as it was before states were mapped in utils
+    """
+    states: dict = {}
+    for st in results["results"]["bindings"]:
+        if st["stateUri"]["value"] in states.keys():
+            state = states[st["stateUri"]["value"]]
+        else:
+            state = {
+                "end": "",
+                "period": "",
+                "start": "",
+                "type": st["stateType"]["value"],
+                "uri": st["stateUri"]["value"],
+                "relations": [],
+                "representations": [],
+            }
+            states[st["stateUri"]["value"]] = state
+        if "inPeriod" in st.keys():
+            state["period"] = st["inPeriod"]["value"]
+        if "ends" in st.keys():
+            state["end"] = st["ends"]["value"]
+        if "starts" in st.keys():
+            state["start"] = st["starts"]["value"]
+        if "repType" in st.keys() and "repValue" in st.keys():
+            rep = {st["repType"]["value"]: st["repValue"]["value"]}
+            state["representations"].append(rep)
+    return states
+
+
+def sorted_representations(states: dict) -> dict:
+    return {
+        uri: {**state, "representations": sorted(state["representations"], key=json.dumps)}
+        for uri, state in states.items()
+    }
+
+
+class TestMapStates(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.graph = Graph().parse(data=STATES_DATA, format="turtle")
+
+    def run_query(self, query: str) -> dict:
+        return json.loads(self.graph.query(query).serialize(format="json"))
+
+    def states(self, *parents: str) -> dict:
+        return asyncio.run(utils.map_states(self.run_query(asyncio.run(queries.get_states_for_parents(list(parents))))))
+
+    def test_matches_original_states(self):
+        # The original query repeated representations for every type of a state, so only states with one type match
+        original = original_states(self.run_query(ORIGINAL_STATES % "http://example.com/p1"))
+        states = self.states("http://example.com/p1")["http://example.com/p1"]
+        self.assertEqual(sorted_representations(states), sorted_representations(original))
+
+    def test_maps_state_fields(self):
+        s1 = self.states("http://example.com/p1")["http://example.com/p1"]["http://example.com/s1"]
+        self.assertEqual(
+            sorted_representations({"s1": s1})["s1"],
+            {
+                "end": "2021",
+                "period": "2020",
+                "start": "2019",
+                "type": "http://ies.data.gov.uk/ontology/ies4#State",
+                "uri": "http://example.com/s1",
+                "relations": [],
+                "representations": [
+                    {"http://ies.data.gov.uk/ontology/ies4#Description": "flooded"},
+                    {"http://ies.data.gov.uk/ontology/ies4#Measure": "0.5"},
+                ],
+            },
+        )
+
+    def test_optional_fields_missing(self):
+        s2 = self.states("http://example.com/p1")["http://example.com/p1"]["http://example.com/s2"]
+        self.assertEqual((s2["start"], s2["end"], s2["period"], s2["representations"]), ("", "", "", []))
+
+    def test_states_without_type_are_left_out(self):
+        self.assertNotIn("http://example.com/untyped", self.states("http://example.com/p1")["http://example.com/p1"])
+
+    def test_groups_states_by_parent(self):
+        states = self.states("http://example.com/p1", "http://example.com/p2", "http://example.com/p3")
+        self.assertEqual(
+            {parent: sorted(parent_states) for parent, parent_states in states.items()},
+            {
+                "http://example.com/p1": ["http://example.com/s1", "http://example.com/s2"],
+                "http://example.com/p2": ["http://example.com/s1", "http://example.com/s3"],
+            },
+        )
+        s1 = states["http://example.com/p2"]["http://example.com/s1"]
+        self.assertEqual(s1, states["http://example.com/p1"]["http://example.com/s1"])
+        self.assertIsNot(s1, states["http://example.com/p1"]["http://example.com/s1"])
+
+    def test_representations_are_not_repeated_per_type(self):
+        s3 = self.states("http://example.com/p2")["http://example.com/p2"]["http://example.com/s3"]
+        self.assertIn(s3["type"], [
+            "http://ies.data.gov.uk/ontology/ies4#State",
+            "http://ies.data.gov.uk/ontology/ies4#BoundingState",
+        ])
+        self.assertEqual(s3["representations"], [{"http://ies.data.gov.uk/ontology/ies4#Description": "two types"}])
+
+    def test_unordered_rows(self):
+        result = self.run_query(asyncio.run(queries.get_states_for_parents(["http://example.com/p1"])))
+        reversed_result = {**result, "results": {"bindings": result["results"]["bindings"][::-1]}}
+        self.assertEqual(
+            sorted_representations(asyncio.run(utils.map_states(reversed_result))["http://example.com/p1"]),
+            sorted_representations(asyncio.run(utils.map_states(result))["http://example.com/p1"]),
+        )